@@ -1,8 +1,11 @@
 ''' Nick G.'s Accelerator Example 
 
 '''
+import math
 import time
 
+from collections import deque
+
 from enum import Enum
 
 # Example of a Non-Pipelined Memory
@@ -10,12 +13,16 @@ from enum import Enum
 
 # Example of a Pipelined Memory.
 from accelerators.nio.nio_mem_piped import NioMemory
+# Example of a Banked, Multi-Ported Memory.
+from accelerators.nio.nio_mem_banked import NioBankedMemory
+# Example of a DRAM (with row buffers, and an FR-FCFS scheduler).
+from accelerators.nio.nio_mem_dram import NioDRAMMemory
 from accelerators.nio.nio_tile import NioTile
 
 from core.defines import Operator
 from core.system import System
 from core.message_router import MessageRouter
-from core.messaging import Message
+from core.messaging import Message, MessagePool
 from core.memory_map import MemoryMapper
 
 from core.utils import *
@@ -23,37 +30,162 @@ from core.utils import *
 class Nio(System):
     '''
 
+    Args:
+        num_tile_rows: The number of rows in the grid of tiles.
+        num_tile_cols: The number of columns in the grid of tiles.
+        memory_width: The number of words in the external memory.
+        memory_page_size: If given, the external memory is allocated in pages of this many words,
+                          as they are first written to (instead of entirely up front).
+        memory_allocator: The allocator which maps tensors into the external memory: "bitmap", "numpy",
+                          "first_fit" or "best_fit" (see core.allocator.build_allocator).
+        event_driven: If True, idle devices are not processed and the clock jumps over
+                      cycles in which no device has work (cycle counts are unchanged). It only saves
+                      host time when devices idle for long stretches (see the README).
+        vector_dot: If True, tiles dispatch each DOT to a PE as one vector command, which
+                    is charged the same number of cycles as the equivalent MAC sequence.
+        analytical: If True, layers are not simulated; the clock is moved forward by a closed-form
+                    estimate of their cycles, and their outputs are computed with NumPy.
+                    (Layers without an estimate are still simulated.)
+        recycle_messages: If True, the Messages between tiles, PEs and the memory are reused once
+                          consumed, instead of creating a new Message for every transaction.
+        credit_based: If True, the MessageRouters use credit-based flow control: senders wait for a
+                      free slot in the destination's queue instead of retrying their sends every cycle
+                      (cycle counts are unchanged; see `message_router_statistics` for the backpressure).
+        command_window: The most tile commands of a layer held (compiled, but not yet sent) at once; they
+                        are compiled as the tiles accept them. If None, each layer is compiled up front.
+        outputs_per_command: If given, the layers which support it (Conv, GeMM and MatMul) are compiled to tile
+                             commands carrying affine access descriptors, each covering up to this many outputs;
+                             the tiles expand the descriptors into memory reads themselves.
+        cache_entries: The number of words in each tile's cache.
+        cache_ways: The associativity (lines per set) of each tile's cache.
+        cache_line_size: The number of words in each line of a tile's cache (a miss fills the whole line).
+        cache_replacement: The replacement policy of each tile's cache: "lru", "plru" or "fifo" (see core.cache.Cache).
+        cache_write_policy: If None, each tile's cache is cleared after every layer (it is not told of writes).
+                            Otherwise, the caches snoop every write to the memory, so they persist across layers:
+                            with "invalidate" (write-through, no-allocate), the written words are invalidated in
+                            every cache; with "allocate" (write-through, write-allocate), the writing tile also
+                            installs its result, so the next layer can read it from the tile's cache.
+        compile_cache: If given, a CompileCache (see core.compile_cache) which the layers compiled to a
+                       TileCommandBuffer are kept in, and loaded from instead of being compiled again.
+        memory_pipeline_size: The number of stages in the memory's read and write pipelines (at least 2).
+        response_queue_size: The number of tile responses Nio may hold (and fetches per cycle).
+        data_queue_size: The number of Messages each tile's port may hold.
+        tile_queue_size: The number of tile commands each tile's port may hold.
+        num_pe_rows: The number of rows in each tile's grid of PEs.
+        num_pe_cols: The number of columns in each tile's grid of PEs. The products of each DOT are split
+                     across a tile's PEs, and their partial sums are added by a reduction tree (see NioTile).
+        memory_banks: The number of banks in the memory, each with its own pipelines.
+        memory_ports: The number of requests the memory takes per cycle. With a single bank and port,
+                      the memory is a NioMemory; otherwise, it is a NioBankedMemory.
+        memory_interleave_size: The number of consecutive words in each bank, before the next bank.
+        memory_interleaving: How blocks of words are mapped to the banks: "modulo" or "xor" (see NioBankedMemory).
+        memory_model: The timing of the memory: "pipelined" (a NioMemory, or NioBankedMemory; every request takes
+                      memory_pipeline_size cycles) or "dram" (a NioDRAMMemory, configured by the dram_ parameters;
+                      the memory_ parameters other than the width, page size and allocator are not used).
+        dram_channels: The number of channels of the DRAM.
+        dram_ranks: The number of ranks in each channel of the DRAM.
+        dram_banks: The number of banks in each rank of the DRAM.
+        dram_row_size: The number of words in each row of the DRAM.
+        dram_queue_size: The number of requests the DRAM's scheduler holds.
+        dram_t_rcd: The cycles to open a row of the DRAM.
+        dram_t_cas: The cycles from reading (or writing) an open row of the DRAM to its response.
+        dram_t_rp: The cycles to close an open row of the DRAM.
+        dram_t_burst: The cycles each response holds a DRAM channel's data bus.
+        miss_overlap: The fraction of a tile's cache misses which contend with the other tiles' misses for
+                      the memory, in the analytical estimates (see estimate_cycles). It depends on the model and
+                      the memory (the default suits the default memory); fit_miss_overlap fits it to
+                      simulated layers (e.g., nnflex.py --calibrate).
+        transaction_log: The file the memory's reads and writes are written to (as a DRAMSim2 trace) after
+                         every layer, or None to not log them. (A DRAM memory does not log them.)
+
+    Notes:
+        The arguments after the grid's are keyword-only; nnflex.build_accelerator takes them from a configuration file.
+        Every tile of the grid, and every PE of a tile, is an independent device (with its own cache,
+        queues and pipeline), which is processed once per cycle.
     '''
 
-    def __init__(self, num_tile_rows, num_tile_cols, memory_width = int(1e8)):
+    MEMORY_MODELS = ("pipelined", "dram")
+
+    def __init__(self, num_tile_rows, num_tile_cols, *,
+                 # How the layers are simulated.
+                 event_driven = False, vector_dot = False, analytical = False, recycle_messages = False, credit_based = False,
+                 command_window = 1024, outputs_per_command = None, compile_cache = None, miss_overlap = 0.85,
+                 transaction_log = "misc_transactions.trc",
+                 # The tiles, their PEs and queues.
+                 num_pe_rows = 1, num_pe_cols = 1, response_queue_size = 2, data_queue_size = 2, tile_queue_size = 1,
+                 # The tiles' caches.
+                 cache_entries = 10000, cache_ways = 1, cache_line_size = 1, cache_replacement = "lru", cache_write_policy = None,
+                 # The external memory.
+                 memory_width = int(1e8), memory_page_size = None, memory_allocator = "first_fit", memory_model = "pipelined",
+                 memory_pipeline_size = 2, memory_banks = 1, memory_ports = 1, memory_interleave_size = 1, memory_interleaving = "modulo",
+                 # The DRAM (with memory_model = "dram").
+                 dram_channels = 1, dram_ranks = 1, dram_banks = 8, dram_row_size = 1024, dram_queue_size = 32,
+                 dram_t_rcd = 11, dram_t_cas = 11, dram_t_rp = 11, dram_t_burst = 1):
         System.__init__(self)
 
+        self._event_driven = event_driven
+        self._analytical = analytical
+
 
         # Tile-ONLY MessageRouter:
-        self._tile_message_router = MessageRouter(self._system_clock_ref)
-        self._tile_message_router_queue_size = 2
+        self._tile_message_router = MessageRouter(self._system_clock_ref, credit_based=credit_based)
+        self._tile_message_router_queue_size = response_queue_size
         self._tile_message_router.add_connection(self, self._tile_message_router_queue_size)
 
         # MessageRouter for all devices.
-        self._device_message_router = MessageRouter(self._system_clock_ref)
+        self._device_message_router = MessageRouter(self._system_clock_ref, MessagePool(recycle_messages), credit_based)
         self._device_message_router.add_connection(self)
 
         # Define the External Memory.
-        self._memory = NioMemory(self._system_clock_ref, self._device_message_router, width=memory_width)
-        self._memory_mapper = MemoryMapper(self._memory, memory_width, 4)
-
+        if memory_model not in self.MEMORY_MODELS:
+            raise ValueError("Please choose a supported memory model: "+str(self.MEMORY_MODELS))
+
+        if memory_model == "dram":
+            self._memory = NioDRAMMemory(self._system_clock_ref, self._device_message_router, width=memory_width, page_size=memory_page_size,
+                                         num_channels=dram_channels, num_ranks=dram_ranks, num_banks=dram_banks, row_size=dram_row_size, queue_size=dram_queue_size,
+                                         t_rcd=dram_t_rcd, t_cas=dram_t_cas, t_rp=dram_t_rp, t_burst=dram_t_burst)
+        elif memory_banks == 1 and memory_ports == 1:
+            self._memory = NioMemory(self._system_clock_ref, self._device_message_router, width=memory_width, pipeline_size=memory_pipeline_size, page_size=memory_page_size,
+                                     log_transactions=transaction_log is not None)
+        else:
+            self._memory = NioBankedMemory(self._system_clock_ref, self._device_message_router, width=memory_width, pipeline_size=memory_pipeline_size, page_size=memory_page_size,
+                                           num_banks=memory_banks, num_ports=memory_ports, interleave_size=memory_interleave_size, interleaving=memory_interleaving,
+                                           log_transactions=transaction_log is not None)
+        self._memory_mapper = MemoryMapper(self._memory, memory_width, 4, memory_allocator)
+        self._transaction_log = transaction_log
+
+
+        # The number of Messages each tile's port may hold.
+        self._data_queue_size = data_queue_size
 
         # Define the Number of Tiles we want.
         self._num_tile_rows = num_tile_rows
         self._num_tile_cols = num_tile_cols
-        # Create the tiles.
-        # NOTE: This architecture has PEs connecting 1 another.
-        self._tiles = [[NioTile(self._system_clock_ref, self._device_message_router, 2, self._tile_message_router, self._memory, 1, 1)]*self._num_tile_cols for i in range(self._num_tile_rows)]
+        # Create the tiles (each an independent device, with its own cache and PEs).
+        self._tiles = [[NioTile(self._system_clock_ref, self._device_message_router, self._data_queue_size, self._tile_message_router, self._memory,
+                                num_pe_rows, num_pe_cols, vector_dot, cache_entries, cache_ways, cache_line_size, cache_replacement, cache_write_policy, tile_queue_size)
+                        for j in range(self._num_tile_cols)] for i in range(self._num_tile_rows)]
 
         self._tiles_flat = flatten(self._tiles)
+
+        # Every device, for event-driven scheduling.
+        self._devices = [self._memory] + self._tiles_flat
+        # Whether a device had work in the last cycle (then it most likely has work in the next, so no skip is tried).
+        self._devices_busy = False
         # Define Tile Packet Variables:
-        # 1. Hold a list (queue) of tile commands to send
-        self._tile_commands = list()
+        # 1. Hold a queue of tile commands to send (at most command_window, if streaming)
+        if command_window is not None and command_window < 1:
+            raise ValueError("The command window must hold at least 1 tile command.")
+        self._command_window = command_window
+        if outputs_per_command is not None and outputs_per_command < 1:
+            raise ValueError("A tile command must cover at least 1 output.")
+        self._outputs_per_command = outputs_per_command
+        if miss_overlap < 0:
+            raise ValueError("The miss overlap must not be negative.")
+        self._miss_overlap = miss_overlap
+        self._compile_cache = compile_cache
+        self._cache_write_policy = cache_write_policy
+        self._tile_commands = deque()
         # 2. Hold onto a set representing required responses
         self._tile_required_resp = set()
         self._tile_resp_messages = list()
@@ -85,57 +217,335 @@ class Nio(System):
         if self._real_start is None:
             self._real_start = start_time
 
-        # Map the node's input and outputs to memory.
+        if self._analytical:
+            cycles = self.estimate_cycles(flexnode)
+            if cycles is not None:
+                flexnode.evaluate()
+                # (The host computed the outputs, so the memory no longer holds any tensor as it is.)
+                self._memory_mapper.release()
+                self.tick(cycles)
+                self._report_layer(flexnode, start_time, time.time())
+                return
+
+        # Map the node's input and outputs to memory (where the previous layer left its outputs, for those
+        # which are inputs of this node: the others are freed first, so they do not move the node's offsets).
+        self._memory_mapper.release(flexnode.get_inputs())
         flexnode.map(self._memory_mapper)
         print("Compiling Layer ["+flexnode.get_op_name()+"]")
 
-        self._tile_commands = flexnode.compile(self, self._tiles_flat)   
-
+        # Affine tile commands are compact, so they are compiled up front.
+        tile_commands = None
+        if self._outputs_per_command is not None:
+            tile_commands = flexnode.compile_affine(self, self._tiles_flat, self._outputs_per_command)
+
+        num_commands = flexnode.num_commands()
+        # Stream the tile commands if the layer's progress can be reported without compiling it.
+        streaming = tile_commands is None and self._command_window is not None and num_commands is not None
+        if tile_commands is not None:
+            self._tile_commands = deque(tile_commands)
+            num_commands = len(self._tile_commands)
+        elif streaming:
+            tile_command_stream = self._compile_stream(flexnode)
+            streaming = num_commands > 0
+        else:
+            self._tile_commands = deque(self._compile_stream(flexnode))
+            num_commands = len(self._tile_commands)
 
         # Set the layer progress.
-        self._tile_cmds_per_layer = len(self._tile_commands)
+        self._tile_cmds_per_layer = num_commands
         if self._tile_cmds_per_layer == 0:
             self._tile_cmds_per_layer = 1
             self._layer_progress = 1
             self.progress()
 
         self._layer_progress = 0
+        # The progress bar is only redrawn when a tile command completes (printing it every cycle costs more host time
+        # than the cycles of most idle devices).
+        drawn_progress = None
 
-        i = 0
-        sent_command_count = 0
-
-        while self._tile_commands or self._tile_required_resp:
+        while streaming or self._tile_commands or self._tile_required_resp:
             self._fetch_tile_resp_messages()
 
-            while i < len(self._tile_commands) and self._tile_message_router.send(self._tile_commands[i]):
-                self._tile_required_resp.add(self._tile_commands[i].message_id)
-                self._tile_commands[i] = None
-                i += 1
-                sent_command_count += 1
+            if streaming:
+                streaming = self._compile_ahead(tile_command_stream)
 
-            self.progress()
-            self.process()
+            while self._tile_commands and self._tile_message_router.can_send(self._tile_commands[0].destination) and self._tile_message_router.send(self._tile_commands[0]):
+                self._tile_required_resp.add(self._tile_commands.popleft().message_id)
+                # The window does not limit how many tile commands are sent in a cycle.
+                if streaming and not self._tile_commands:
+                    streaming = self._compile_ahead(tile_command_stream)
 
-            if sent_command_count == (len(self._tile_commands)):
-                self._tile_commands = list()
+            if self._layer_progress != drawn_progress:
+                self.progress()
+                drawn_progress = self._layer_progress
+            if self._event_driven and not self._devices_busy:
+                self._skip_idle_cycles()
+            self.process()
 
 
         flexnode.unmap(self._memory_mapper)
+        # Keep the outputs where they are for the next layer.
+        self._memory_mapper.release(flexnode.get_outputs())
         end_time = time.time()
 
-        # Clear the cache after every layer.
-        for i in range(self._num_tile_rows):
-            for j in range(self._num_tile_cols):
-                self._tiles[i][j].evict_cache_lines()        
+        # Clear the cache after every layer (unless the caches snoop the writes to the memory).
+        if self._cache_write_policy is None:
+            for i in range(self._num_tile_rows):
+                for j in range(self._num_tile_cols):
+                    self._tiles[i][j].evict_cache_lines()        
+
+        self._report_layer(flexnode, start_time, end_time)
+
+        # If the memory was listed as external, this will
+        if self._transaction_log is not None:
+            self._memory.write_transaction_log(self._transaction_log)
 
+    def _compile_stream(self, flexnode):
+        ''' _compile_stream:
+
+        Compiles the tile commands of the flexnode (lazily), through the compile cache if there is one.
+        '''
+        if self._compile_cache is not None:
+            buffer = self._compile_cache.compile_buffer(flexnode)
+            if buffer is not None:
+                return buffer.messages(self, self._tiles_flat)
+        return flexnode.compile_stream(self, self._tiles_flat)
+
+    def _compile_ahead(self, tile_command_stream):
+        ''' _compile_ahead:
+
+        Compiles tile commands from the stream until the window of unsent tile commands is full.
+
+        Returns:
+            False if the stream is exhausted, True otherwise.
+        '''
+        while len(self._tile_commands) < self._command_window:
+            tile_command = next(tile_command_stream, None)
+            if tile_command is None:
+                return False
+            self._tile_commands.append(tile_command)
+        return True
+
+    def _report_layer(self, flexnode, start_time, end_time):
+        ''' _report_layer:
+
+        Records and displays the cycles spent on the flexnode (which started at the cycle-count
+        recorded in self._cycles_per_layer).
+        '''
         self._cycles_per_layer = self._system_clock_ref.current_clock() - self._cycles_per_layer
         print("\nCycles For Layer ["+flexnode.get_op_name()+"]: " + str(self._cycles_per_layer))
         print("Stalled Cycles: "+str(self.number_of_stalled_cycles()))
         print("Total Number of Cycles: " + str(self._system_clock_ref.current_clock()))
-        print("Simulator Performance Per Layer: "+"{:10.2f} cycles/sec".format(self._cycles_per_layer/(end_time-start_time)))
+        print("Simulator Performance Per Layer: "+"{:10.2f} cycles/sec".format(self._cycles_per_layer/max(end_time-start_time, 1e-9)))
 
-        # If the memory was listed as external, this will
-        self._memory.write_transaction_log()
+    def cycles_per_layer(self):
+        ''' cycles_per_layer: The number of cycles spent on the last layer passed to forward.
+        '''
+        return self._cycles_per_layer
+
+    def message_router_statistics(self):
+        ''' message_router_statistics: The backpressure counters of every connection, on both MessageRouters.
+
+        Returns:
+            A dict of: tile (the tile-command MessageRouter) and device (the MessageRouter between the memory,
+            tiles and PEs); each maps a device to its counters (see MessageQueue.statistics).
+        '''
+        return {
+            "tile" : self._tile_message_router.statistics(),
+            "device" : self._device_message_router.statistics()
+        }
+
+    def pin_tensors(self, tensors):
+        ''' pin_tensors: Makes the tensors (e.g., the weights of the model) resident: they are uploaded
+        to the memory once, the first time a layer maps them, and are shared by every later layer and
+        inference (see MemoryMapper.pin). The tensors must not change while they are pinned.
+        '''
+        for tensor in tensors:
+            self._memory_mapper.pin(tensor)
+
+    def residency_statistics(self):
+        ''' residency_statistics: Reports the resident tensors, and the uploads they avoided.
+
+        Returns:
+            The dict of MemoryMapper.residency_statistics, with avoided_cycles: the cycles the memory would
+            have spent writing the avoided words (at memory_requests_per_cycle words per cycle).
+        '''
+        statistics = self._memory_mapper.residency_statistics()
+        statistics["avoided_cycles"] = statistics["avoided_words"] // self.timing_parameters()["memory_requests_per_cycle"]
+        return statistics
+
+    def memory_statistics(self):
+        ''' memory_statistics: The requests, bank conflicts and port utilization of the memory (see NioBankedMemory.bank_statistics).
+        '''
+        return self._memory.bank_statistics()
+
+    def cache_statistics(self):
+        ''' cache_statistics: The hits, misses and evictions of each tile's cache (see Cache.statistics).
+
+        Returns:
+            A list with a dict per tile (in row-major order).
+        '''
+        return [tile.cache_statistics() for tile in self._tiles_flat]
+
+    def timing_parameters(self):
+        ''' timing_parameters: The configuration of this Nio instance which determines its timing.
+
+        Returns:
+            A dict with:
+                num_tiles: The number of tiles.
+                memory_pipeline_depth: The number of stages in the memory's read/write pipelines (for a DRAM, the cycles of a row hit, plus one).
+                memory_requests_per_cycle: The number of requests the memory accepts per cycle (without bank conflicts).
+                pe_pipeline_depth: The number of stages in each PE's pipeline.
+                num_pes: The number of PEs in each tile.
+                tile_queue_size: The number of tile commands each tile's port may hold.
+                data_queue_size: The number of Messages each tile's port may hold.
+                cache_entries: The number of entries in each tile's cache.
+        '''
+        tile = self._tiles_flat[0]
+        return {
+            "num_tiles" : len(self._tiles_flat),
+            "memory_pipeline_depth" : self._memory.pipeline_depth(),
+            "memory_requests_per_cycle" : self._memory.requests_per_cycle(),
+            "pe_pipeline_depth" : tile.pe_pipeline_depth(),
+            "num_pes" : tile.num_pes(),
+            "tile_queue_size" : tile.tile_queue_size(),
+            "data_queue_size" : self._data_queue_size,
+            "cache_entries" : tile.cache_size(),
+        }
+
+    def estimate_cycles(self, flexnode):
+        ''' estimate_cycles:
+
+        A closed-form estimate of the number of cycles this Nio instance spends on the flexnode.
+
+        Args:
+            flexnode: The FlexNode to estimate.
+
+        Returns:
+            The estimated number of cycles, or None if the FlexNode does not summarize its workload.
+
+        Notes:
+            A tile works on one command at a time, and a command is a chain of memory round-trips.
+            Between round-trips, the tile (and its PEs) advance once per cycle, while each round-trip
+            lasts for the depth of the memory pipeline. Tile queues never hold more than the next command,
+            so they do not overlap commands. The memory accepts memory_requests_per_cycle requests per cycle, which
+            are shared by all tiles; this bounds the layer whenever tiles miss in their caches, and delays
+            the miss_overlap fraction of each tile's misses behind those of the other tiles. (Bank conflicts,
+            the stalls of a memory whose responses outpace a tile, and the rows a DRAM opens and closes,
+            are not modelled: a DRAM is estimated as if every request hit an open row.)
+        '''
+        workload = flexnode.workload()
+        if workload is None:
+            return None
+
+        if workload["commands"] == 0:
+            return 0
+
+        cycles, contention, requests = self._estimate_terms(workload)
+        # The first command reaches its tile on the second cycle of the layer.
+        return int(max(cycles + contention*self._miss_overlap, requests/self.timing_parameters()["memory_requests_per_cycle"])) + 2
+
+    def fit_miss_overlap(self, layers):
+        ''' fit_miss_overlap:
+
+        Fits the miss overlap of the analytical estimates to the cycles of simulated layers.
+
+        Args:
+            layers: A list of (flexnode, simulated_cycles), e.g., the layers of a cycle-accurate run.
+
+        Returns:
+            The miss overlap which minimizes the squared relative error of the estimates, or None if
+            none of the layers has misses which contend for the memory.
+
+        Notes:
+            The fit only sets the contention term; where the memory's requests per cycle bound a layer,
+            its estimate does not depend on the overlap. Pass the result as miss_overlap to estimate with it.
+        '''
+        numerator = 0.0
+        denominator = 0.0
+        for flexnode, simulated in layers:
+            workload = flexnode.workload()
+            if workload is None or workload["commands"] == 0 or simulated == 0:
+                continue
+
+            cycles, contention, requests = self._estimate_terms(workload)
+            # (The estimate is cycles + 2 + contention*overlap.)
+            numerator += contention*(simulated - cycles - 2)/simulated**2
+            denominator += (contention/simulated)**2
+
+        if denominator == 0:
+            return None
+        return max(0.0, numerator/denominator)
+
+    def _estimate_terms(self, workload):
+        ''' _estimate_terms: The cycles of a workload (with commands) without contention, the cycles its
+        misses would add if they all contended for the memory, and the requests it makes of the memory.
+        '''
+        commands = workload["commands"]
+
+        timing = self.timing_parameters()
+        num_tiles = timing["num_tiles"]
+        memory_depth = timing["memory_pipeline_depth"]
+        pe_depth = timing["pe_pipeline_depth"]
+        requests_per_cycle = timing["memory_requests_per_cycle"]
+
+        commands_per_tile = -(-commands // num_tiles)
+
+        if workload["operation"] == Operator.DOT:
+            # With cached operands, a command is one round-trip: after the previous write is acknowledged,
+            # the tile acknowledges, fetches, looks-up, dispatches all beats and then writes back.
+            command_cycles = 3 + self._dot_beats(workload, timing["num_pes"], pe_depth) + pe_depth + 2 + memory_depth
+
+            misses = sum(self._operand_misses(operand, num_tiles) for operand in workload["operands"])
+            if misses > timing["cache_entries"]:
+                misses = commands_per_tile*workload["reads"]
+
+            # A refill issues its misses (one per cycle), and waits on the last of them.
+            refills = min(commands_per_tile, -(-workload["refills"] // num_tiles))
+            cycles = commands_per_tile*command_cycles + misses + (memory_depth - 1)*refills
+            # (Only the tiles which are dealt a command contend for the memory, once they outnumber its requests per cycle.)
+            active_tiles = min(num_tiles, commands)
+            contention = (active_tiles/min(active_tiles, requests_per_cycle) - 1)*misses
+
+            requests = active_tiles*misses + commands
+        else:
+            reads = workload["reads"]
+            # One round-trip to read the operands (one per cycle), and another to write back the result.
+            command_cycles = 3 + (reads - 1) + memory_depth
+            command_cycles += 1 + workload["beats"] + pe_depth + 1 + memory_depth
+            cycles = commands_per_tile*command_cycles
+            contention = 0
+
+            requests = commands*(reads + 1)
+
+        return cycles, contention, requests
+
+    def _dot_beats(self, workload, num_pes, pe_depth):
+        ''' _dot_beats: The cycles a tile's PEs spend on a DOT, split across num_pes PEs (see NioTile._dispatch_dot).
+        '''
+        if num_pes == 1:
+            return workload["beats"]
+
+        macs = workload["reads"] - workload["beats"]
+        has_bias = workload["beats"] - macs
+        chunk = max(1, -(-macs // num_pes))
+        used_pes = max(1, -(-macs // chunk))
+        # The last PE also adds the bias; then each level of the reduction is a round-trip to the PEs.
+        beats = max(chunk, macs - (used_pes - 1)*chunk + has_bias)
+        levels = math.ceil(math.log2(used_pes))
+        return beats + levels*(pe_depth + 2)
+
+    def _operand_misses(self, operand, num_tiles):
+        ''' _operand_misses: The misses of a tile on a cacheable input (see FlexNode.workload), with a cold cache.
+        '''
+        group_size, num_groups, uses_per_group, use_stride = operand[:4]
+        # Commands are dealt round-robin, so the uses of a group land on a subset of the tiles.
+        tiles_per_group = min(uses_per_group, num_tiles // math.gcd(use_stride, num_tiles))
+        misses = group_size*(-(-num_groups*tiles_per_group // num_tiles))
+        if len(operand) > 4:
+            # A tile may only be dealt some windows of each group.
+            misses = min(misses, self._operand_misses(operand[4], num_tiles))
+        return misses
 
     def progress(self):
         # Define local variable.
@@ -159,6 +569,10 @@ class Nio(System):
         '''
         self.tick()
 
+        if self._event_driven:
+            self._process_busy_devices()
+            return
+
         # Process the memory for this clock cycle.
         self._memory.process()
         
@@ -167,6 +581,55 @@ class Nio(System):
             for j in range(self._num_tile_cols):
                 self._tiles[i][j].process()
 
+    def _process_busy_devices(self):
+        ''' _process_busy_devices:
+
+        Event-driven variant of `process`. Devices are visited in the same order,
+        but those which are idle (i.e., processing them would change nothing) are skipped,
+        and those whose next event is in a later cycle (e.g., a tile whose PEs are holding) are only aged.
+        '''
+        # (The clock has just moved on to this cycle, so a device with work in it reports the cycle after the last.)
+        current_clock = self._system_clock_ref.current_clock()
+        self._devices_busy = False
+        for device in self._devices:
+            event = device.next_event_cycle()
+            if event is None:
+                continue
+            if event <= current_clock + 1:
+                device.process()
+                self._devices_busy = True
+            else:
+                device.fast_forward(1)
+
+    def _skip_idle_cycles(self):
+        ''' _skip_idle_cycles:
+
+        Moves the clock to the cycle just before the next event of any device,
+        provided no device (nor this system) has work in the upcoming cycle.
+        '''
+        if self._tile_message_router.pending(self):
+            return
+
+        current_clock = self._system_clock_ref.current_clock()
+        next_event = None
+        for device in self._devices:
+            event = device.next_event_cycle()
+            if event is None:
+                continue
+            if event <= current_clock + 1:
+                return
+            if next_event is None or event < next_event:
+                next_event = event
+
+        # If nothing is scheduled, there is nothing to skip to.
+        if next_event is None:
+            return
+
+        cycles = next_event - current_clock - 1
+        self.tick(cycles)
+        for device in self._devices:
+            device.fast_forward(cycles)
+
 
 
     def _fetch_tile_resp_messages(self):
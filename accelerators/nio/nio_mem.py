@@ -75,7 +75,7 @@ class NioMemory(Memory):
             seq_num = self._current_write_message.seq_num
             address = self._current_write_message.addr
             content = self._current_write_message.content
-            self._poke(address, content)
+            self._poke(address, content, destination)
             self._write_ackd_message = Message(self, destination, Message.MemWriteDone, message_id, seq_num)
             self._next_write_stage = WriteStage.WRITE_SEND
 
@@ -0,0 +1,306 @@
+''' nio_mem_banked.py: A banked, multi-ported specialization of the memory class, for use with Nick's Accelerator
+
+'''
+
+from core.memory import Memory
+from core.messaging import Message
+
+from accelerators.nio.nio_mem_piped import MemoryFillStage, READStageI, READStageII, WriteStageI, WriteStageII
+
+
+class MemoryBank:
+    ''' MemoryBank: A bank of a NioBankedMemory, with its own read and write pipelines.
+
+    Args:
+        nio_memory: The NioBankedMemory this bank belongs to (which its stages read, write and stall).
+        router: The MessageRouter the responses are sent on.
+        pipeline_size: The number of stages in both the read and write pipelines (minimum: 2)
+    '''
+    def __init__(self, nio_memory, router, pipeline_size):
+        self._pipeline_size = pipeline_size
+
+        self.read_pipeline = [None for x in range(0, pipeline_size)]
+        self.read_pipeline[0] = READStageI(nio_memory, router)
+        for i in range(1, pipeline_size-1):
+            self.read_pipeline[i] = MemoryFillStage()
+        self.read_pipeline[pipeline_size-1] = READStageII(nio_memory, router)
+
+        self.write_pipeline = [None for x in range(0, pipeline_size)]
+        self.write_pipeline[0] = WriteStageI(nio_memory, router)
+        for i in range(1, pipeline_size-1):
+            self.write_pipeline[i] = MemoryFillStage()
+        self.write_pipeline[pipeline_size-1] = WriteStageII(nio_memory, router)
+
+        self.num_reads = 0
+        self.num_writes = 0
+        self.num_conflicts = 0
+
+    def advance(self):
+        ''' advance: Moves every message one stage down its pipeline (leaving the first stages empty).
+        '''
+        for pipeline in [self.write_pipeline, self.read_pipeline]:
+            for i in range(self._pipeline_size-1, 0, -1):
+                pipeline[i].accept_message(pipeline[i-1].get_message())
+            pipeline[0].accept_message(None)
+
+    def accept(self, message):
+        if message.mtype == Message.MemRead:
+            self.read_pipeline[0].accept_message(message)
+            self.num_reads += 1
+        elif message.mtype == Message.MemWrite:
+            self.write_pipeline[0].accept_message(message)
+            self.num_writes += 1
+
+    def process(self):
+        for stage in self.write_pipeline:
+            stage.process()
+
+        for stage in self.read_pipeline:
+            stage.process()
+
+    def process_last_stages(self):
+        self.write_pipeline[-1].process()
+        self.read_pipeline[-1].process()
+
+    def responses(self):
+        ''' responses: The messages held by the last stages (i.e., waiting to be sent).
+        '''
+        return [stage.get_message() for stage in [self.write_pipeline[-1], self.read_pipeline[-1]] if stage.get_message() is not None]
+
+    def oldest_stage(self):
+        ''' oldest_stage: The latest stage (before the last) which holds a message, or None.
+        '''
+        for i in range(self._pipeline_size-2, -1, -1):
+            if self.write_pipeline[i].get_message() is not None or self.read_pipeline[i].get_message() is not None:
+                return i
+        return None
+
+    def fast_forward(self, cycles):
+        for pipeline in [self.write_pipeline, self.read_pipeline]:
+            messages = [stage.get_message() for stage in pipeline]
+            for i in range(self._pipeline_size):
+                pipeline[i].accept_message(messages[i-cycles] if i >= cycles else None)
+
+
+class NioBankedMemory(Memory):
+    ''' NioBankedMemory: Nick's External Memory, with independent banks and multiple request ports.
+
+    Notes:
+        Each cycle, every free port takes a request from the memory's queue (which holds a request per port),
+        and each port then issues its request to the bank its address maps to. A bank accepts one request
+        (a read or a write) per cycle, into its own pipelines; a request for a bank which has already
+        accepted one this cycle is a bank conflict, and waits on its port for the next cycle. The ports
+        issue in a rotating order, so none of them starves.
+
+        Addresses are interleaved across the banks in blocks of interleave_size words: with "modulo",
+        block b belongs to bank b % num_banks; with "xor", the digits of b (in base num_banks) are XOR-ed
+        together, so that strides of a power of 2 spread across the banks (num_banks must be a power of 2).
+
+        Like NioMemory, a response which cannot be sent stalls the memory (every bank) until it is.
+
+    Args:
+        system_clock_ref: The reference to the system clock.
+        message_router: The router to handle communication transactions.
+        word_byte_size: The number of bytes per memory cell.
+        width:  The number of words in the memory (e.g., words*word_byte_size bytes large)
+        pipeline_size: The number of stages in each bank's read and write pipelines (minimum: 2)
+        page_size: The number of words per page, or None to allocate the entire memory up front (default: None)
+        num_banks: The number of banks.
+        num_ports: The number of requests the memory may take (and issue to its banks) per cycle.
+        interleave_size: The number of consecutive words mapped to a bank, before the next bank.
+        interleaving: The function which maps a block of words to its bank: "modulo" or "xor".
+        log_transactions: If True, every read and write is logged, for Memory.write_transaction_log (default: True)
+
+    Returns:
+        A "Memory" object.
+    '''
+
+    INTERLEAVINGS = ("modulo", "xor")
+
+    def __init__(self, system_clock_ref, message_router, word_byte_size = 4, width = 10000, pipeline_size = 2, page_size = None, num_banks = 2, num_ports = 2, interleave_size = 1, interleaving = "modulo", log_transactions = True):
+
+        if not isinstance(num_banks, int) or num_banks < 1:
+            raise ValueError("The memory requires at least 1 bank.")
+
+        if not isinstance(num_ports, int) or num_ports < 1:
+            raise ValueError("The memory requires at least 1 port.")
+
+        if not isinstance(interleave_size, int) or interleave_size < 1:
+            raise ValueError("The interleave size (in words) must be a positive integer.")
+
+        if interleaving not in self.INTERLEAVINGS:
+            raise ValueError("Please choose a supported interleaving: "+str(self.INTERLEAVINGS))
+
+        if interleaving == "xor" and num_banks & (num_banks - 1) != 0:
+            raise ValueError("An XOR interleaving needs a power of 2 banks.")
+
+        if not isinstance(pipeline_size, int) or pipeline_size < 2:
+            raise ValueError("The memory pipeline requires at least 2 stages.")
+
+        # The queue holds a request for every port.
+        Memory.__init__(self, system_clock_ref, message_router, num_ports, log_transactions, word_byte_size, width, page_size)
+
+        self._pipeline_size = pipeline_size
+        self._num_banks = num_banks
+        self._num_ports = num_ports
+        self._interleave_size = interleave_size
+        self._interleaving = interleaving
+
+        self._banks = [MemoryBank(self, message_router, pipeline_size) for i in range(num_banks)]
+
+        # The request held by each port (until its bank accepts it), and the port which issues first.
+        self._ports = [None for i in range(num_ports)]
+        self._first_port = 0
+
+        self._port_requests = [0 for i in range(num_ports)]
+        self._port_conflicts = [0 for i in range(num_ports)]
+        self._first_cycle = system_clock_ref.current_clock()
+
+        self._stall = False
+        self._num_stalls = 0
+        # The cycle in which the memory last stalled (its stalled cycles are counted once it continues).
+        self._stalled_since = None
+
+
+    def pipeline_depth(self):
+        return self._pipeline_size
+
+    def requests_per_cycle(self):
+        ''' requests_per_cycle: The most requests the memory accepts in a cycle (without bank conflicts).
+        '''
+        return min(self._num_banks, self._num_ports)
+
+    def bank(self, address):
+        ''' bank: The index of the bank which holds address.
+        '''
+        block = address // self._interleave_size
+        if self._interleaving == "modulo":
+            return block % self._num_banks
+
+        bank = 0
+        while block:
+            bank ^= block % self._num_banks
+            block //= self._num_banks
+        return bank
+
+    def process(self):
+        ''' process: Advances every bank's pipelines, fills the free ports, and issues their requests.
+        '''
+
+        if self._stall:
+            for bank in self._banks:
+                bank.process_last_stages()
+            if not any(bank.responses() for bank in self._banks):
+                self.continue_processing()
+            return
+
+        for bank in self._banks:
+            bank.advance()
+
+        for port in range(self._num_ports):
+            if self._ports[port] is None:
+                self._ports[port] = self._message_router.fetch(self)
+
+        if any(message is not None for message in self._ports):
+            self._issue()
+
+        for bank in self._banks:
+            bank.process()
+
+    def _issue(self):
+        ''' _issue: Issues the request of each port (in the rotating order) to its bank, unless the bank
+        has already accepted a request this cycle.
+        '''
+        busy_banks = set()
+        for i in range(self._num_ports):
+            port = (self._first_port + i) % self._num_ports
+            message = self._ports[port]
+            if message is None:
+                continue
+            bank = self.bank(message.addr)
+            if bank in busy_banks:
+                self._banks[bank].num_conflicts += 1
+                self._port_conflicts[port] += 1
+                continue
+            busy_banks.add(bank)
+            self._banks[bank].accept(message)
+            self._port_requests[port] += 1
+            self._ports[port] = None
+
+        # (The order only rotates in cycles with requests, so idle cycles do not change it.)
+        self._first_port = (self._first_port + 1) % self._num_ports
+
+    def bank_statistics(self):
+        ''' bank_statistics: Reports the requests each bank accepted, and the conflicts between them,
+        and how busy each port was.
+
+        Returns:
+            A dict of: cycles (since the memory was created), banks (a list with a dict of: reads, writes,
+            conflicts, per bank) and ports (a list with a dict of: requests, conflicts (the cycles a request
+            waited on the port for its bank) and utilization (the fraction of cycles it issued a request), per port).
+        '''
+        cycles = self._system_clock_ref.current_clock() - self._first_cycle
+        return {
+            "cycles" : cycles,
+            "banks" : [{"reads" : bank.num_reads, "writes" : bank.num_writes, "conflicts" : bank.num_conflicts} for bank in self._banks],
+            "ports" : [{"requests" : requests, "conflicts" : conflicts, "utilization" : requests/max(cycles, 1)}
+                       for requests, conflicts in zip(self._port_requests, self._port_conflicts)]
+        }
+
+    def number_of_stalled_cycles(self):
+        if self._stall:
+            return self._num_stalls + self._system_clock_ref.current_clock() - self._stalled_since
+        return self._num_stalls
+
+    def _waiting_for_credits(self):
+        ''' A stalled memory sleeps (i.e., is idle) while none of its responses has a credit to be sent with.
+        '''
+        for bank in self._banks:
+            for message in bank.responses():
+                if self._message_router.can_send(message.destination):
+                    return False
+        return True
+
+    def is_idle(self):
+        if self._stall:
+            return self._waiting_for_credits()
+        # The last stages have already sent their messages, so only the ports and earlier stages hold work.
+        if self._message_router.pending(self) or any(message is not None for message in self._ports):
+            return False
+        return all(bank.oldest_stage() is None for bank in self._banks)
+
+    def next_event_cycle(self):
+        current_clock = self._system_clock_ref.current_clock()
+        if self._stall:
+            return None if self._waiting_for_credits() else current_clock + 1
+        if self._message_router.pending(self) or any(message is not None for message in self._ports):
+            return current_clock + 1
+
+        # Stages between the first and the last do not act on their message,
+        # so the next event is when the oldest message of any bank reaches its last stage.
+        stages = [bank.oldest_stage() for bank in self._banks]
+        stages = [stage for stage in stages if stage is not None]
+        if not stages:
+            return None
+        return current_clock + self._pipeline_size-1 - max(stages)
+
+    def fast_forward(self, cycles):
+        # A stalled pipeline does not move (and the ports are empty, or there would be no cycles to skip).
+        if self._stall:
+            return
+        for bank in self._banks:
+            bank.fast_forward(cycles)
+
+    def stall(self):
+        if not self._stall:
+            self._stalled_since = self._system_clock_ref.current_clock()
+        self._stall = True
+
+
+    def is_stalled(self):
+        return self._stall
+
+    def continue_processing(self):
+        if self._stall:
+            self._num_stalls += self._system_clock_ref.current_clock() - self._stalled_since
+        self._stall = False
@@ -0,0 +1,333 @@
+''' nio_mem_dram.py: A DRAM specialization of the memory class (with row buffers, and an FR-FCFS scheduler),
+for use with Nick's Accelerator
+
+'''
+
+import heapq
+
+from core.memory import Memory
+from core.messaging import Message
+
+
+class DRAMRequest:
+    ''' DRAMRequest: A request waiting in the DRAM's queue, with the location its address decodes to.
+    '''
+    __slots__ = ("message", "arrival", "channel", "bank", "row")
+
+    def __init__(self, message, arrival, channel, bank, row):
+        self.message = message
+        self.arrival = arrival
+        self.channel = channel
+        self.bank = bank
+        self.row = row
+
+
+class DRAMBank:
+    ''' DRAMBank: The row buffer of a bank (the row it holds open), and the cycle it may take its next command.
+    '''
+    __slots__ = ("open_row", "ready", "reads", "writes", "row_hits", "row_misses", "row_conflicts")
+
+    def __init__(self):
+        self.open_row = None
+        self.ready = 0
+        self.reads = 0
+        self.writes = 0
+        self.row_hits = 0
+        self.row_misses = 0
+        self.row_conflicts = 0
+
+
+class DRAMChannel:
+    ''' DRAMChannel: The cycles a channel's command bus and data bus are next free.
+    '''
+    __slots__ = ("ready", "data_ready", "requests", "row_conflicts")
+
+    def __init__(self):
+        self.ready = 0
+        self.data_ready = 0
+        self.requests = 0
+        self.row_conflicts = 0
+
+
+class NioDRAMMemory(Memory):
+    ''' NioDRAMMemory: Nick's External Memory, as a DRAM of channels, ranks and banks, each bank with a row buffer.
+
+    Notes:
+        An address (in words) decodes to its column (the lowest bits, row_size words per row), then its channel,
+        bank and rank, and its row (the highest bits); so consecutive words share a row, and consecutive rows are
+        spread across the channels and banks.
+
+        Requests wait in a queue (of queue_size requests, taking at most one per channel per cycle). Each cycle,
+        each channel issues one request by FR-FCFS: the oldest request which hits the open row of its bank,
+        or else the oldest request, among the requests whose bank is ready. The latency of a request is
+        t_cas if it hits the open row, t_rcd + t_cas if its bank has no open row, and t_rp + t_rcd + t_cas if it
+        must close another row first (an open-page policy: a row stays open until a request for another row).
+        Each response then holds the channel's data bus for t_burst cycles.
+
+        Rather than polling every bank every cycle, each bank and channel keeps the cycle it is next ready,
+        and each response the cycle it completes, so the memory only acts (and, in an event-driven System,
+        is only processed) in the cycles where a response is due or a request can issue.
+
+        Like NioMemory, a response which cannot be sent stalls the memory until it is. Requests to the same
+        address are never reordered (they share a bank and a row, so the older is always chosen first).
+
+    Args:
+        system_clock_ref: The reference to the system clock.
+        message_router: The router to handle communication transactions.
+        word_byte_size: The number of bytes per memory cell.
+        width:  The number of words in the memory (e.g., words*word_byte_size bytes large)
+        page_size: The number of words per page, or None to allocate the entire memory up front (default: None)
+        num_channels: The number of channels (each with its own command and data bus).
+        num_ranks: The number of ranks in each channel.
+        num_banks: The number of banks in each rank.
+        row_size: The number of words in each row (i.e., in a row buffer).
+        queue_size: The number of requests the memory's scheduler holds.
+        t_rcd: The cycles to open (activate) a row, before it can be read or written.
+        t_cas: The cycles from reading (or writing) an open row to its response.
+        t_rp: The cycles to close (precharge) an open row.
+        t_burst: The cycles a response holds its channel's data bus.
+
+    Returns:
+        A "Memory" object.
+    '''
+    def __init__(self, system_clock_ref, message_router, word_byte_size = 4, width = 10000, page_size = None, num_channels = 1, num_ranks = 1, num_banks = 8, row_size = 1024, queue_size = 32, t_rcd = 11, t_cas = 11, t_rp = 11, t_burst = 1):
+
+        for name, value in [("channels", num_channels), ("ranks", num_ranks), ("banks", num_banks), ("words per row", row_size), ("queued requests", queue_size)]:
+            if not isinstance(value, int) or value < 1:
+                raise ValueError("The DRAM requires at least 1 of its "+name+".")
+
+        for name, value in [("t_rcd", t_rcd), ("t_cas", t_cas), ("t_rp", t_rp), ("t_burst", t_burst)]:
+            if not isinstance(value, int) or value < 1:
+                raise ValueError("The DRAM timing "+name+" must be a positive integer (of cycles).")
+
+        # The router holds a request for every channel.
+        Memory.__init__(self, system_clock_ref, message_router, num_channels, False, word_byte_size, width, page_size)
+
+        self._num_channels = num_channels
+        self._num_ranks = num_ranks
+        self._num_banks = num_banks
+        self._row_size = row_size
+        self._queue_size = queue_size
+        self._t_rcd = t_rcd
+        self._t_cas = t_cas
+        self._t_rp = t_rp
+        self._t_burst = t_burst
+
+        self._channels = [DRAMChannel() for i in range(num_channels)]
+        # The banks of every rank of every channel, indexed by (channel*num_ranks + rank)*num_banks + bank.
+        self._banks = [DRAMBank() for i in range(num_channels*num_ranks*num_banks)]
+
+        self._queue = list()
+        # The responses in flight, as a heap of (completion cycle, order, message).
+        self._responses = list()
+        self._num_responses = 0
+
+        self._total_latency = 0
+        self._first_cycle = system_clock_ref.current_clock()
+
+        self._stall = False
+        self._num_stalls = 0
+        # The cycle in which the memory last stalled (its stalled cycles are counted once it continues).
+        self._stalled_since = None
+
+
+    def pipeline_depth(self):
+        ''' pipeline_depth: The cycles from a request to its response, for a row hit (the depth of the
+        equivalent NioMemory pipeline).
+        '''
+        return self._t_cas + 1
+
+    def requests_per_cycle(self):
+        ''' requests_per_cycle: The most requests the memory issues in a cycle (one per channel).
+        '''
+        return self._num_channels
+
+    def decode(self, address):
+        ''' decode: The (channel, rank, bank, row) which address belongs to.
+        '''
+        block = address // self._row_size
+        block, channel = divmod(block, self._num_channels)
+        block, bank = divmod(block, self._num_banks)
+        row, rank = divmod(block, self._num_ranks)
+        return channel, rank, bank, row
+
+    def process(self):
+        ''' process: Sends the responses which are due, takes new requests, and issues a request on each ready channel.
+        '''
+        current_clock = self._system_clock_ref.current_clock()
+
+        if self._stall:
+            self._send_responses(current_clock)
+            if not self._stall_pending(current_clock):
+                self.continue_processing()
+            return
+
+        self._send_responses(current_clock)
+
+        for i in range(self._num_channels):
+            if len(self._queue) == self._queue_size:
+                break
+            message = self._message_router.fetch(self)
+            if message is None:
+                break
+            channel, rank, bank, row = self.decode(message.addr)
+            self._queue.append(DRAMRequest(message, current_clock, channel, (channel*self._num_ranks + rank)*self._num_banks + bank, row))
+
+        for channel in range(self._num_channels):
+            if self._channels[channel].ready <= current_clock:
+                request = self._schedule(channel, current_clock)
+                if request is not None:
+                    self._issue(request, current_clock)
+
+    def _send_responses(self, current_clock):
+        # Responses are sent in the order they complete (stalling the memory if one cannot be sent).
+        while self._responses and self._responses[0][0] <= current_clock:
+            message = self._responses[0][2]
+            if not (self._message_router.can_send(message.destination) and self._message_router.send(message)):
+                self.stall()
+                return
+            heapq.heappop(self._responses)
+
+    def _stall_pending(self, current_clock):
+        return bool(self._responses) and self._responses[0][0] <= current_clock
+
+    def _schedule(self, channel, current_clock):
+        ''' _schedule: Chooses the request for the channel to issue (FR-FCFS), or None if no request's bank is ready.
+        '''
+        oldest = None
+        for request in self._queue:
+            if request.channel != channel:
+                continue
+            bank = self._banks[request.bank]
+            if bank.ready > current_clock:
+                continue
+            if bank.open_row == request.row:
+                return request
+            if oldest is None:
+                oldest = request
+        return oldest
+
+    def _issue(self, request, current_clock):
+        self._queue.remove(request)
+        bank = self._banks[request.bank]
+        channel = self._channels[request.channel]
+
+        if bank.open_row == request.row:
+            bank.row_hits += 1
+            activation = 0
+        elif bank.open_row is None:
+            bank.row_misses += 1
+            activation = self._t_rcd
+        else:
+            bank.row_conflicts += 1
+            channel.row_conflicts += 1
+            activation = self._t_rp + self._t_rcd
+        bank.open_row = request.row
+        bank.ready = current_clock + activation + self._t_burst
+
+        # The command bus takes a command per cycle; the data bus a burst per response.
+        channel.ready = current_clock + 1
+        channel.requests += 1
+        completion = max(current_clock + activation + self._t_cas, channel.data_ready)
+        channel.data_ready = completion + self._t_burst
+        self._total_latency += completion - request.arrival
+
+        message = request.message
+        if message.mtype == Message.MemRead:
+            bank.reads += 1
+            attributes = {
+                "addr" : message.addr,
+                "content" : self._peek_fill(message.addr) if getattr(message, "fill", False) else self._peek(message.addr)
+            }
+            response = self._message_pool.message(self, message.source, Message.MemReadDone, message.message_id, message.seq_num, attributes = attributes)
+        else:
+            bank.writes += 1
+            self._poke(message.addr, message.content, message.source)
+            response = self._message_pool.message(self, message.source, Message.MemWriteDone, message.message_id, message.seq_num)
+        self._message_pool.release(message)
+
+        heapq.heappush(self._responses, (completion, self._num_responses, response))
+        self._num_responses += 1
+
+    def bank_statistics(self):
+        ''' bank_statistics: Reports the requests of each bank, and how they found its row buffer,
+        and the requests of each channel (see NioBankedMemory.bank_statistics).
+
+        Returns:
+            A dict of: cycles (since the memory was created), banks (a list with a dict of: reads, writes,
+            conflicts (row conflicts), row_hits and row_misses (requests to a bank without an open row), per bank,
+            in the order of channel, rank and bank), ports (a list with a dict of: requests, conflicts (row
+            conflicts) and utilization (the fraction of cycles it issued a request), per channel), row_hit_rate
+            and mean_latency (the mean cycles from a request's arrival to its completion).
+        '''
+        cycles = self._system_clock_ref.current_clock() - self._first_cycle
+        requests = sum(channel.requests for channel in self._channels)
+        return {
+            "cycles" : cycles,
+            "banks" : [{"reads" : bank.reads, "writes" : bank.writes, "conflicts" : bank.row_conflicts, "row_hits" : bank.row_hits, "row_misses" : bank.row_misses}
+                       for bank in self._banks],
+            "ports" : [{"requests" : channel.requests, "conflicts" : channel.row_conflicts, "utilization" : channel.requests/max(cycles, 1)}
+                       for channel in self._channels],
+            "row_hit_rate" : sum(bank.row_hits for bank in self._banks)/max(requests, 1),
+            "mean_latency" : self._total_latency/max(requests, 1)
+        }
+
+    def number_of_stalled_cycles(self):
+        if self._stall:
+            return self._num_stalls + self._system_clock_ref.current_clock() - self._stalled_since
+        return self._num_stalls
+
+    def _next_event(self):
+        ''' _next_event: The first cycle in which a response is due, or a queued request can issue (or None).
+        '''
+        events = list()
+        if self._responses:
+            events.append(self._responses[0][0])
+        for request in self._queue:
+            events.append(max(self._banks[request.bank].ready, self._channels[request.channel].ready))
+        return min(events, default=None)
+
+    def _waiting_for_credits(self):
+        ''' A stalled memory sleeps (i.e., is idle) while its next response has no credit to be sent with.
+        '''
+        return not self._message_router.can_send(self._responses[0][2].destination)
+
+    def _can_fetch(self):
+        return self._message_router.pending(self) and len(self._queue) < self._queue_size
+
+    def is_idle(self):
+        if self._stall:
+            return self._waiting_for_credits()
+        if self._can_fetch():
+            return False
+        next_event = self._next_event()
+        return next_event is None or next_event > self._system_clock_ref.current_clock()
+
+    def next_event_cycle(self):
+        current_clock = self._system_clock_ref.current_clock()
+        if self._stall:
+            return None if self._waiting_for_credits() else current_clock + 1
+        if self._can_fetch():
+            return current_clock + 1
+        next_event = self._next_event()
+        if next_event is None:
+            return None
+        return max(next_event, current_clock + 1)
+
+    def fast_forward(self, cycles):
+        # Every pending event is kept as the cycle it happens in, so there is nothing to age.
+        pass
+
+    def stall(self):
+        if not self._stall:
+            self._stalled_since = self._system_clock_ref.current_clock()
+        self._stall = True
+
+
+    def is_stalled(self):
+        return self._stall
+
+    def continue_processing(self):
+        if self._stall:
+            self._num_stalls += self._system_clock_ref.current_clock() - self._stalled_since
+        self._stall = False
@@ -2,6 +2,7 @@
 
 '''
 
+from collections import deque
 from enum import Enum
 
 
@@ -12,44 +13,61 @@ from core.pipeline import Stage
 class NioMemory(Memory):
     ''' NioMemory: Nick's External Memory, Single Port...
 
+    Notes:
+        Only the first stage (which reads or writes the memory) and the last stage (which sends the response)
+        of each pipeline act on their message, so the messages between them are kept in order of the shift
+        they entered at, instead of being moved through a stage per cycle.
+
     Args:
          system_clock_ref: The reference to the system clock.
         message_router: The router to handle communication transactions.
         message_queue_size: The number of additional Messages for the router to store when busy (default: 1)
-        log_transactions: If we wish to store this to a 
         word_byte_size: The number of bytes per memory cell.
         width:  The number of words in the memory (e.g., words*word_byte_size bytes large)
+        pipeline_size: The number of stages in both the read and write pipelines (minimum: 2)
+        page_size: The number of words per page, or None to allocate the entire memory up front (default: None)
+        log_transactions: If True, every read and write is logged, for Memory.write_transaction_log (default: True)
            
     Returns:
         A "Memory" object.
     '''
-    def __init__(self, system_clock_ref, message_router, word_byte_size = 4, width = 10000):
+    def __init__(self, system_clock_ref, message_router, word_byte_size = 4, width = 10000, pipeline_size = 2, page_size = None, log_transactions = True):
 
-        Memory.__init__(self, system_clock_ref, message_router, 1, True, word_byte_size, width)
+        Memory.__init__(self, system_clock_ref, message_router, 1, log_transactions, word_byte_size, width, page_size)
 
         self._shared_fetch_pipe = MemoryStageFetch(self, message_router)
 
-        self._pipeline_size = 2
+        if not isinstance(pipeline_size, int) or pipeline_size < 2:
+            raise ValueError("The memory pipeline requires at least 2 stages.")
 
-        self._pipeline_sequence = list(range(1, self._pipeline_size))
-        self._pipeline_reversed = self._pipeline_sequence[::-1]
-        
+        self._pipeline_size = pipeline_size
 
-        self._read_pipeline = [None for x in range(0, self._pipeline_size)]
-        self._read_pipeline[0] = READStageI(self, message_router)
-        for i in range(1, self._pipeline_size-1):
-            self._read_pipeline[i] = MemoryFillStage()
-        self._read_pipeline[self._pipeline_size-1] = READStageII(self, message_router)
+        # The first and last stage of each pipeline, and the messages in flight between them
+        # (as (shift, message), where shift is the count of pipeline shifts when the message entered).
+        self._read_pipeline = [READStageI(self, message_router), READStageII(self, message_router)]
+        self._write_pipeline = [WriteStageI(self, message_router), WriteStageII(self, message_router)]
+        self._read_in_flight = deque()
+        self._write_in_flight = deque()
+        # The number of times the pipelines have moved (they do not while the memory is stalled).
+        self._shifts = 0
 
-        self._write_pipeline = [None for x in range(0, self._pipeline_size)]
-        self._write_pipeline[0] = WriteStageI(self, message_router)
-        for i in range(1, self._pipeline_size-1):
-            self._write_pipeline[i] = MemoryFillStage()        
-        self._write_pipeline[self._pipeline_size-1] = WriteStageII(self, message_router)
+        self._num_reads = 0
+        self._num_writes = 0
+        self._first_cycle = system_clock_ref.current_clock()
 
         self._stall = False
         self._num_stalls = 0
+        # The cycle in which the memory last stalled (its stalled cycles are counted once it continues).
+        self._stalled_since = None
+
 
+    def pipeline_depth(self):
+        return self._pipeline_size
+
+    def requests_per_cycle(self):
+        ''' requests_per_cycle: The most requests the memory accepts in a cycle (its fetch stage takes one).
+        '''
+        return 1
 
     def process(self):
         '''
@@ -59,35 +77,93 @@ class NioMemory(Memory):
         if self._stall:
             self._write_pipeline[-1].process()
             self._read_pipeline[-1].process()
-            self._num_stalls += 1
+            if self._write_pipeline[-1].get_message() is None and self._read_pipeline[-1].get_message() is None:
+                self.continue_processing()
             return 
         
 
-        for i in self._pipeline_reversed:
-            self._write_pipeline[i].accept_message(self._write_pipeline[i-1].get_message())
-            self._read_pipeline[i].accept_message(self._read_pipeline[i-1].get_message())
+        self._shifts += 1
+        for pipeline, in_flight in [(self._write_pipeline, self._write_in_flight), (self._read_pipeline, self._read_in_flight)]:
+            # The oldest message reaches the last stage once it has moved through every stage before it.
+            if in_flight and self._shifts - in_flight[0][0] == self._pipeline_size-1:
+                pipeline[1].accept_message(in_flight.popleft()[1])
+            else:
+                pipeline[1].accept_message(None)
+            pipeline[0].accept_message(None)
 
         self._shared_fetch_pipe.process()
         message = self._shared_fetch_pipe.get_message()
-        self._write_pipeline[0].accept_message(None)
-        self._read_pipeline[0].accept_message(None)
         if message is not None:
             if message.mtype == Message.MemRead:
                 self._read_pipeline[0].accept_message(message)
+                self._num_reads += 1
             elif message.mtype == Message.MemWrite:
                 self._write_pipeline[0].accept_message(message)
+                self._num_writes += 1
 
+        for pipeline, in_flight in [(self._write_pipeline, self._write_in_flight), (self._read_pipeline, self._read_in_flight)]:
+            pipeline[0].process()
+            if pipeline[0].get_message() is not None:
+                in_flight.append((self._shifts, pipeline[0].get_message()))
+            pipeline[1].process()
 
-        for stage in self._write_pipeline:
-            stage.process()
-
-        for stage in self._read_pipeline:
-            stage.process()
+    def bank_statistics(self):
+        ''' bank_statistics: Reports the requests the memory accepted, as a single bank with a single port
+        (see NioBankedMemory.bank_statistics).
+        '''
+        cycles = self._system_clock_ref.current_clock() - self._first_cycle
+        requests = self._num_reads + self._num_writes
+        return {
+            "cycles" : cycles,
+            "banks" : [{"reads" : self._num_reads, "writes" : self._num_writes, "conflicts" : 0}],
+            "ports" : [{"requests" : requests, "conflicts" : 0, "utilization" : requests/max(cycles, 1)}]
+        }
 
     def number_of_stalled_cycles(self):
+        if self._stall:
+            return self._num_stalls + self._system_clock_ref.current_clock() - self._stalled_since
         return self._num_stalls
 
+    def _waiting_for_credits(self):
+        ''' A stalled memory sleeps (i.e., is idle) while none of its responses has a credit to be sent with.
+        '''
+        for stage in [self._write_pipeline[-1], self._read_pipeline[-1]]:
+            message = stage.get_message()
+            if message is not None and self._message_router.can_send(message.destination):
+                return False
+        return True
+
+    def is_idle(self):
+        if self._stall:
+            return self._waiting_for_credits()
+        # The last stage has already sent its message, so only the earlier stages hold work.
+        return not self._message_router.pending(self) and not self._write_in_flight and not self._read_in_flight
+
+    def next_event_cycle(self):
+        current_clock = self._system_clock_ref.current_clock()
+        if self._stall:
+            return None if self._waiting_for_credits() else current_clock + 1
+        if self._message_router.pending(self):
+            return current_clock + 1
+
+        # Stages between the first and the last do not act on their message,
+        # so the next event is when the oldest message reaches the last stage.
+        entries = [in_flight[0][0] for in_flight in [self._write_in_flight, self._read_in_flight] if in_flight]
+        if not entries:
+            return None
+        return current_clock + self._pipeline_size-1 - (self._shifts - min(entries))
+
+    def fast_forward(self, cycles):
+        # A stalled pipeline does not move (and no message reaches the last stage in the skipped cycles).
+        if self._stall:
+            return
+        self._shifts += cycles
+        self._write_pipeline[0].accept_message(None)
+        self._read_pipeline[0].accept_message(None)
+
     def stall(self):
+        if not self._stall:
+            self._stalled_since = self._system_clock_ref.current_clock()
         self._stall = True
 
 
@@ -95,6 +171,8 @@ class NioMemory(Memory):
         return self._stall
 
     def continue_processing(self):
+        if self._stall:
+            self._num_stalls += self._system_clock_ref.current_clock() - self._stalled_since
         self._stall = False
 
 
@@ -119,6 +197,7 @@ class WriteStageI(Stage):
         Stage.__init__(self)
         self._nio_memory = nio_memory
         self._router = router
+        self._message_pool = router.message_pool()
 
     def process(self):
         if self._message is None:
@@ -128,8 +207,9 @@ class WriteStageI(Stage):
         seq_num = self._message.seq_num
         address = self._message.addr
         content = self._message.content
-        self._nio_memory._poke(address, content)
-        self._message = Message(self._nio_memory, destination, Message.MemWriteDone, message_id, seq_num)
+        self._nio_memory._poke(address, content, self._message.source)
+        self._message_pool.release(self._message)
+        self._message = self._message_pool.message(self._nio_memory, destination, Message.MemWriteDone, message_id, seq_num)
 
 
 class WriteStageII(Stage):
@@ -141,9 +221,10 @@ class WriteStageII(Stage):
     def process(self):
         if self._message is None:
             return
-        self._nio_memory.continue_processing()
-        if not self._router.send(self._message):
+        # Hold the response (stalling the memory) until it can be sent.
+        if self._router.can_send(self._message.destination) and self._router.send(self._message):
             self._message = None
+        else:
             self._nio_memory.stall()
 
 
@@ -152,6 +233,7 @@ class READStageI(Stage):
         Stage.__init__(self)
         self._nio_memory = nio_memory
         self._router = router
+        self._message_pool = router.message_pool()
 
     def process(self):
         if self._message is None:
@@ -161,12 +243,13 @@ class READStageI(Stage):
         message_id = self._message.message_id
         seq_num = self._message.seq_num            
         address = self._message.addr
-        content = self._nio_memory._peek(address)
+        content = self._nio_memory._peek_fill(address) if getattr(self._message, "fill", False) else self._nio_memory._peek(address)
         attributes = {
             "addr" : address,
             "content" : content
         }
-        self._message = Message(self._nio_memory, destination,  Message.MemReadDone, message_id, seq_num, attributes = attributes)
+        self._message_pool.release(self._message)
+        self._message = self._message_pool.message(self._nio_memory, destination, Message.MemReadDone, message_id, seq_num, attributes = attributes)
 
 class READStageII(Stage):
     def __init__(self, nio_memory, router):
@@ -177,9 +260,9 @@ class READStageII(Stage):
     def process(self):
         if self._message is None:
             return
-        
-        if not self._nio_memory.is_stalled():
-            self._nio_memory.continue_processing()
-        if not self._router.send(self._message):
+
+        # Hold the response (stalling the memory) until it can be sent.
+        if self._router.can_send(self._message.destination) and self._router.send(self._message):
             self._message = None
+        else:
             self._nio_memory.stall()
@@ -7,6 +7,8 @@ from core.pipeline import Stage
 from core.messaging import Message
 from core.utils import *
 
+import numpy as np
+
 
 class NioPE(PE):
 
@@ -17,12 +19,20 @@ class NioPE(PE):
         self._pipeline[1] = ExecStage(self)
         self._pipeline[2] = AcknStage(self, self._message_router)
         self._stall = False
+        # The cycle in which the PE last stalled (its stalled cycles are counted once it continues).
+        self._stalled_since = None
+
+        # The number of cycles the pipeline is held for multi-beat (vector) operations.
+        self._hold_cycles = 0
 
     def process(self):
         # If we are stalled, only process a send...
         if self._stall:
-            self.pipeline[-1].process()
-            self._num_stalls += 1
+            self._pipeline[-1].process()
+            return
+        # A vector operation occupies the pipeline as long as its scalar equivalent.
+        if self._hold_cycles > 0:
+            self._hold_cycles -= 1
             return
         # Otherwise, proceed with processing.
         self._pipeline[2].accept_message(self._pipeline[1].get_message())
@@ -31,10 +41,44 @@ class NioPE(PE):
         for stage in self._pipeline:
             stage.process()
 
+    def pipeline_depth(self):
+        return len(self._pipeline)
+
     def stall(self):
+        if not self._stall:
+            self._stalled_since = self._system_clock_ref.current_clock()
         self._stall = True
 
+    def hold(self, cycles):
+        self._hold_cycles = cycles
+
+    def number_of_stalled_cycles(self):
+        if self._stall:
+            return self._num_stalls + self._system_clock_ref.current_clock() - self._stalled_since
+        return self._num_stalls
+
+    def is_idle(self):
+        # A stalled PE sleeps while its response has no credit to be sent with.
+        if self._stall:
+            return not self._message_router.can_send(self._pipeline[-1].get_message().destination)
+        # The acknowledge stage has already sent its message; only fetch and exec hold work.
+        if self._hold_cycles > 0 or self._message_router.pending(self):
+            return False
+        return self._pipeline[0].get_message() is None and self._pipeline[1].get_message() is None
+
+    def next_event_cycle(self):
+        # A held PE does nothing until its hold ends (a stall does not count the hold down).
+        if not self._stall and self._hold_cycles > 0:
+            return self._system_clock_ref.current_clock() + self._hold_cycles + 1
+        return PE.next_event_cycle(self)
+
+    def fast_forward(self, cycles):
+        if not self._stall:
+            self._hold_cycles = max(0, self._hold_cycles - cycles)
+
     def continue_processing(self):
+        if self._stall:
+            self._num_stalls += self._system_clock_ref.current_clock() - self._stalled_since
         self._stall = False
 
 
@@ -54,11 +98,16 @@ class ExecStage(Stage):
         Stage.__init__(self)
         self._accumulator = 0
         self._nio_pe = nio_pe
+        self._message_pool = nio_pe._message_pool
 
     def process(self):
         if self._message is None:
             return
 
+        if self._message.operation == Operator.DOT:
+            self._process_vector()
+            return
+
         op1 = int_repr_of_float_to_float(self._message.op1)
         op2 = int_repr_of_float_to_float(self._message.op2)
         dest = self._message.source
@@ -92,7 +141,29 @@ class ExecStage(Stage):
         attributes = {
             "result" : result
         }
-        self._message = Message(self._nio_pe, dest, Message.PEDone, message_id, seq_num, attributes = attributes)
+        self._message_pool.release(self._message)
+        self._message = self._message_pool.message(self._nio_pe, dest, Message.PEDone, message_id, seq_num, attributes = attributes)
+
+    def _process_vector(self):
+        ''' Computes a DOT over float32 operand buffers in one step.
+
+        Notes:
+            Like the scalar MAC sequence, products are accumulated in double precision.
+            The pipeline is then held, so the response leaves the PE in the same cycle
+            as the response to the last scalar MAC would have.
+        '''
+        result = float(np.dot(self._message.op1.astype(np.float64), self._message.op2.astype(np.float64)))
+        if hasattr(self._message, "op3"):
+            result += int_repr_of_float_to_float(self._message.op3)
+        self._accumulator = result
+        self._nio_pe.hold(self._message.num_beats - 1)
+
+        attributes = {
+            "result" : result
+        }
+        message = self._message
+        self._message = self._message_pool.message(self._nio_pe, message.source, Message.PEDone, message.message_id, message.seq_num, attributes = attributes)
+        self._message_pool.release(message)
 
 class AcknStage(Stage):
     def __init__(self, nio_pe, router):
@@ -103,8 +174,9 @@ class AcknStage(Stage):
     def process(self):
         if self._message is None:
             return
-        if not self._router.send(self._message):
+        # Hold the response (stalling the PE) until it can be sent.
+        if self._router.can_send(self._message.destination) and self._router.send(self._message):
             self._message = None
-            self._nio_pe.stall()
-        else:
             self._nio_pe.continue_processing()
+        else:
+            self._nio_pe.stall()
@@ -1,10 +1,10 @@
 '''ntile.py
 
 '''
-import uuid
-
 from collections import OrderedDict
 
+import numpy as np
+
 # from accelerators.nio.nio_pe import NioPE
 from accelerators.nio.nio_piped_pe import NioPE
 
@@ -28,19 +28,28 @@ class NioTile(Tile):
     SEND_ACK = 7
     FETCH = 9
 
-    def __init__(self, system_clock_ref, device_message_router, data_queue_size, tile_message_router, offchip_memory, num_pe_rows = 1, num_pe_cols = 1):
-        Tile.__init__(self, system_clock_ref, device_message_router, data_queue_size)
+    CACHE_WRITE_POLICIES = (None, "invalidate", "allocate")
+
+    def __init__(self, system_clock_ref, device_message_router, data_queue_size, tile_message_router, offchip_memory, num_pe_rows = 1, num_pe_cols = 1, vector_dot = False, cache_entries = 10000, cache_ways = 1, cache_line_size = 1, cache_replacement = "lru", cache_write_policy = None, tile_queue_size = 1):
+        # The tile's port holds data_queue_size Messages for each of its PEs.
+        Tile.__init__(self, system_clock_ref, device_message_router, data_queue_size*num_pe_rows*num_pe_cols)
+
+        # If True, a DOT is dispatched as a single vector PECmd instead of one PECmd per MAC.
+        self._vector_dot = vector_dot
 
         # Handling TilePacket Requests
         self._tile_message_processor_queue = list()
         self._tile_message_router = tile_message_router
-        self._tile_message_router.add_connection(self)
+        self._tile_queue_size = tile_queue_size
+        self._tile_message_router.add_connection(self, tile_queue_size)
         self._offchip_memory = offchip_memory
  
         # From the initialization parameters, 
         self._num_pe_rows = num_pe_rows
         self._num_pe_cols = num_pe_cols
-        self._pe_grid = [[NioPE(self._system_clock_ref, device_message_router)]*self._num_pe_cols for i in range(self._num_pe_rows)]
+        self._pe_grid = [[NioPE(self._system_clock_ref, device_message_router) for j in range(self._num_pe_cols)] for i in range(self._num_pe_rows)]
+        self._pes = flatten(self._pe_grid)
+        self._pe_index = {pe : index for index, pe in enumerate(self._pes)}
 
         # Only process 1 tile at a time. 
         self._tile_message = None
@@ -49,22 +58,53 @@ class NioTile(Tile):
         # Handle Bias Carefully:
         self._bias_map = dict()
 
+        # The output of the tile command being computed (a DOT with affine accesses covers several outputs),
+        # and the addresses it reads and writes.
+        self._output_index = 0
+        self._num_outputs = 1
+        self._col_addrs = None
+        self._row_addrs = None
+        self._bias = None
+        self._res_addr = None
+
+        # Every transaction this tile starts is stamped with the next integer.
+        self._next_transaction_id = 0
+
         # For read and writes to memory.
+        # (Responses are keyed by (message_id, seq_num), and counted until they have all arrived.)
         self._reads_to_send = list()
         self._read_responses = dict()
-
-        self._dispatch_queue = list()
+        self._reads_outstanding = 0
+        # The address of each line being filled (by a miss) -> a dict of: words (read so far), pending (reads),
+        # waiting (the reads of operands in the line) and stale (the words written since they were read).
+        self._line_fills = dict()
+        # The (message_id, seq_num) of each read which only fills a line -> the address of the line.
+        self._fill_reads = dict()
+
+        # The PE commands to send to each PE (in order), and the last result of each PE.
+        self._dispatch_queues = [list() for pe in self._pes]
         self._dispatch_queue_ack = dict()
+        self._dispatches_outstanding = 0
+        self._partial_sums = [None]*len(self._pes)
 
         self._writes_to_send = list()
         self._writes_responses = dict()
+        self._writes_outstanding = 0
 
         self._tile_ack = None
 
         self._current_stage = self.IDLE
         self._next_stage = self.IDLE
 
-        self._cache = Cache(10000)
+        self._cache = Cache(cache_entries, cache_ways, cache_line_size, cache_replacement)
+        self._cache_line_size = cache_line_size
+
+        # How the cache treats writes to the memory (see Nio): None, "invalidate" or "allocate".
+        if cache_write_policy not in self.CACHE_WRITE_POLICIES:
+            raise ValueError("Please choose a supported cache write policy: "+str(self.CACHE_WRITE_POLICIES))
+        self._cache_write_policy = cache_write_policy
+        if cache_write_policy is not None:
+            self._offchip_memory.add_snooper(self)
 
 
     def load_cache(self, address_list):
@@ -74,6 +114,103 @@ class NioTile(Tile):
     def evict_cache_lines(self):
         self._cache.clear()
 
+    def cache_size(self):
+        return self._cache.size()
+
+    def cache_statistics(self):
+        return self._cache.statistics()
+
+    def snoop_write(self, address, length, writer):
+        ''' snoop_write: Keeps the cache coherent with a write to the memory (see Memory.add_snooper).
+        With the "allocate" write policy, the tile's own writes are already in its cache. The words of a
+        line being filled which were written are not installed (they may have been read before the write).
+        '''
+        for line_address, fill in self._line_fills.items():
+            first = line_address*self._cache_line_size
+            fill["stale"].update(range(max(first, address), min(first + self._cache_line_size, address + length)))
+
+        if writer is self and self._cache_write_policy == "allocate":
+            return
+        self._cache.invalidate(address, length)
+
+    def pe_pipeline_depth(self):
+        return self._pes[0].pipeline_depth()
+
+    def num_pes(self):
+        return len(self._pes)
+
+    def tile_queue_size(self):
+        return self._tile_queue_size
+
+    def _transaction_id(self):
+        transaction_id = self._next_transaction_id
+        self._next_transaction_id += 1
+        return transaction_id
+
+    def _send_read(self, message_id, seq_num, addr, fill = False):
+        attributes = {
+            "addr" : int(addr)
+        }
+        if fill:
+            attributes["fill"] = True
+            self._fill_reads[(message_id, seq_num)] = self._cache.line_address(addr)
+        else:
+            self._read_responses[(message_id, seq_num)] = None
+        self._reads_to_send.append(self._message_pool.message(self, self._offchip_memory, Message.MemRead, message_id, seq_num, attributes=attributes))
+        self._reads_outstanding += 1
+
+    def _read_operand(self, message_id, seq_num, addr):
+        ''' _read_operand: Reads an operand from the cache, or else from the memory. On a miss, the rest of the
+        line is read too (a read per word); an operand whose line is already being filled waits for the fill,
+        instead of reading the memory again.
+        '''
+        fill = self._line_fills.get(self._cache.line_address(addr))
+        if fill is not None:
+            self._read_responses[(message_id, seq_num)] = None
+            fill["waiting"].append((message_id, seq_num, addr))
+            return
+
+        contents = self._cache.lookup(addr)
+        if contents is not None:
+            self._read_responses[(message_id, seq_num)] = contents
+            return
+
+        self._send_read(message_id, seq_num, addr)
+        if self._cache_line_size > 1:
+            line_address = self._cache.line_address(addr)
+            self._line_fills[line_address] = {"words" : dict(), "pending" : self._cache_line_size, "waiting" : list(), "stale" : set()}
+            fill_stamp = self._transaction_id()
+            for offset, address in enumerate(self._cache.line_addresses(addr)):
+                if address != addr:
+                    self._send_read(fill_stamp, offset, address, fill=True)
+
+    def _fill_line(self, addr, contents):
+        ''' _fill_line: Installs a word read from the memory. A word of a line being filled is held until
+        every word of the line has been read; then the line is installed, and its words are handed to the
+        reads waiting on it.
+        '''
+        fill = self._line_fills.get(self._cache.line_address(addr)) if self._cache_line_size > 1 else None
+        if fill is None:
+            self._cache.install(addr, contents)
+            return
+
+        # (A word which cannot be read, e.g. outside the memory or never written, is read as None, and left invalid.)
+        if contents is not None and addr not in fill["stale"]:
+            fill["words"][addr] = contents
+        fill["pending"] -= 1
+        if fill["pending"] > 0:
+            return
+
+        del self._line_fills[self._cache.line_address(addr)]
+        if fill["words"]:
+            self._cache.install_line(fill["words"])
+        for message_id, seq_num, address in fill["waiting"]:
+            if address in fill["words"]:
+                self._read_responses[(message_id, seq_num)] = fill["words"][address]
+            else:
+                # (Read it from the memory, like any operand which misses.)
+                self._send_read(message_id, seq_num, address)
+
     def process(self):
 
 
@@ -93,58 +230,31 @@ class NioTile(Tile):
                 # Two operations require for the operators..
                 op1_addr = None
                 op2_addr = None
+                self._res_addr = msg.res_addr
 
+                msg_stamp = self._transaction_id()
                 if not hasattr(msg, "op1"):
-                    attributes = {
-                        "addr" : int(msg.op1_addr)
-                    }
-                    msg_stamp = uuid.uuid4()
-                    self._reads_to_send.append(Message(self, self._offchip_memory, Message.MemRead, msg_stamp, 1, attributes=attributes))
-                    self._read_responses[str(msg_stamp)+str(1)] = None
+                    self._send_read(msg_stamp, 1, msg.op1_addr)
                 else:
-                    self._read_responses["1"] = msg.op1
+                    self._read_responses[(None, 1)] = msg.op1
 
                 if not hasattr(msg, "op2"):
-                    attributes = {
-                        "addr" : int(msg.op2_addr)
-                    }                    
-                    msg_stamp = uuid.uuid4()
-                    self._reads_to_send.append(Message(self, self._offchip_memory, Message.MemRead, msg_stamp, 2, attributes=attributes))
-                    self._read_responses[str(msg_stamp)+str(2)] = None
+                    self._send_read(msg_stamp, 2, msg.op2_addr)
                 else:
-                    self._read_responses["2"] = msg.op2
+                    self._read_responses[(None, 2)] = msg.op2
 
             elif op in {Operator.DOT}:
-                for data_row in [msg.col_addrs, msg.row_addrs]:
-                    idx = 0
-                    msg_stamp = uuid.uuid4()
+                # Operands are numbered in the order they are dispatched: columns, rows, then the bias.
+                self._load_dot_addrs(msg)
+                msg_stamp = self._transaction_id()
+                idx = 0
+                for data_row in [self._col_addrs, self._row_addrs]:
                     for addr in data_row:
-                        contents = self._cache.lookup(addr)
-                        if contents is None:
-                            attributes = {
-                                "addr" : int(addr)
-                            }   
-                            self._reads_to_send.append(Message(self, self._offchip_memory, Message.MemRead, msg_stamp, idx, attributes=attributes))
-                            self._read_responses[str(msg_stamp)+str(idx)] = None
-                        else:
-                            self._read_responses[str(msg_stamp)+str(idx)] = contents
+                        self._read_operand(msg_stamp, idx, addr)
                         idx+=1
 
-                    if self._cache.lookup(msg.res_addr) is not None:
-                        raise ValueError("Cache will fail.")
-
-
-                if msg.bias is not None:
-                    contents = self._cache.lookup(msg.bias)
-                    if contents is None:                    
-                        attributes = {
-                            "addr" : int(msg.bias)
-                        }   
-                        msg_stamp = uuid.uuid4()                
-                        self._reads_to_send.append(Message(self, self._offchip_memory, Message.MemRead, msg_stamp, idx, attributes=attributes))
-                        self._read_responses[str(msg_stamp)+str(idx)] = None
-                    else:
-                        self._read_responses[str(msg_stamp)+str(idx)] = contents
+                if self._bias is not None:
+                    self._read_operand(msg_stamp, idx, self._bias)
 
             else:
                 raise ValueError("Unhandled operation during FETCH.")
@@ -156,19 +266,22 @@ class NioTile(Tile):
             self._next_stage = self.SEND_READS
             if self._reads_to_send:
                 message = self._reads_to_send[0]
-                if self._message_router.send(message):
+                if self._message_router.can_send(message.destination) and self._message_router.send(message):
                     self._reads_to_send.pop(0)
 
 
             if self._device_message is not None:
-                read_id = str(self._device_message.message_id) + str(self._device_message.seq_num)
-                if read_id not in self._read_responses:
-                    raise ValueError("Memory Read Response Mismatch. Received Message: "+read_id)
-                self._read_responses[read_id] = self._device_message.content
-                self._cache.install(self._device_message.addr, self._device_message.content)
+                read_id = (self._device_message.message_id, self._device_message.seq_num)
+                if self._fill_reads.pop(read_id, None) is None:
+                    if self._read_responses.get(read_id, False) is not None:
+                        raise ValueError("Memory Read Response Mismatch. Received Message: "+str(read_id))
+                    self._read_responses[read_id] = self._device_message.content
+                self._reads_outstanding -= 1
+                self._fill_line(self._device_message.addr, self._device_message.content)
+                self._message_pool.release(self._device_message)
                 self._device_message = None
 
-            if not self._reads_to_send and None not in self._read_responses.values():
+            if not self._reads_to_send and self._reads_outstanding == 0:
                 self._next_stage = self.DISPATCH_TO_PE
 
                 msg = self._tile_message
@@ -177,7 +290,7 @@ class NioTile(Tile):
 
                 if op in {Operator.ADD, Operator.MUL, Operator.SUB, Operator.DIV, Operator.MAX}:
 
-                    msg_stamp = uuid.uuid4()  
+                    msg_stamp = self._transaction_id()
                     attributes = {
                         "operation" : op,
                         "dtype" : msg.dtype
@@ -186,93 +299,82 @@ class NioTile(Tile):
                     for readout in self._read_responses.values():
                         attributes["op"+str(idx)] = readout
                         idx += 1
-                    self._dispatch_queue.append(Message(self, self._pe_grid[0][0], Message.PECmd, msg_stamp, attributes=attributes))                
-
-
-                elif op in {Operator.DOT}:              
-
-                    values = list(self._read_responses.values())
-                    for i in range(len(msg.col_addrs)):
-                        msg_stamp = uuid.uuid4() 
-                        attributes = {
-                            "operation" : Operator.CMAC if i == 0 else Operator.MAC,
-                            "dtype" : msg.dtype,
-                            "op1" : values[i],
-                            "op2" : values[i+len(msg.col_addrs)]
-                            }
-                        self._dispatch_queue.append(Message(self, self._pe_grid[0][0], Message.PECmd, msg_stamp, attributes=attributes))
-
-        
-                    if msg.bias is not None:
-                        msg_stamp = uuid.uuid4()
-                        attributes = {
-                            "operation" : Operator.MAC,
-                            "dtype" : msg.dtype,
-                            "op1" : values[-1],
-                            "op2" : float_to_int_repr_of_float(1)
-                            }
-                        self._dispatch_queue.append(Message(self, self._pe_grid[0][0], Message.PECmd, msg_stamp, attributes=attributes))
+                    self._dispatch_queues[0].append(self._message_pool.message(self, self._pes[0], Message.PECmd, msg_stamp, attributes=attributes))
+
+
+                elif op in {Operator.DOT}:
+                    self._dispatch_dot(msg.dtype)
+
                 else:
                     raise NotImplementedError("Unhandled operation: "+str(op))
 
         if self._current_stage == self.DISPATCH_TO_PE:
             self._next_stage = self.DISPATCH_TO_PE
-            if self._dispatch_queue:
-                message = self._dispatch_queue[0]
-                if self._message_router.send(message):
-                    self._dispatch_queue_ack[str(message.message_id)+str(message.seq_num)] = None
-                    self._dispatch_queue.pop(0)
-
-            last_message = None
-
-            if self._device_message is not None:
-                read_id = str(self._device_message.message_id) + str(self._device_message.seq_num)
-                if read_id not in self._dispatch_queue_ack:
-                    raise ValueError("PE Response Mismatch. Received Message: "+read_id)
+            # Each PE accepts one PE command per cycle.
+            for dispatch_queue in self._dispatch_queues:
+                if dispatch_queue:
+                    message = dispatch_queue[0]
+                    if self._message_router.can_send(message.destination) and self._message_router.send(message):
+                        self._dispatch_queue_ack[(message.message_id, message.seq_num)] = None
+                        self._dispatches_outstanding += 1
+                        dispatch_queue.pop(0)
+
+            while self._device_message is not None:
+                read_id = (self._device_message.message_id, self._device_message.seq_num)
+                if self._dispatch_queue_ack.get(read_id, False) is not None:
+                    raise ValueError("PE Response Mismatch. Received Message: "+str(read_id))
                 self._dispatch_queue_ack[read_id] = [self._device_message.result, self._device_message.seq_num]
-                last_message = self._device_message
-                self._device_message = None    
-
-
-            if not self._dispatch_queue and None not in self._dispatch_queue_ack.values():
-                self._next_stage = self.WRITE_BACK
-                attributes = {
-                    "dtype" : self._tile_message.dtype,
-                    "content" : float_to_int_repr_of_float(last_message.result),
-                    "addr" : int(self._tile_message.res_addr)
-                    }
-                msg_stamp = uuid.uuid4()                    
-                self._writes_to_send.append(Message(self, self._offchip_memory, Message.MemWrite, msg_stamp, attributes=attributes))                
+                self._dispatches_outstanding -= 1
+                self._partial_sums[self._pe_index[self._device_message.source]] = self._device_message.result
+                self._message_pool.release(self._device_message)
+                self._device_message = None
+                # With several PEs, the responses of every PE are collected in the same cycle.
+                if len(self._pes) > 1:
+                    self._fetch_comm_messages()
+
+            if self._dispatches_outstanding == 0 and not any(self._dispatch_queues):
+                partial_sums = [partial_sum for partial_sum in self._partial_sums if partial_sum is not None]
+                if len(partial_sums) > 1:
+                    self._dispatch_reduction(partial_sums)
+                else:
+                    self._write_back(partial_sums[0])
 
-        if self._current_stage == self.WRITE_BACK:            
+        if self._current_stage == self.WRITE_BACK:
             self._next_stage = self.WRITE_BACK
             if self._writes_to_send:
                 message = self._writes_to_send[0]
-                if self._message_router.send(message):
-                    self._writes_responses[str(message.message_id)+str(message.seq_num)] = None
+                if self._message_router.can_send(message.destination) and self._message_router.send(message):
+                    self._writes_responses[(message.message_id, message.seq_num)] = None
+                    self._writes_outstanding += 1
                     self._writes_to_send.pop(0)
 
             if self._device_message is not None:
-                read_id = str(self._device_message.message_id) + str(self._device_message.seq_num)
-                if read_id not in self._writes_responses:
-                    raise ValueError("Memory Write Response Mismatch. Received Message: "+read_id)
+                read_id = (self._device_message.message_id, self._device_message.seq_num)
+                if self._writes_responses.get(read_id, False) is not None:
+                    raise ValueError("Memory Write Response Mismatch. Received Message: "+str(read_id))
                 self._writes_responses[read_id] = True
+                self._writes_outstanding -= 1
+                self._message_pool.release(self._device_message)
                 self._device_message = None
 
-            if None not in self._writes_responses.values() and not self._writes_to_send:
-                self._next_stage = self.SEND_ACK
-                self._tile_ack = Message(self, self._tile_message.source , Message.TileDone, self._tile_message.message_id)
+            if self._writes_outstanding == 0 and not self._writes_to_send:
+                self._output_index += 1
+                if self._output_index < self._num_outputs:
+                    # Move on to the next output of the tile command.
+                    self._clear_transaction()
+                    self._next_stage = self.FETCH
+                else:
+                    self._next_stage = self.SEND_ACK
+                    self._tile_ack = Message(self, self._tile_message.source , Message.TileDone, self._tile_message.message_id)
 
         if self._current_stage == self.SEND_ACK:
             self._next_stage = self.SEND_ACK
-            if self._tile_message_router.send(self._tile_ack):
+            if self._tile_message_router.can_send(self._tile_ack.destination) and self._tile_message_router.send(self._tile_ack):
                 self._current_stage = self.IDLE
 
         if self._current_stage == self.IDLE:
             # Clear out state from last transaction.            
-            self._read_responses = dict()
-            self._dispatch_queue_ack = dict()
-            self._writes_responses = dict()
+            self._clear_transaction()
             self._tile_ack = None
 
             # Fetch a tile-packet.
@@ -280,8 +382,178 @@ class NioTile(Tile):
                 self._next_stage = self.IDLE
                 return
             # Otherwise, continue on to the next stage.
+            self._output_index = 0
+            self._num_outputs = self._tile_message.res_access.num_outputs() if hasattr(self._tile_message, "res_access") else 1
             self._next_stage = self.FETCH
 
+    def _dispatch_dot(self, dtype):
+        ''' _dispatch_dot: Splits the DOT of the current output across the PEs: each PE accumulates the products
+        of a contiguous chunk of the operands (the last one also adds the bias), and their partial sums
+        are then reduced (see _dispatch_reduction).
+        '''
+        values = list(self._read_responses.values())
+        num_macs = len(self._col_addrs)
+        chunk = max(1, -(-num_macs // len(self._pes)))
+        starts = list(range(0, num_macs, chunk)) or [0]
+        if self._vector_dot:
+            operands = np.array(values, dtype=np.uint32).view(np.float32)
+
+        for index, start in enumerate(starts):
+            pe = self._pes[index]
+            stop = min(start + chunk, num_macs)
+            add_bias = self._bias is not None and index == len(starts) - 1
+
+            if self._vector_dot:
+                msg_stamp = self._transaction_id()
+                attributes = {
+                    "operation" : Operator.DOT,
+                    "dtype" : dtype,
+                    "op1" : operands[start:stop],
+                    "op2" : operands[num_macs+start:num_macs+stop],
+                    # Charge the PE for every MAC (and the bias MAC) of the scalar sequence.
+                    "num_beats" : stop - start
+                    }
+                if add_bias:
+                    attributes["op3"] = values[-1]
+                    attributes["num_beats"] += 1
+                self._dispatch_queues[index].append(self._message_pool.message(self, pe, Message.PECmd, msg_stamp, attributes=attributes))
+                continue
+
+            for i in range(start, stop):
+                msg_stamp = self._transaction_id()
+                attributes = {
+                    "operation" : Operator.CMAC if i == start else Operator.MAC,
+                    "dtype" : dtype,
+                    "op1" : values[i],
+                    "op2" : values[i+num_macs]
+                    }
+                self._dispatch_queues[index].append(self._message_pool.message(self, pe, Message.PECmd, msg_stamp, attributes=attributes))
+
+            if add_bias:
+                msg_stamp = self._transaction_id()
+                attributes = {
+                    "operation" : Operator.MAC,
+                    "dtype" : dtype,
+                    "op1" : values[-1],
+                    "op2" : float_to_int_repr_of_float(1)
+                    }
+                self._dispatch_queues[index].append(self._message_pool.message(self, pe, Message.PECmd, msg_stamp, attributes=attributes))
+
+    def _dispatch_reduction(self, partial_sums):
+        ''' _dispatch_reduction: Adds the partial sums of the PEs in pairs (a pair per PE), as a level of
+        a reduction tree. An unpaired partial sum is carried over to the next level.
+        '''
+        self._partial_sums = [None]*len(self._pes)
+        for index in range(len(partial_sums) // 2):
+            msg_stamp = self._transaction_id()
+            attributes = {
+                "operation" : Operator.ADD,
+                "dtype" : self._tile_message.dtype,
+                "op1" : float_to_int_repr_of_float(partial_sums[2*index]),
+                "op2" : float_to_int_repr_of_float(partial_sums[2*index + 1])
+                }
+            self._dispatch_queues[index].append(self._message_pool.message(self, self._pes[index], Message.PECmd, msg_stamp, attributes=attributes))
+
+        if len(partial_sums) % 2:
+            self._partial_sums[len(partial_sums) // 2] = partial_sums[-1]
+
+    def _write_back(self, result):
+        self._next_stage = self.WRITE_BACK
+        attributes = {
+            "dtype" : self._tile_message.dtype,
+            "content" : float_to_int_repr_of_float(result),
+            "addr" : int(self._res_addr)
+            }
+        msg_stamp = self._transaction_id()
+        self._writes_to_send.append(self._message_pool.message(self, self._offchip_memory, Message.MemWrite, msg_stamp, attributes=attributes))
+        if self._cache_write_policy == "allocate":
+            self._cache.install(attributes["addr"], attributes["content"])
+        elif self._cache_write_policy is None:
+            # (Without a write policy, the cache is not told of writes, so the tile drops its own result
+            # from it: a line filled by an operand may hold it.)
+            self._cache.invalidate(attributes["addr"])
+
+    def _clear_transaction(self):
+        self._read_responses = dict()
+        self._reads_outstanding = 0
+        self._line_fills = dict()
+        self._fill_reads = dict()
+        self._dispatch_queue_ack = dict()
+        self._dispatches_outstanding = 0
+        self._partial_sums = [None]*len(self._pes)
+        self._writes_responses = dict()
+        self._writes_outstanding = 0
+
+    def _load_dot_addrs(self, msg):
+        ''' _load_dot_addrs: Sets the addresses which the current output of a DOT reads and writes
+        (expanding the affine accesses of the tile command, if it has them).
+        '''
+        if hasattr(msg, "col_access"):
+            self._col_addrs = msg.col_access.addresses(self._output_index)
+            self._row_addrs = msg.row_access.addresses(self._output_index)
+            self._res_addr = msg.res_access.addresses(self._output_index)[0]
+            self._bias = msg.bias_access.addresses(self._output_index)[0] if hasattr(msg, "bias_access") else None
+            return
+
+        # (The addresses of a TileCommandBuffer's commands are int64 arrays.)
+        self._col_addrs = msg.col_addrs.tolist() if isinstance(msg.col_addrs, np.ndarray) else msg.col_addrs
+        self._row_addrs = msg.row_addrs.tolist() if isinstance(msg.row_addrs, np.ndarray) else msg.row_addrs
+        self._res_addr = msg.res_addr
+        self._bias = msg.bias
+
+    def is_idle(self):
+        ''' is_idle: A tile is idle if it is waiting on a response which has not yet arrived,
+        or if it has no tile command to work on (and its PEs are idle).
+        '''
+        return self._waiting_for_work() and all(pe.is_idle() for pe in self._pes)
+
+    def next_event_cycle(self):
+        ''' next_event_cycle: The next cycle in which the tile, or one of its PEs, has work to do
+        (e.g., while the tile waits on its PEs, when the hold of a PE's vector operation ends).
+        '''
+        if not self._waiting_for_work():
+            return self._system_clock_ref.current_clock() + 1
+        events = [event for event in (pe.next_event_cycle() for pe in self._pes) if event is not None]
+        return min(events) if events else None
+
+    def fast_forward(self, cycles):
+        for pe in self._pes:
+            pe.fast_forward(cycles)
+
+    def _waiting_for_work(self):
+        ''' _waiting_for_work: Whether processing the tile (but not its PEs) in the current cycle would change nothing.
+        '''
+        if self._device_message is not None or self._message_router.pending(self):
+            return False
+
+        if self._next_stage == self.IDLE:
+            return not self._tile_message_router.pending(self)
+
+        if self._next_stage == self.SEND_READS:
+            return self._waiting(self._reads_to_send, self._reads_outstanding)
+
+        if self._next_stage == self.DISPATCH_TO_PE:
+            # Waiting on every PE which has PE commands left to send.
+            dispatch_queues = [dispatch_queue for dispatch_queue in self._dispatch_queues if dispatch_queue]
+            if dispatch_queues:
+                return not any(self._message_router.can_send(dispatch_queue[0].destination) for dispatch_queue in dispatch_queues)
+            return self._dispatches_outstanding > 0
+
+        if self._next_stage == self.WRITE_BACK:
+            return self._waiting(self._writes_to_send, self._writes_outstanding)
+
+        if self._next_stage == self.SEND_ACK:
+            return not self._tile_message_router.can_send(self._tile_ack.destination)
+
+        return False
+
+    def _waiting(self, messages_to_send, outstanding):
+        ''' _waiting: Whether the tile can only wait, for responses or (on a credit-based MessageRouter) for credits.
+        '''
+        if messages_to_send:
+            return not self._message_router.can_send(messages_to_send[0].destination)
+        return outstanding > 0
+
     def _fetch_comm_messages(self):
         if self._device_message is not None:
             return
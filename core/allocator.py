@@ -10,6 +10,11 @@ Author: Nicholas V. Giamblanco
 Date: June 16, 2021
 
 '''
+import bisect
+
+import numpy as np
+
+
 def num_high_bits(n):
   n = (n & 0x5555555555555555) + ((n & 0xAAAAAAAAAAAAAAAA) >> 1)
   n = (n & 0x3333333333333333) + ((n & 0xCCCCCCCCCCCCCCCC) >> 2)
@@ -28,7 +33,16 @@ class BitAlloc():
 
     '''
     def __init__(self, memory_size_in_bytes, min_request_size = 4):
+        self._configure(memory_size_in_bytes, min_request_size)
 
+        # This represents where bits are set.
+        self._bitmap = [0]*self._mapblocks
+        # This represents 
+        self._bit_alloc_size_map = dict()
+
+    def _configure(self, memory_size_in_bytes, min_request_size):
+        ''' Validates the arena, and derives the geometry of the bitmap.
+        '''
         if not isinstance(memory_size_in_bytes, int) or memory_size_in_bytes < 1:
             raise ValueError("memory_size_in_bytes must be a postive integer.")
 
@@ -59,10 +73,23 @@ class BitAlloc():
         self._bits_per_block = 32
         self._mapblocks = self._blocks//self._bits_per_block
 
-        # This represents where bits are set.
-        self._bitmap = [0]*self._mapblocks
-        # This represents 
-        self._bit_alloc_size_map = dict()
+    def _required_bits(self, num_bytes):
+        ''' The number of bits (i.e., factor-sized blocks) required to reserve num_bytes.
+        '''
+        if not isinstance(num_bytes, int) or num_bytes <= 0:
+            raise ValueError("num_bytes must be a positive integer")
+
+        # Force requested bytes to be at least self._factor.
+        nbytes = self._factor if num_bytes < self._factor else num_bytes
+
+        # 1. Compute if we are not within a boundary of self._factor
+        mod_res = nbytes&(self._factorless1);
+
+        # 2. If we wrap, add the extra FACTOR bytes to the div of nbytes.
+        num_required_bits = (nbytes - mod_res) >> self._shift_factor
+        if mod_res > 0:
+            num_required_bits += 1
+        return num_required_bits
 
 
     def show_map(self):
@@ -87,24 +114,12 @@ class BitAlloc():
             None (indicating the allocation failed)
         '''
 
-        if not isinstance(num_bytes, int) or num_bytes <= 0:
-            raise ValueError("num_bytes must be a positive integer")
-
         current_map = None
         cur_map_idx = None
 
-        # Force requested bytes to be at least self._factor.
-        nbytes = self._factor if num_bytes < self._factor else num_bytes
+        num_required_bits = self._required_bits(num_bytes)
         # Begin Searching the bitmap.
 
-        # 1. Compute if we are not within a boundary of self._factor
-        mod_res = nbytes&(self._factorless1);
-
-        # 2. If we wrap, add the extra FACTOR bytes to the div of nbytes.
-        num_required_bits = (nbytes - mod_res) >> self._shift_factor
-        if mod_res > 0:
-            num_required_bits += 1
-
         bits_acquired       = 0
         bitmap_start_bit    = 0
         bitmap_end_bit      = 0
@@ -189,4 +204,381 @@ class BitAlloc():
             real_bit_mod_res = (self._bits_per_block-1)
             self._bitmap[i] = current_map
 
-        del self._bit_alloc_size_map[bitmap_start_bit]
\ No newline at end of file
+        del self._bit_alloc_size_map[bitmap_start_bit]
+
+
+class ExtentAlloc(BitAlloc):
+    ''' ExtentAlloc: A Memory Allocator:
+
+        Behaves as BitAlloc (i.e., the same bit-vector view of the heap), but rather than scanning the bit-vector,
+        the free runs of bits ("extents") are indexed:
+        (1) free extents by their start and end (to merge neighbours on free),
+        (2) free extents sorted by (length, start), for best-fit lookups,
+        (3) a segment tree over the bit-vector (nodes are only created where the heap is fragmented), holding
+            the longest free run, and the free runs at either end of each segment, for first-fit lookups.
+        Both lookups (and the updates to each index) are logarithmic in the size of the heap.
+
+    Args:
+        memory_size_in_bytes: The number of bytes in the heap.
+        min_request_size: The number of bytes each bit represents (a power of 2).
+        fit: Either "first" (lowest address which fits, as BitAlloc does) or "best" (smallest extent which fits).
+    '''
+    def __init__(self, memory_size_in_bytes, min_request_size = 4, fit = "first"):
+        self._configure(memory_size_in_bytes, min_request_size)
+
+        if fit not in ("first", "best"):
+            raise ValueError("fit must be either 'first' or 'best'.")
+        self._fit = fit
+
+        self._num_bits = self._mapblocks*self._bits_per_block
+        self._bit_alloc_size_map = dict()
+
+        # Free extents: start -> length, and end -> start.
+        self._free_starts = dict()
+        self._free_ends = dict()
+        # Free extents, as sorted (length, start) pairs.
+        self._free_by_size = list()
+
+        # Node -> (longest free run, free run at the start, free run at the end).
+        # The root is node 1, and the children of node n are 2n and 2n+1.
+        self._tree = {1 : (self._num_bits, self._num_bits, self._num_bits)}
+
+        if self._num_bits > 0:
+            self._add_extent(0, self._num_bits)
+
+
+    def show_map(self):
+        '''
+         Displays the bitmap as a string.
+        '''
+        if self._num_bits == 0:
+            return ""
+        bitmap = 0
+        for start, length in self._bit_alloc_size_map.items():
+            bitmap |= ((1 << length) - 1) << (self._num_bits - start - length)
+        return '{0:0{1}X}'.format(bitmap, self._mapblocks*8)
+
+
+    def alloc(self, num_bytes):
+        ''' alloc: Requests an allocation be made, thereby reserving memory.
+
+        Args:
+            num_bytes: The number of bytes to reserve
+
+        Returns:
+            An integer representing the start of the allocated memory region
+                OR
+            None (indicating the allocation failed)
+        '''
+        num_required_bits = self._required_bits(num_bytes)
+
+        if self._fit == "first":
+            start = self._find_first(num_required_bits)
+            if start is None:
+                return None
+        else:
+            idx = bisect.bisect_left(self._free_by_size, (num_required_bits, -1))
+            if idx == len(self._free_by_size):
+                return None
+            start = self._free_by_size[idx][1]
+
+        # Allocations always begin at the start of a free extent.
+        length = self._free_starts[start]
+        self._remove_extent(start)
+        if length > num_required_bits:
+            self._add_extent(start + num_required_bits, length - num_required_bits)
+
+        self._assign(1, 0, self._num_bits, start, start + num_required_bits, True)
+        self._bit_alloc_size_map[start] = num_required_bits
+
+        return start << self._shift_factor
+
+
+    def free(self, addr):
+        ''' free: Releases the reservation of memory beginning at said address
+
+        Args:
+            addr: The number of bytes to reserve
+
+        '''
+        if not isinstance(addr, int) or addr < 0:
+            raise ValueError("addr must be a positive integer")
+
+        start = addr >> self._shift_factor
+        if start not in self._bit_alloc_size_map:
+            raise ValueError("Address was never part of an allocation")
+        length = self._bit_alloc_size_map.pop(start)
+
+        self._assign(1, 0, self._num_bits, start, start + length, False)
+
+        # Merge with the free extents on either side.
+        end = start + length
+        if start in self._free_ends:
+            left = self._free_ends[start]
+            length += self._free_starts[left]
+            self._remove_extent(left)
+            start = left
+        if end in self._free_starts:
+            length += self._free_starts[end]
+            self._remove_extent(end)
+
+        self._add_extent(start, length)
+
+
+    def _add_extent(self, start, length):
+        self._free_starts[start] = length
+        self._free_ends[start + length] = start
+        bisect.insort(self._free_by_size, (length, start))
+
+    def _remove_extent(self, start):
+        length = self._free_starts.pop(start)
+        del self._free_ends[start + length]
+        del self._free_by_size[bisect.bisect_left(self._free_by_size, (length, start))]
+
+    def _push(self, node, lo, mid, hi):
+        # A segment which is entirely free (or used) passes that on to its children.
+        longest = self._tree[node][0]
+        if longest == hi - lo:
+            self._tree[2*node] = (mid - lo, mid - lo, mid - lo)
+            self._tree[2*node+1] = (hi - mid, hi - mid, hi - mid)
+        elif longest == 0:
+            self._tree[2*node] = (0, 0, 0)
+            self._tree[2*node+1] = (0, 0, 0)
+
+    def _assign(self, node, lo, hi, start, end, used):
+        ''' Marks the bits [start, end) as used (or free) within the segment [lo, hi) of node.
+        '''
+        if end <= lo or hi <= start:
+            return
+
+        if start <= lo and hi <= end:
+            free = 0 if used else hi - lo
+            self._tree[node] = (free, free, free)
+            return
+
+        mid = (lo + hi) // 2
+        self._push(node, lo, mid, hi)
+        self._assign(2*node, lo, mid, start, end, used)
+        self._assign(2*node+1, mid, hi, start, end, used)
+
+        left = self._tree[2*node]
+        right = self._tree[2*node+1]
+        prefix = left[1] if left[1] < mid - lo else mid - lo + right[1]
+        suffix = right[2] if right[2] < hi - mid else hi - mid + left[2]
+        longest = max(left[0], right[0], left[2] + right[1])
+        self._tree[node] = (longest, prefix, suffix)
+
+        # Uniform segments do not need their children.
+        if longest == 0 or longest == hi - lo:
+            del self._tree[2*node]
+            del self._tree[2*node+1]
+
+    def _find_first(self, num_bits):
+        ''' Returns the lowest bit which begins a free run of num_bits, or None.
+        '''
+        node, lo, hi = 1, 0, self._num_bits
+        if self._num_bits == 0 or self._tree[node][0] < num_bits:
+            return None
+
+        while True:
+            if self._tree[node][0] == hi - lo:
+                return lo
+            mid = (lo + hi) // 2
+            self._push(node, lo, mid, hi)
+            left = self._tree[2*node]
+            if left[0] >= num_bits:
+                node, hi = 2*node, mid
+                continue
+            right = self._tree[2*node+1]
+            if left[2] + right[1] >= num_bits:
+                return mid - left[2]
+            node, lo = 2*node+1, mid
+
+
+
+class NumpyBitAlloc(BitAlloc):
+    ''' NumpyBitAlloc: A Memory Allocator:
+
+        Behaves as BitAlloc (first-fit over the same bit-vector), but holds the bit-vector as a NumPy array of
+        64-bit words (bit 0 is the most-significant bit of word 0), and searches it a word at a time:
+        (1) runs within a word are found by AND-ing the free bits with shifted copies of themselves,
+        (2) runs across words combine the free bits at the end of one word, any number of fully free words,
+            and the free bits at the start of the next.
+        Reserving and releasing a run of bits sets or clears whole words with a slice assignment.
+
+    Args:
+        memory_size_in_bytes: The number of bytes in the heap.
+        min_request_size: The number of bytes each bit represents (a power of 2).
+    '''
+
+    # The number of words searched at first; each following search doubles this.
+    SEARCH_WORDS = 4096
+
+    def __init__(self, memory_size_in_bytes, min_request_size = 4):
+        self._configure(memory_size_in_bytes, min_request_size)
+
+        self._num_bits = self._mapblocks*self._bits_per_block
+        self._bitmap = np.zeros((self._num_bits + 63) // 64, dtype=np.uint64)
+        self._bit_alloc_size_map = dict()
+        # No word before this one has a free bit.
+        self._first_free_word = 0
+
+        # Bits past the end of the heap (in the last word) are never free.
+        if self._num_bits % 64:
+            self._bitmap[-1] = np.uint64((1 << (64 - self._num_bits % 64)) - 1)
+
+
+    def show_map(self):
+        '''
+         Displays the bitmap as a string.
+        '''
+        bitmap_string = "".join(['{0:016X}'.format(int(word)) for word in self._bitmap])
+        return bitmap_string[:self._mapblocks*8]
+
+
+    def alloc(self, num_bytes):
+        ''' alloc: Requests an allocation be made, thereby reserving memory.
+
+        Args:
+            num_bytes: The number of bytes to reserve
+
+        Returns:
+            An integer representing the start of the allocated memory region
+                OR
+            None (indicating the allocation failed)
+        '''
+        num_required_bits = self._required_bits(num_bytes)
+
+        start = self._find_first(num_required_bits)
+        if start is None:
+            return None
+
+        self._set_bits(start, num_required_bits, True)
+        self._bit_alloc_size_map[start] = num_required_bits
+        return start << self._shift_factor
+
+
+    def free(self, addr):
+        ''' free: Releases the reservation of memory beginning at said address
+
+        Args:
+            addr: The number of bytes to reserve
+
+        '''
+        if not isinstance(addr, int) or addr < 0:
+            raise ValueError("addr must be a positive integer")
+
+        start = addr >> self._shift_factor
+        if start not in self._bit_alloc_size_map:
+            raise ValueError("Address was never part of an allocation")
+
+        self._set_bits(start, self._bit_alloc_size_map.pop(start), False)
+        self._first_free_word = min(self._first_free_word, start >> 6)
+
+
+    def _set_bits(self, start, num_bits, used):
+        end = start + num_bits
+        first_word, last_word = start >> 6, (end - 1) >> 6
+
+        for word in sorted({first_word, last_word}):
+            lo = max(start, word << 6) & 63
+            hi = min(end, (word + 1) << 6) - (word << 6)
+            mask = np.uint64(((1 << (hi - lo)) - 1) << (64 - hi))
+            if used:
+                self._bitmap[word] |= mask
+            else:
+                self._bitmap[word] &= ~mask
+
+        if last_word - first_word > 1:
+            self._bitmap[first_word+1:last_word] = np.uint64(0xFFFFFFFFFFFFFFFF) if used else np.uint64(0)
+
+
+    @staticmethod
+    def _bit_length(words):
+        # Split each word in halves, which floats represent exactly.
+        high = np.frexp((words >> np.uint64(32)).astype(np.float64))[1]
+        low = np.frexp((words & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+        return np.where(high > 0, high + 32, low)
+
+
+    def _find_first(self, num_bits):
+        ''' Returns the lowest bit which begins a free run of num_bits, or None.
+        '''
+        # The free run which ends where the previous search stopped.
+        carry = 0
+        begin = self._first_free_word
+        search_words = self.SEARCH_WORDS
+        while begin < len(self._bitmap):
+            words = self._bitmap[begin:begin+search_words]
+            candidates = list()
+
+            # Skip words without a free bit, which end every free run.
+            not_full = np.flatnonzero(words != np.uint64(0xFFFFFFFFFFFFFFFF))
+            if not len(not_full):
+                if begin == self._first_free_word:
+                    self._first_free_word += len(words)
+                carry = 0
+                begin += len(words)
+                search_words *= 2
+                continue
+            if begin == self._first_free_word:
+                self._first_free_word += int(not_full[0])
+
+            # (1) Runs within a word: a set bit marks the start of num_bits free bits.
+            if num_bits <= 64:
+                runs = ~words
+                length = 1
+                while length < num_bits:
+                    shift = min(length, num_bits - length)
+                    runs = runs & (runs << np.uint64(shift))
+                    length += shift
+                hits = np.flatnonzero(runs)
+                if len(hits):
+                    word = hits[0]
+                    candidates.append(((begin + int(word)) << 6) + 64 - int(self._bit_length(runs[word:word+1])[0]))
+
+            # (2) Runs across words: free bits at the end of the previous words, then at the start of this one.
+            # Only words which are partly used need their bits counted.
+            leading = np.where(words == 0, 64, 0)
+            trailing = leading.copy()
+            partial = not_full[words[not_full] != 0]
+            leading[partial] = 64 - self._bit_length(words[partial])
+            trailing[partial] = self._bit_length(words[partial] & (~words[partial] + np.uint64(1))) - 1
+
+            index = np.arange(len(words))
+            last_used = np.maximum.accumulate(np.where(words != 0, index, -1))
+            ending = np.where(last_used >= 0, trailing[np.maximum(last_used, 0)] + 64*(index - last_used), carry + 64*(index + 1))
+            before = np.concatenate(([carry], ending[:-1]))
+
+            hits = np.flatnonzero((before > 0) & (before + leading >= num_bits))
+            if len(hits):
+                word = hits[0]
+                candidates.append(((begin + int(word)) << 6) - int(before[word]))
+
+            if candidates:
+                return min(candidates)
+
+            carry = int(ending[-1])
+            begin += len(words)
+            search_words *= 2
+
+        return None
+
+
+def build_allocator(name, memory_size_in_bytes, min_request_size = 4):
+    ''' build_allocator: Builds an allocator by name.
+
+    Args:
+        name: "bitmap" (BitAlloc), "numpy" (NumpyBitAlloc), "first_fit" or "best_fit" (ExtentAlloc).
+        memory_size_in_bytes: The number of bytes in the heap.
+        min_request_size: The number of bytes each bit represents (a power of 2).
+    '''
+    if name == "bitmap":
+        return BitAlloc(memory_size_in_bytes, min_request_size)
+    if name == "numpy":
+        return NumpyBitAlloc(memory_size_in_bytes, min_request_size)
+    if name == "first_fit":
+        return ExtentAlloc(memory_size_in_bytes, min_request_size, "first")
+    if name == "best_fit":
+        return ExtentAlloc(memory_size_in_bytes, min_request_size, "best")
+    raise ValueError("Unknown allocator: "+str(name))
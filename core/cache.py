@@ -1,32 +1,221 @@
 ''' cache.py
 
-Implements a very basic cache, with NO write-back (this cache should ONLY be used for caching inputs), 
-and does not implement a replacement policy (e.g., LRU)
+Implements a set-associative cache, with NO write-back (this cache should ONLY be used for caching inputs).
 
 NOTE:
-	This should be improved. A true cache-block should be designed.
+	Each line keeps a valid bit per word: install_line fills a whole line (e.g., on a miss), while install
+	only installs one word (e.g., a write), but allocates (and so may evict) the whole line.
 
 '''
 
+from collections import OrderedDict
+
 
 class Cache:
+	''' Cache: A set-associative cache of words, with a configurable replacement policy.
+
+	Notes:
+		An address belongs to line address//line_size, which maps to set line%num_sets.
+		The defaults (1 way of 1 word) are a direct-mapped cache with an entry per word.
+		Lookups and installs are counted as hits, misses and evictions (see statistics), and
+		invalidate counts the cached words it drops as invalidations.
+
+	Args:
+		num_entries: The number of words the cache holds.
+		num_ways: The number of lines in each set.
+		line_size: The number of words in each line.
+		replacement: The line of a full set to evict: "lru" (least recently used), "plru" (tree pseudo-LRU;
+		             num_ways must be a power of 2) or "fifo" (first installed).
+
+	Returns:
+		A Cache object.
+	'''
+
+	REPLACEMENT_POLICIES = ("lru", "plru", "fifo")
+
+	def __init__(self, num_entries, num_ways = 1, line_size = 1, replacement = "lru"):
+		if num_ways < 1 or line_size < 1:
+			raise ValueError("A Cache needs at least 1 way, and at least 1 word per line.")
+
+		if num_entries < num_ways*line_size or num_entries % (num_ways*line_size) != 0:
+			raise ValueError("The entries of a Cache must be a multiple of its ways times its line size.")
+
+		if replacement not in self.REPLACEMENT_POLICIES:
+			raise ValueError("Please choose a supported replacement policy: "+str(self.REPLACEMENT_POLICIES))
+
+		if replacement == "plru" and num_ways & (num_ways - 1) != 0:
+			raise ValueError("A pseudo-LRU Cache needs a power of 2 ways.")
 
-	def __init__(self, num_entries):
 		self._num_entries = num_entries
-		self._cache = [{None: None}]*num_entries
+		self._num_ways = num_ways
+		self._line_size = line_size
+		self._num_sets = num_entries // (num_ways*line_size)
+		self._replacement = replacement
+
+		self._num_hits = 0
+		self._num_misses = 0
+		self._num_evictions = 0
+		self._num_invalidations = 0
+
+		self.clear()
 
 	def lookup(self, address):
-		cache_idx = address%self._num_entries
-		if address not in self._cache[cache_idx]:
+		line_address = address // self._line_size
+		cache_set = self._sets[line_address % self._num_sets]
+		line = cache_set.get(line_address)
+		if line is None or address not in line:
+			self._num_misses += 1
 			return None
-		return self._cache[cache_idx][address]
 
+		self._num_hits += 1
+		self._touch(line_address % self._num_sets, line_address)
+		return line[address]
+
+	def contains(self, address):
+		''' contains: Whether address is cached, without counting it as a lookup (or updating the replacement state).
+		'''
+		line = self._sets[(address // self._line_size) % self._num_sets].get(address // self._line_size)
+		return line is not None and address in line
 
 	def install(self, address, contents):
-		cache_idx = address%self._num_entries
-		self._cache[cache_idx] = dict()
-		self._cache[cache_idx][address] = contents
+		self.install_line({address : contents})
+
+	def install_line(self, words):
+		''' install_line: Installs the words of a line at once (words missing from it are left invalid).
+
+		Args:
+			words: A dict of each address (all in the same line) to its contents.
+		'''
+		line_address = next(iter(words)) // self._line_size
+		set_index = line_address % self._num_sets
+		cache_set = self._sets[set_index]
+
+		line = cache_set.get(line_address)
+		if line is None:
+			line = self._allocate(set_index, line_address)
+		line.update(words)
+		self._touch(set_index, line_address)
+
+	def line_address(self, address):
+		return address // self._line_size
+
+	def line_addresses(self, address):
+		''' line_addresses: The addresses of the words in the line of address.
+		'''
+		first = address - address % self._line_size
+		return range(first, first + self._line_size)
+
+	def invalidate(self, address, length = 1):
+		''' invalidate: Drops the cached words of addresses [address, address+length) (e.g., because they were written).
+		'''
+		first_line = address // self._line_size
+		last_line = (address + length - 1) // self._line_size
+		if last_line - first_line < self._num_sets*self._num_ways:
+			for line_address in range(first_line, last_line + 1):
+				if line_address in self._sets[line_address % self._num_sets]:
+					self._drop_words(line_address % self._num_sets, line_address, address, address + length)
+			return
+
+		# The range spans more lines than the cache holds: look at the cached lines instead.
+		for set_index, cache_set in enumerate(self._sets):
+			for line_address in [line_address for line_address in cache_set if first_line <= line_address <= last_line]:
+				self._drop_words(set_index, line_address, address, address + length)
+
+	def _drop_words(self, set_index, line_address, start, stop):
+		cache_set = self._sets[set_index]
+		line = cache_set[line_address]
+		for word in [word for word in line if start <= word < stop]:
+			del line[word]
+			self._num_invalidations += 1
+
+		if not line:
+			del cache_set[line_address]
+			if self._replacement == "plru":
+				ways = self._plru_ways[set_index]
+				ways[ways.index(line_address)] = None
+
+	def _allocate(self, set_index, line_address):
+		cache_set = self._sets[set_index]
+
+		if self._replacement == "plru":
+			ways = self._plru_ways[set_index]
+			if len(cache_set) < self._num_ways:
+				way = ways.index(None)
+			else:
+				way = self._plru_victim(set_index)
+				del cache_set[ways[way]]
+				self._num_evictions += 1
+			ways[way] = line_address
+
+		elif len(cache_set) == self._num_ways:
+			# The least recently used (or, for FIFO, the first installed) line is first.
+			cache_set.popitem(last=False)
+			self._num_evictions += 1
+
+		line = dict()
+		cache_set[line_address] = line
+		return line
+
+	def _touch(self, set_index, line_address):
+		if self._num_ways == 1:
+			return
+
+		if self._replacement == "lru":
+			self._sets[set_index].move_to_end(line_address)
+
+		elif self._replacement == "plru":
+			# Point every node on the path to the way away from it.
+			bits = self._plru_bits[set_index]
+			way = self._plru_ways[set_index].index(line_address)
+			node = 0
+			low = 0
+			high = self._num_ways
+			while high - low > 1:
+				middle = (low + high) // 2
+				if way < middle:
+					bits[node] = 1
+					node = 2*node + 1
+					high = middle
+				else:
+					bits[node] = 0
+					node = 2*node + 2
+					low = middle
+
+	def _plru_victim(self, set_index):
+		bits = self._plru_bits[set_index]
+		node = 0
+		low = 0
+		high = self._num_ways
+		while high - low > 1:
+			middle = (low + high) // 2
+			if bits[node]:
+				node = 2*node + 2
+				low = middle
+			else:
+				node = 2*node + 1
+				high = middle
+		return low
+
+	def size(self):
+		return self._num_entries
+
+	def statistics(self):
+		''' statistics: Reports the lookups which hit and missed, the lines evicted to make room for others,
+		and the words invalidated.
 
+		Returns:
+			A dict of: hits, misses, evictions, invalidations
+		'''
+		return {
+			"hits" : self._num_hits,
+			"misses" : self._num_misses,
+			"evictions" : self._num_evictions,
+			"invalidations" : self._num_invalidations
+		}
 
 	def clear(self):
-		self._cache = [{None: None}]*self._num_entries
+		# Each set maps the address of each of its lines to the line's words (ordered from least to most recently used).
+		self._sets = [OrderedDict() for i in range(self._num_sets)]
+		if self._replacement == "plru":
+			self._plru_ways = [[None]*self._num_ways for i in range(self._num_sets)]
+			self._plru_bits = [[0]*(self._num_ways - 1) for i in range(self._num_sets)]
@@ -26,6 +26,17 @@ class Clock:
 		'''
 		self._clock += 1
 
+	def advance(self, cycles):
+		''' advance will increment the clock count by several cycles at once.
+
+		Note:
+			Only event-driven systems should advance the clock, and only across
+			cycles in which no device has any work in flight.
+		'''
+		if not isinstance(cycles, int) or cycles < 0:
+			raise ValueError("The clock can only be advanced by a non-negative integer.")
+		self._clock += cycles
+
 	def current_clock(self):
 		''' Returns the current clock count.
 		'''
@@ -0,0 +1,179 @@
+''' command_buffer.py: Compact forms (a struct-of-arrays store, and affine access descriptors) for the DOT tile commands of a layer.
+
+'''
+
+import os
+
+import numpy as np
+
+from core.defines import Operator
+from core.messaging import Message
+
+
+class TileCommandBuffer:
+    ''' TileCommandBuffer: Holds the tile commands of a layer as one NumPy structured array (a record per command),
+    and the addresses they read as one flat int64 address pool.
+
+    Notes:
+        The column (row) addresses of command i are pool[col_offset:col_offset+length] + col_base
+        (pool[row_offset:row_offset+length] + row_base). Commands which read the same pattern of addresses
+        (e.g., the window of an output position, for every feature map and batch) share one run of the pool
+        and only differ in their base, so the pool is a small fraction of the addresses the layer reads.
+        A command without a bias has a bias of NO_BIAS.
+
+    Args:
+        num_commands: The number of tile commands; the records start zeroed (as DOTs, without a bias),
+                      and are filled in by the operator through `commands`.
+        addresses: The address pool of the layer (converted to int64).
+        dtype: The dtype of the results of every tile command.
+
+    Returns:
+        A TileCommandBuffer object.
+    '''
+
+    COMMAND_DTYPE = np.dtype([
+        ("operation", np.int8),
+        ("res_addr", np.int64),
+        ("bias", np.int64),
+        ("col_offset", np.int64),
+        ("col_base", np.int64),
+        ("row_offset", np.int64),
+        ("row_base", np.int64),
+        ("length", np.int64),
+    ])
+
+    NO_BIAS = -1
+
+    RECORDS_PER_CHUNK = 4096
+
+    def __init__(self, num_commands, addresses, dtype):
+        self.commands = np.zeros(num_commands, dtype=self.COMMAND_DTYPE)
+        self.commands["operation"] = Operator.DOT.value
+        self.commands["bias"] = self.NO_BIAS
+        self.addresses = np.ascontiguousarray(addresses, dtype=np.int64)
+        self.dtype = dtype
+
+    def __len__(self):
+        return len(self.commands)
+
+    def save(self, directory):
+        ''' save: Writes the command records and the address pool to directory (as .npy files).
+        '''
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "commands.npy"), self.commands)
+        np.save(os.path.join(directory, "addresses.npy"), self.addresses)
+        # The dtype of the results is kept as an empty array of it.
+        np.save(os.path.join(directory, "dtype.npy"), np.empty(0, dtype=self.dtype))
+
+    @classmethod
+    def load(cls, directory, mmap_mode = "r"):
+        ''' load: Reads a TileCommandBuffer written by save.
+
+        Args:
+            directory: The directory the TileCommandBuffer was saved to.
+            mmap_mode: How the command records and address pool are memory-mapped (see numpy.load);
+                       None reads them into memory.
+        '''
+        buffer = cls.__new__(cls)
+        buffer.commands = np.load(os.path.join(directory, "commands.npy"), mmap_mode=mmap_mode)
+        buffer.addresses = np.load(os.path.join(directory, "addresses.npy"), mmap_mode=mmap_mode)
+        buffer.dtype = np.load(os.path.join(directory, "dtype.npy")).dtype
+        if buffer.commands.dtype != cls.COMMAND_DTYPE or buffer.addresses.dtype != np.int64:
+            raise ValueError("Not a TileCommandBuffer: "+str(directory))
+        return buffer
+
+    def nbytes(self):
+        ''' nbytes: The bytes held by the command records and the address pool.
+        '''
+        return self.commands.nbytes + self.addresses.nbytes
+
+    def col_addrs(self, index):
+        command = self.commands[index]
+        return self.addresses[command["col_offset"]:command["col_offset"] + command["length"]] + command["col_base"]
+
+    def row_addrs(self, index):
+        command = self.commands[index]
+        return self.addresses[command["row_offset"]:command["row_offset"] + command["length"]] + command["row_base"]
+
+    def _records(self):
+        # Converts the records to Python tuples a chunk at a time, rather than all at once.
+        for start in range(0, len(self.commands), self.RECORDS_PER_CHUNK):
+            yield from self.commands[start:start + self.RECORDS_PER_CHUNK].tolist()
+
+    def message(self, source, destination, index, message_id):
+        ''' message: Creates the TileCmd Message of the command at index, stamped with message_id.
+        '''
+        return self._message(source, destination, message_id, self.commands[index].tolist(), self.addresses)
+
+    def messages(self, source, destinations):
+        ''' messages: Creates the TileCmd Message of each command (in order), lazily.
+
+        Notes:
+            The commands are dealt to the destinations round-robin, and stamped with their index.
+            The col_addrs and row_addrs of each Message are int64 arrays sliced from the address pool.
+
+        Args:
+            source: the Device which is sending the messages.
+            destinations: a list of all possible destination devices which can compute this.
+        '''
+        num_destinations = len(destinations)
+        addresses = self.addresses
+
+        for index, record in enumerate(self._records()):
+            yield self._message(source, destinations[index % num_destinations], index, record, addresses)
+
+    def _message(self, source, destination, message_id, record, addresses):
+        operation, res_addr, bias, col_offset, col_base, row_offset, row_base, length = record
+        attributes = {
+            "res_addr" : res_addr,
+            "operation" : Operator(operation),
+            "dtype" : self.dtype,
+            "col_addrs" : addresses[col_offset:col_offset + length] + col_base,
+            "row_addrs" : addresses[row_offset:row_offset + length] + row_base,
+        }
+        if bias != self.NO_BIAS:
+            attributes["bias"] = bias
+        return Message(source, destination, Message.TileCmd, message_id, attributes=attributes)
+
+
+class AffineAccess:
+    ''' AffineAccess: An affine access descriptor, as an address-generation unit walks it: the addresses
+    base + sum(index[d]*strides[d]) of every index within extents, in row-major order.
+
+    Notes:
+        The first dimension enumerates the outputs of a tile command; `addresses` expands the
+        remaining dimensions for one output. (A stride of 0 re-reads the same addresses for every output.)
+
+    Args:
+        base: The first address.
+        strides: The distance between consecutive addresses of each dimension.
+        extents: The number of indices of each dimension.
+
+    Returns:
+        An AffineAccess object.
+    '''
+    __slots__ = ("base", "strides", "extents", "_offsets")
+
+    def __init__(self, base, strides, extents):
+        if len(strides) != len(extents) or len(extents) == 0:
+            raise ValueError("An AffineAccess needs a stride for every extent (and at least one dimension).")
+        if any(extent < 1 for extent in extents):
+            raise ValueError("Every extent of an AffineAccess must be at least 1: "+str(extents))
+
+        self.base = int(base)
+        self.strides = tuple(int(stride) for stride in strides)
+        self.extents = tuple(int(extent) for extent in extents)
+        self._offsets = None
+
+    def num_outputs(self):
+        return self.extents[0]
+
+    def addresses(self, output):
+        ''' addresses: Expands the addresses of an output (an index of the first dimension), as a list.
+        '''
+        if self._offsets is None:
+            offsets = np.zeros(1, dtype=np.int64)
+            for stride, extent in zip(self.strides[1:], self.extents[1:]):
+                offsets = (offsets[:, None] + np.arange(extent, dtype=np.int64)*stride).ravel()
+            self._offsets = offsets
+        return (self._offsets + (self.base + output*self.strides[0])).tolist()
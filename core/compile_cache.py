@@ -0,0 +1,107 @@
+''' compile_cache.py: A content-addressed cache of compiled layers (on disk, or in memory).
+
+'''
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from core.command_buffer import TileCommandBuffer
+
+
+def digest_file(path):
+    ''' digest_file: The SHA-256 (hex) digest of the contents of a file.
+    '''
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CompileCache:
+    ''' CompileCache: Keeps the TileCommandBuffer each layer compiles to on disk, and loads it (memory-mapped)
+    instead of compiling the layer again.
+
+    Notes:
+        A layer is keyed by the namespace (e.g., the digest of the model), its name, and its compile_key
+        (the ONNX node, its tensor shapes, and where the tensors are mapped in memory). Anything else about the
+        accelerator, such as its timing, does not change the tile commands, and so does not invalidate them.
+        Only layers which compile to a TileCommandBuffer are cached.
+        Without a directory, the compiled layers are kept in memory, for the life of the CompileCache
+        (e.g., to compile each layer once for every input of an InferenceSession).
+
+    Args:
+        directory: The directory to keep the compiled layers in (created if missing), or None to keep them in memory.
+        namespace: A string which is part of every key.
+
+    Returns:
+        A CompileCache object.
+    '''
+    def __init__(self, directory, namespace = ""):
+        self._directory = directory
+        self._namespace = namespace
+        self._buffers = dict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self._num_hits = 0
+        self._num_misses = 0
+
+    def key(self, flexnode):
+        digest = hashlib.sha256()
+        digest.update(self._namespace.encode())
+        digest.update(b"\0" + flexnode.get_op_name().encode() + b"\0")
+        digest.update(flexnode.compile_key())
+        return digest.hexdigest()
+
+    def compile_buffer(self, flexnode):
+        ''' compile_buffer: The TileCommandBuffer of the (mapped) flexnode, from the cache if it is there,
+        otherwise compiled (and stored).
+
+        Returns:
+            A TileCommandBuffer, or None if the flexnode does not compile to one.
+        '''
+        if self._directory is None:
+            key = self.key(flexnode)
+            if key in self._buffers:
+                self._num_hits += 1
+                return self._buffers[key]
+
+            buffer = flexnode.compile_buffer()
+            if buffer is not None:
+                self._num_misses += 1
+                self._buffers[key] = buffer
+            return buffer
+
+        path = os.path.join(self._directory, self.key(flexnode))
+        if os.path.isdir(path):
+            self._num_hits += 1
+            return TileCommandBuffer.load(path)
+
+        buffer = flexnode.compile_buffer()
+        if buffer is None:
+            return None
+        self._num_misses += 1
+
+        # Write to a temporary directory first, so a partially written layer is never loaded.
+        staging = tempfile.mkdtemp(dir=self._directory)
+        try:
+            buffer.save(staging)
+            os.rename(staging, path)
+        except OSError:
+            # Another run stored the layer first.
+            shutil.rmtree(staging, ignore_errors=True)
+        return buffer
+
+    def statistics(self):
+        ''' statistics: Reports how many layers were loaded from the cache, and how many were compiled.
+
+        Returns:
+            A dict of: hits, misses
+        '''
+        return {
+            "hits" : self._num_hits,
+            "misses" : self._num_misses
+        }
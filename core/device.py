@@ -30,10 +30,44 @@ class Device:
 
         self._message_router = message_router
         self._message_router.add_connection(self, message_queue_size)
+        self._message_pool = message_router.message_pool()
 
         self._num_stalls = 0
 
     def number_of_stalled_cycles(self):
         '''
         '''
-        return self._num_stalls
\ No newline at end of file
+        return self._num_stalls
+
+    def is_idle(self):
+        ''' is_idle: Reports if processing this device in the current cycle would change nothing.
+
+        Notes:
+            Event-driven Systems skip `process` for idle devices. 
+            The default is conservative: a device is never considered idle.
+        '''
+        return False
+
+    def next_event_cycle(self):
+        ''' next_event_cycle: Reports the next clock cycle in which this device has work to do.
+
+        Notes:
+            Event-driven Systems use this to jump the clock over cycles where nothing is in flight.
+            None indicates the device is idle until a Message arrives for it on a MessageRouter.
+            The default is conservative: the device has work in the very next cycle.
+
+        Returns:
+            An int (the clock cycle) or None.
+        '''
+        if self.is_idle():
+            return None
+        return self._system_clock_ref.current_clock() + 1
+
+    def fast_forward(self, cycles):
+        ''' fast_forward: Advances any in-flight timing state as if `cycles` cycles were processed.
+
+        Notes:
+            Only called by event-driven Systems when every skipped cycle is free of events
+            (see `next_event_cycle`), so specializations only need to age their pipelines.
+        '''
+        pass
\ No newline at end of file
@@ -8,29 +8,59 @@ Usage:
 import subprocess
 import os
 
+import numpy as np
+
 from core.device import Device
 
 
+class MemoryPage:
+    ''' A fixed-size page of a paged Memory, allocated on its first write.
+
+    Args:
+        page_size: The number of words in the page.
+        dtype: The NumPy dtype of a word.
+        allocated_cycle: The clock cycle in which the page was allocated.
+    '''
+    def __init__(self, page_size, dtype, allocated_cycle):
+        self.words = np.zeros(page_size, dtype=dtype)
+        self.valid = np.zeros(page_size, dtype=np.bool_)
+        self.allocated_cycle = allocated_cycle
+        self.reads = 0
+        self.writes = 0
+
+
 class Memory(Device):
     ''' An abstract class that represents a memory
 
     Notes:
         Two main methods are provided, `_peek` and `_poke`, which read
-        and write to the memory, respectively. 
+        and write to the memory, respectively. For contiguous transfers,
+        `peek_range` and `poke_range` read and write many words at once.
+
+        Words are stored in a NumPy array of unsigned integers (word_byte_size bytes each),
+        alongside a validity map which flags the words that were written.
+        If a page_size is given, the memory is instead split into pages (each with their own
+        words and validity map), which are only allocated when first written to. A page table
+        maps page numbers to the allocated pages, and `page_statistics` reports their usage.
+        Devices which cache the memory's contents can register (with `add_snooper`) to be told of every
+        write, by a device or by the host, so they can update or invalidate their copies.
 
     Args:
         system_clock_ref: The reference to the system clock.
         message_router: The router to handle communication transactions.
         message_queue_size: The number of additional Messages for the router to store when busy (default: 1)
         log_transactions: If we wish to store this to a 
-        word_byte_size: The number of bytes per memory cell.
+        word_byte_size: The number of bytes per memory cell (1, 2, 4 or 8).
         width:  The number of words in the memory (e.g., words*word_byte_size bytes large)
+        page_size: The number of words per page, or None to allocate the entire memory up front (default: None)
 
     Returns:
         A "Memory" object.
     '''
 
-    def __init__(self, system_clock_ref, message_router, message_queue_size=1, log_transactions=False, word_byte_size=4, width=10000):
+    WORD_DTYPES = {1 : np.uint8, 2 : np.uint16, 4 : np.uint32, 8 : np.uint64}
+
+    def __init__(self, system_clock_ref, message_router, message_queue_size=1, log_transactions=False, word_byte_size=4, width=10000, page_size=None):
         Device.__init__(self, system_clock_ref, message_router, message_queue_size)
 
         self._log_transacations = log_transactions
@@ -41,13 +71,43 @@ class Memory(Device):
         if word_byte_size < 1:
             raise ValueError("The word size (in bytes) must be a positive integer.")
 
-        # Create a "fake" memory
-        self._memory = [None]*int(width)
+        if word_byte_size not in self.WORD_DTYPES:
+            raise ValueError("The word size (in bytes) must be one of: "+str(list(self.WORD_DTYPES)))
+
+        if page_size is not None and (not isinstance(page_size, int) or page_size < 1):
+            raise ValueError("The page size (in words) must be a positive integer.")
+
+        self._page_size = page_size
+        self._dtype = self.WORD_DTYPES[word_byte_size]
+        if self._page_size is None:
+            # Create a "fake" memory (zero-filled arrays are only backed by pages once they are touched).
+            self._memory = np.zeros(int(width), dtype=self._dtype)
+            self._valid = np.zeros(int(width), dtype=np.bool_)
+        else:
+            # Page Number -> MemoryPage, for every page written to.
+            self._page_table = dict()
+
+        self._word_max = (1 << (8*word_byte_size)) - 1
         self._word_byte_size = word_byte_size
         self._width = width
 
         self._transaction_log = list()
 
+        # Devices told of every write (see add_snooper).
+        self._snoopers = list()
+
+    def add_snooper(self, snooper):
+        ''' add_snooper: Registers a device to be told of every write to this memory, through
+        snooper.snoop_write(address, length, writer); the writer is the device which sent the
+        write (None for a write by the host, e.g., poke_range).
+        '''
+        if snooper not in self._snoopers:
+            self._snoopers.append(snooper)
+
+    def _snoop_write(self, address, length, writer):
+        for snooper in self._snoopers:
+            snooper.snoop_write(address, length, writer)
+
     def _peek(self, address: int):
         '''_peek: Reads out contents from a memory address.
 
@@ -70,8 +130,17 @@ class Memory(Device):
         if address >= self._width or address < 0:
             raise ValueError("Memory Address is out-of-bounds.")
 
-        if self._memory[address] is None:
-            raise ValueError("Reading uninitialized memory.")
+        if self._page_size is None:
+            if not self._valid[address]:
+                raise ValueError("Reading uninitialized memory.")
+            contents = int(self._memory[address])
+        else:
+            page_number, offset = divmod(address, self._page_size)
+            page = self._page_table.get(page_number)
+            if page is None or not page.valid[offset]:
+                raise ValueError("Reading uninitialized memory.")
+            page.reads += 1
+            contents = int(page.words[offset])
 
         # If _log_transacations is True, log this.
         if self._log_transacations:
@@ -81,9 +150,18 @@ class Memory(Device):
                 str(self._system_clock_ref.current_clock())
             self._transaction_log.append(transaction)
 
-        return self._memory[address]
+        return contents
 
-    def _poke(self, address: int, contents: int):
+    def _peek_fill(self, address: int):
+        '''_peek_fill: Reads out the contents of a memory address, for a cache line fill: the neighbours of
+        a word may be outside the memory, or never written, so such a word is read as None instead of raising.
+        '''
+        try:
+            return self._peek(address)
+        except ValueError:
+            return None
+
+    def _poke(self, address: int, contents: int, writer = None):
         '''_poke: Write contents to a memory address.
 
         Notes:
@@ -94,7 +172,7 @@ class Memory(Device):
         Args:
             address: An int representing the address to write to.
             contents: An int representing the contents to write
-            requestor_state: A requestor_state object which holds stats
+            writer: The device which sent the write (passed on to the snoopers).
 
         Returns:
             An int, representing the memory of the specified
@@ -108,7 +186,21 @@ class Memory(Device):
         if address >= self._width or address < 0:
             raise ValueError("Memory Address is out-of-bounds.")
 
-        self._memory[address] = contents
+        if contents < 0 or contents > self._word_max:
+            raise ValueError("Contents do not fit in a memory word.")
+
+        if self._page_size is None:
+            self._memory[address] = contents
+            self._valid[address] = True
+        else:
+            page_number, offset = divmod(address, self._page_size)
+            page = self._allocate_page(page_number)
+            page.words[offset] = contents
+            page.valid[offset] = True
+            page.writes += 1
+
+        if self._snoopers:
+            self._snoop_write(address, 1, writer)
 
         # If _log_transacations is True, log this.
         if self._log_transacations:
@@ -118,11 +210,172 @@ class Memory(Device):
                 str(self._system_clock_ref.current_clock())
             self._transaction_log.append(transaction)
 
-    def write_transaction_log(self):
+    def peek_range(self, address: int, length: int):
+        '''peek_range: Reads out the contents of `length` consecutive memory addresses.
+
+        Notes:
+            Raises the same value errors as `_peek`, if any address in the range
+            is out-of-bounds or uninitialized.
+
+        Args:
+            address: An int representing the first address to read from.
+            length: An int representing the number of words to read.
+
+        Returns:
+            A numpy array (a copy) of the words.
+        '''
+        self._check_range(address, length)
+
+        if self._page_size is None:
+            if not self._valid[address:address+length].all():
+                raise ValueError("Reading uninitialized memory.")
+            contents = self._memory[address:address+length].copy()
+        else:
+            contents = np.zeros(length, dtype=self._dtype)
+            for page_number, offset, start, count in self._page_spans(address, length):
+                page = self._page_table.get(page_number)
+                if page is None or not page.valid[offset:offset+count].all():
+                    raise ValueError("Reading uninitialized memory.")
+                contents[start:start+count] = page.words[offset:offset+count]
+            for page_number, _, _, count in self._page_spans(address, length):
+                self._page_table[page_number].reads += count
+
+        if self._log_transacations:
+            self._log_range(address, length, "read")
+
+        return contents
+
+    def poke_range(self, address: int, contents):
+        '''poke_range: Writes contents to consecutive memory addresses.
+
+        Notes:
+            Raises the same value errors as `_poke`, if any address in the range
+            is out-of-bounds, or if the contents do not fit in a word.
+
+        Args:
+            address: An int representing the first address to write to.
+            contents: A numpy array (or list) of integers to write, starting at address.
+        '''
+        contents = np.asarray(contents)
+        length = len(contents)
+        if length and contents.dtype.kind not in "ui":
+            raise ValueError("Contents must be integers.")
+
+        self._check_range(address, length)
+
+        if length and (contents.min() < 0 or contents.max() > self._word_max):
+            raise ValueError("Contents do not fit in a memory word.")
+
+        # The snoopers are only told of the words which change.
+        changed = self._changed_span(address, contents) if self._snoopers and length else None
+
+        if self._page_size is None:
+            self._memory[address:address+length] = contents
+            self._valid[address:address+length] = True
+        else:
+            for page_number, offset, start, count in self._page_spans(address, length):
+                page = self._allocate_page(page_number)
+                page.words[offset:offset+count] = contents[start:start+count]
+                page.valid[offset:offset+count] = True
+                page.writes += count
+
+        if changed is not None:
+            self._snoop_write(changed[0], changed[1], None)
+
+        if self._log_transacations:
+            self._log_range(address, length, "write")
+
+    def _changed_span(self, address, contents):
+        ''' _changed_span: The (address, length) of the span of words, from address, which writing contents
+        would change (i.e., which differ from contents or are uninitialized), or None if none would.
+        '''
+        length = len(contents)
+        if self._page_size is None:
+            changed = ~self._valid[address:address+length] | (self._memory[address:address+length] != contents)
+        else:
+            changed = np.ones(length, dtype=np.bool_)
+            for page_number, offset, start, count in self._page_spans(address, length):
+                page = self._page_table.get(page_number)
+                if page is not None:
+                    changed[start:start+count] = ~page.valid[offset:offset+count] | (page.words[offset:offset+count] != contents[start:start+count])
+
+        indices = np.flatnonzero(changed)
+        if len(indices) == 0:
+            return None
+        return address + int(indices[0]), int(indices[-1] - indices[0]) + 1
+
+    def _check_range(self, address, length):
+        if not isinstance(address, int) or not isinstance(length, int):
+            raise ValueError("Memory Address and length must be integers.")
+
+        if address < 0 or length < 0 or address+length > self._width:
+            raise ValueError("Memory Address is out-of-bounds.")
+
+    def _page_spans(self, address, length):
+        ''' Splits a range of addresses by page, yielding (page_number, offset into the page,
+        offset into the range, number of words) for each page the range covers.
+        '''
+        start = 0
+        while start < length:
+            page_number, offset = divmod(address+start, self._page_size)
+            count = min(self._page_size-offset, length-start)
+            yield page_number, offset, start, count
+            start += count
+
+    def _allocate_page(self, page_number):
+        page = self._page_table.get(page_number)
+        if page is None:
+            page = MemoryPage(self._page_size, self._dtype, self._system_clock_ref.current_clock())
+            self._page_table[page_number] = page
+        return page
+
+    def page_statistics(self):
+        ''' page_statistics: Reports on the residency of a paged memory.
+
+        Returns:
+            A list (ordered by page number) with a dict per allocated page, holding its
+            "page", "base_address", "allocated_cycle", "valid_words", "reads" and "writes".
+            (Words transferred with peek_range/poke_range are counted individually.)
+        '''
+        if self._page_size is None:
+            raise ValueError("Page statistics are only kept for a paged memory.")
+
+        statistics = list()
+        for page_number in sorted(self._page_table):
+            page = self._page_table[page_number]
+            statistics.append({
+                "page" : page_number,
+                "base_address" : page_number*self._page_size,
+                "allocated_cycle" : page.allocated_cycle,
+                "valid_words" : int(page.valid.sum()),
+                "reads" : page.reads,
+                "writes" : page.writes,
+            })
+        return statistics
+
+    def resident_size(self):
+        ''' resident_size: The number of bytes of words held by the memory
+        (the allocated pages, or the entire memory if it is not paged).
+        '''
+        if self._page_size is None:
+            return self.size()
+        return len(self._page_table)*self._page_size*self._word_byte_size
+
+    def _log_range(self, address, length, kind):
+        # Each word is logged as its own transaction (in the same cycle).
+        suffix = " " + kind + " " + str(self._system_clock_ref.current_clock())
+        self._transaction_log.extend([('0x%08x' % addr) + suffix for addr in range(address, address+length)])
+
+    def write_transaction_log(self, path = "misc_transactions.trc"):
+        ''' write_transaction_log: Writes every logged transaction (if they are logged) as a DRAMSim2 trace.
+
+        Args:
+            path: The file to write the trace to.
+        '''
         if not self._log_transacations:
             return
 
-        with open("misc_transactions.trc", "w+") as f:
+        with open(path, "w+") as f:
             for transaction in self._transaction_log:
                 f.write(transaction+"\n")
 
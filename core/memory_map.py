@@ -7,22 +7,51 @@ Date: June 16, 2021
 
 '''
 import numpy
-import struct
-from core.allocator import BitAlloc
-from core.utils import *
+from core.allocator import build_allocator
 
 
 class MemoryMapper:
     ''' MemoryMapper: a class which can map a numpy array into a memory-device.
-    Using BitAlloc from core.allocator (any allocator would suffice),
+    Using an allocator from core.allocator (any allocator would suffice),
     We map a numpy array to memory via .nditer
+
+    Notes:
+        Pinned tensors (see pin) are resident: the first time an array made from one is mapped, it is
+        allocated and uploaded, and it then stays in memory (unmap does not free it). Mapping an array
+        made from the same tensor in the same layout (e.g., by the next layer or inference) returns the same
+        offset, and its upload is skipped, without looking at its contents. Arrays made differently from the
+        tensor (e.g., transposed) must be mapped with their own layout, and are resident separately.
+
+        Downloaded tensors (see mem2sys) are produced: the memory of the array they were downloaded from
+        is kept when it is unmapped, so the next layer maps the tensor (in its row-major layout) at the same
+        address, without uploading it (and a cache which snooped the writes of the tensor still holds it).
+        Produced memory is freed by release.
+
+    Args:
+        memory_system: The Memory to map arrays into.
+        memory_size: The number of bytes the allocator manages.
+        word_size: The number of bytes per word (the allocator's minimum request size).
+        allocator: The name of the allocator (see core.allocator.build_allocator, default: "bitmap")
     '''
-    def __init__(self, memory_system, memory_size, word_size):
+    def __init__(self, memory_system, memory_size, word_size, allocator = "bitmap"):
         self._memory_system = memory_system
         self._memory_map = dict()
-        self._allocator = BitAlloc(memory_size, word_size)
+        self._allocator = build_allocator(allocator, memory_size, word_size)
 
-    def map(self, array):
+        # id of a pinned tensor -> the tensor (held, so its id stays unique)
+        self._pinned = dict()
+        # id of a pinned tensor -> layout -> [array, offset, verify] of each of its resident arrays
+        # (verify is set when the tensor is pinned again, so the next map compares the contents).
+        self._resident = dict()
+        # id of a mapped resident (or produced) array -> whether it is already uploaded
+        self._resident_mapped = dict()
+        # id of a produced tensor -> (the tensor, the offset of its words)
+        self._produced = dict()
+
+        self._uploaded_words = 0
+        self._avoided_words = 0
+
+    def map(self, array, source = None, layout = None):
         ''' map:
 
         Given a numpy array, maps this into valid memory-locations
@@ -34,6 +63,9 @@ class MemoryMapper:
 
         Args:
             array: A numpy array
+            source: The tensor the array was made from; if it is pinned, the array is resident.
+            layout: A hashable key of how the array was made from source, so arrays made differently from
+                    the same tensor are not confused; None if it holds the words of source in row-major order.
 
         Returns:
             an integer representing the beginning of the offset of the array location
@@ -41,12 +73,95 @@ class MemoryMapper:
 
         '''
         array_id = id(array)
+        if source is not None and id(source) in self._pinned:
+            return self._map_resident(array, source, (array.shape, array.dtype.str) if layout is None else layout)
+
+        if source is not None and layout is None and id(source) in self._produced and array.size == source.size:
+            offset = self._produced[id(source)][1]
+            self._memory_map[array_id] = offset
+            self._resident_mapped[array_id] = True
+            return offset
+
         self._memory_map[array_id] = self._allocator.alloc(array.nbytes)
         if self._memory_map[array_id] is None:
             raise RuntimeError("Memory Device: Out of memory")
         return self._memory_map[array_id]
 
 
+    def _map_resident(self, array, source, layout):
+        array_id = id(array)
+        residents = self._resident.setdefault(id(source), dict())
+        resident = residents.get(layout)
+        if resident is not None:
+            offset = resident[1]
+            self._memory_map[array_id] = offset
+            uploaded = True
+            if resident[2]:
+                # The tensor was pinned again, so it may have changed since it was uploaded.
+                uploaded = resident[0].shape == array.shape and numpy.array_equal(resident[0], array)
+                residents[layout] = [array, offset, False]
+            self._resident_mapped[array_id] = uploaded
+            return offset
+
+        offset = self._allocator.alloc(array.nbytes)
+        if offset is None:
+            raise RuntimeError("Memory Device: Out of memory")
+        residents[layout] = [array, offset, False]
+        self._memory_map[array_id] = offset
+        self._resident_mapped[array_id] = False
+        return offset
+
+    def pin(self, tensor):
+        ''' pin:
+
+        Makes the arrays mapped from tensor resident (see Notes). The tensor must not change while it is pinned,
+        unless it is pinned again: then, the next map of each of its arrays compares it against the resident
+        copy, and uploads it again if it changed.
+
+        Args:
+            tensor: A numpy array (e.g., the weights of a layer).
+        '''
+        for resident in self._resident.get(id(tensor), dict()).values():
+            resident[2] = True
+        self._pinned[id(tensor)] = tensor
+
+    def unpin(self, tensor):
+        ''' unpin:
+
+        Frees the resident arrays of tensor, which is no longer pinned.
+
+        Notes:
+            If an array of the tensor is still mapped, a ValueError is raised.
+        '''
+        tensor_id = id(tensor)
+        if tensor_id not in self._pinned:
+            raise ValueError("Tensor was not pinned.")
+
+        residents = self._resident.pop(tensor_id, dict())
+        for resident, offset, _ in residents.values():
+            if offset in self._memory_map.values():
+                self._resident[tensor_id] = residents
+                raise ValueError("Tensor is still mapped into memory.")
+
+        for resident, offset, _ in residents.values():
+            self._allocator.free(offset)
+        del self._pinned[tensor_id]
+
+    def residency_statistics(self):
+        ''' residency_statistics: Reports the resident arrays, and the words which were (and were not) uploaded.
+
+        Returns:
+            A dict of: resident_arrays, resident_words, uploaded_words, avoided_words (the words
+            of resident and produced arrays which were mapped again, and so not uploaded)
+        '''
+        residents = [resident[0] for arrays in self._resident.values() for resident in arrays.values()]
+        return {
+            "resident_arrays" : len(residents),
+            "resident_words" : sum(int(resident.size) for resident in residents),
+            "uploaded_words" : self._uploaded_words,
+            "avoided_words" : self._avoided_words
+        }
+
     def is_mapped(self, array):
         ''' is_mapped:
 
@@ -88,19 +203,74 @@ class MemoryMapper:
             raise ValueError("Array was not mapped into memory.")
 
         addr = self._memory_map[array_id]
-        self._allocator.free(addr)
         del self._memory_map[array_id]
+        # Resident arrays stay in memory (and so do produced ones, until they are released).
+        if self._resident_mapped.pop(array_id, None) is None:
+            self._free_unused(addr)
 
+    def _free_unused(self, offset):
+        if offset in self._memory_map.values() or any(produced_offset == offset for _, produced_offset in self._produced.values()):
+            return
+        self._allocator.free(offset)
 
-    def sys2mem(self, arr, offset):
+    def alias(self, tensor, source):
+        ''' alias: Makes tensor produced at the offset of source, if source is produced
+        (e.g., tensor is a reshaped copy of source, so it holds the same words in the same order).
         '''
+        if id(source) in self._produced and tensor.size == source.size:
+            self._produced[id(tensor)] = (tensor, self._produced[id(source)][1])
+
+    def release(self, keep = ()):
+        ''' release: Frees the memory of the produced tensors (see Notes), except those in keep.
+
+        Args:
+            keep: The tensors which stay produced (e.g., the outputs of the last layer).
+        '''
+        keep = set(id(tensor) for tensor in keep)
+        offsets = [offset for tensor_id, (_, offset) in self._produced.items() if tensor_id not in keep]
+        self._produced = {tensor_id : produced for tensor_id, produced in self._produced.items() if tensor_id in keep}
+        for offset in set(offsets):
+            self._free_unused(offset)
+
+
+    def sys2mem(self, arr, offset):
+        ''' sys2mem:
+
+        Transfers a numpy array into memory (in row-major order), one 32-bit float per word.
+        (A resident array which is already in memory is not transferred again.)
+
+        Args:
+            arr: A numpy array (of any shape)
+            offset: The address of the first word in memory.
         '''
-        for i in range(len(arr)):
-            data = float_to_int_repr_of_float(arr[i])
-            self._memory_system._poke(i+offset, data)
+        if self._resident_mapped.get(id(arr)):
+            self._avoided_words += int(arr.size)
+            return
+        if id(arr) in self._resident_mapped:
+            self._resident_mapped[id(arr)] = True
+
+        words = numpy.ascontiguousarray(arr, dtype=numpy.float32).reshape(-1).view(numpy.uint32)
+        self._memory_system.poke_range(offset, words)
+        self._uploaded_words += int(words.size)
 
     def mem2sys(self, arr, offset):
-        for i in range(len(arr)):
-            arr[i] = int_repr_of_float_to_float(self._memory_system._peek(i+offset))
+        ''' mem2sys:
+
+        Transfers words (each a 32-bit float) from memory into a numpy array, in row-major order.
+        (If the words are those of a mapped array, the array is then produced there: see Notes.)
+
+        Args:
+            arr: A numpy array (of any shape) which is written in-place.
+            offset: The address of the first word in memory.
+        '''
+        words = self._memory_system.peek_range(offset, int(arr.size))
+        arr[...] = words.astype(numpy.uint32).view(numpy.float32).reshape(arr.shape)
+
+        # The array now holds the words of a mapped (not resident) array, so it is produced there.
+        if any(mapped == offset and array_id not in self._resident_mapped for array_id, mapped in self._memory_map.items()):
+            previous = self._produced.get(id(arr))
+            self._produced[id(arr)] = (arr, offset)
+            if previous is not None and previous[1] != offset:
+                self._free_unused(previous[1])
 
 
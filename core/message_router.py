@@ -4,30 +4,73 @@ This class enables communication and data transfer between devices.
 
 '''
 
-from core.messaging import Message
+from core.messaging import Message, MessagePool
 from core.clock import ClockReference
 
 
 class MessageQueue:
     ''' An object which implements a queue (specifically for messages) with a maximum capacity.
+
+    Notes:
+        The messages are held in a ring buffer of fixed capacity.
+        The queue also counts the messages it accepted, those it refused because it was full,
+        how often it became full, and the most messages it held at once.
     '''
     def __init__(self, max_availability = 1):
         if max_availability <= 0:
             raise ValueError("A MessageQueue object MUST have at least 1 element")
 
         self._max_availability = max_availability
-        self._queue = list()
+        self._ring = [None]*max_availability
+        self._head = 0
+        self._count = 0
+
+        self._num_queued = 0
+        self._num_refused = 0
+        self._num_full = 0
+        self._peak_occupancy = 0
 
     def queue(self, data):
-        if len(self._queue) < self._max_availability:
-            self._queue.append(data)
-            return True
-        return False
+        if self._count == self._max_availability:
+            self._num_refused += 1
+            return False
+        self._ring[(self._head + self._count) % self._max_availability] = data
+        self._count += 1
+        self._num_queued += 1
+        if self._count > self._peak_occupancy:
+            self._peak_occupancy = self._count
+        if self._count == self._max_availability:
+            self._num_full += 1
+        return True
 
     def dequeue(self):
-        if not self._queue:
+        if not self._count:
             return None
-        return self._queue.pop(0)
+        data = self._ring[self._head]
+        self._ring[self._head] = None
+        self._head = (self._head + 1) % self._max_availability
+        self._count -= 1
+        return data
+
+    def available(self):
+        return self._max_availability - self._count
+
+    def statistics(self):
+        ''' statistics: The backpressure counters of this queue.
+
+        Returns:
+            A dict of: capacity, queued, refused (sends while full), full (times it became full), peak_occupancy
+        '''
+        return {
+            "capacity" : self._max_availability,
+            "queued" : self._num_queued,
+            "refused" : self._num_refused,
+            "full" : self._num_full,
+            "peak_occupancy" : self._peak_occupancy
+        }
+
+    def __len__(self):
+        return self._count
 
 
 class MessageRouter:
@@ -39,14 +82,34 @@ class MessageRouter:
 
     Args:
         system_clock_ref: The reference to the system clock.
+        message_pool: The MessagePool that devices on this MessageRouter create (and release) their Messages with.
+                      (default: a MessagePool which does not recycle Messages)
+        credit_based: If True, a sender holds one credit per free slot of the destination's queue, and must
+                      only send with a credit (see `can_send`); senders without credits wait (i.e., are idle)
+                      instead of retrying every cycle. Otherwise, a send to a full queue fails (default: False).
 
     '''
-    def __init__(self, system_clock_ref):
+    def __init__(self, system_clock_ref, message_pool = None, credit_based = False):
         self._message_queue_map = dict()
         if not isinstance(system_clock_ref, ClockReference):
             raise ValueError("system_clock_ref must be a ClockReference.")
         self._system_clock_ref = system_clock_ref
 
+        if message_pool is None:
+            message_pool = MessagePool()
+        if not isinstance(message_pool, MessagePool):
+            raise ValueError("message_pool must be a MessagePool.")
+        self._message_pool = message_pool
+
+        self._credit_based = credit_based
+
+
+    def message_pool(self):
+        return self._message_pool
+
+    def credit_based(self):
+        return self._credit_based
+
 
     def add_connection(self, device, queue_size = 1):
         '''add_connecton: Adds a device to this MessageRouter
@@ -82,7 +145,8 @@ class MessageRouter:
         '''send: Sends a Message from source to destination via the MessageRouter
 
         Notes:
-            A ValueError can be raised if the requested destination is NOT on this MessageRouter.
+            A ValueError can be raised if the requested destination is NOT on this MessageRouter,
+            or if a credit-based MessageRouter is sent a Message without a credit for it.
 
         Args:
             message: The Message to transfer.
@@ -91,15 +155,68 @@ class MessageRouter:
             True if the transmisson was successful, False if the router-queue for the device is full.
             If False is returned, the source device should stall on sending!
         '''
-        if message.destination not in self._message_queue_map:
+        try:
+            message_queue = self._message_queue_map[message.destination]
+        except KeyError:
             raise ValueError("Requested Destination is not on this MessageRouter."+str(message.destination))
 
-        if not isinstance(message, Message):
+        if Message.validate and not isinstance(message, Message):
             raise ValueError("Cannot send a non-Message on a MessageRouter.")
 
+        if self._credit_based and not message_queue.available():
+            raise ValueError("Sent without a credit for: "+str(message.destination))
+
         message.sent_clock = self._system_clock_ref.current_clock()
 
-        return self._message_queue_map[message.destination].queue(message)
+        return message_queue.queue(message)
+
+
+    def credits(self, destination):
+        '''credits: The number of Messages that can be sent to the destination before it fetches any.
+
+        Args:
+            destination: A device on this MessageRouter.
+
+        Returns:
+            An int (the free slots in the destination's queue).
+        '''
+        return self._message_queue_map[destination].available()
+
+
+    def can_send(self, destination):
+        '''can_send: Whether a sender should attempt to send to the destination this cycle.
+
+        Notes:
+            Without credits, a sender may always attempt to send (and stalls if it fails).
+
+        Args:
+            destination: A device on this MessageRouter.
+
+        Returns:
+            True, unless this MessageRouter is credit-based and there are no credits for the destination.
+        '''
+        return not self._credit_based or self._message_queue_map[destination].available() > 0
+
+
+    def statistics(self):
+        '''statistics: The backpressure counters of each connection (see MessageQueue.statistics).
+
+        Returns:
+            A dict of device to a dict of counters.
+        '''
+        return {device : message_queue.statistics() for device, message_queue in self._message_queue_map.items()}
+
+
+    def pending(self, requestor):
+        '''pending: The number of messages waiting in the requestor's queue.
+
+        Args:
+            requestor: The device to inspect.
+
+        Returns:
+            An int, which is 0 if the requestor has nothing to fetch.
+        '''
+        return len(self._message_queue_map[requestor])
 
 
     def fetch(self, requestor):
@@ -112,11 +229,13 @@ class MessageRouter:
         Returns:
             A Message if there are any in the requestor's queue, otherwise None will be returned.
         '''
-        if requestor not in self._message_queue_map:
+        try:
+            message_queue = self._message_queue_map[requestor]
+        except KeyError:
             raise ValueError("Requestor is not registered on this MessageRouter: "+str(requestor)+". Please add it to the MessageRouter.")
 
         # Fetch the message from the queue
-        message = self._message_queue_map[requestor].dequeue()
+        message = message_queue.dequeue()
         if message is not None:
             # Stamp the message, now that it's been received.
             message.recv_clock = self._system_clock_ref.current_clock()
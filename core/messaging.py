@@ -8,11 +8,18 @@ class Message:
     '''Message: Representings the information for distributing a set
     of commands/information to a particular device
 
+    Notes:
+        Each mtype is a specialization of Message with a fixed set of fields (see FIELDS), held in
+        __slots__; Message(...) returns the specialization for the requested mtype.
+        A field which was not supplied is not set (i.e., hasattr is False), unless the mtype defaults it.
+        The per-mtype checks on the supplied fields only run while Message.validate is True (debug mode).
+
     Args:
         source: The compute element which is sending the message
         destination: The compute element which is to receive the message.
         message_id: An identifier to classify what message sequence this belongs to.
         seq_num: An ordered response associated with message_id
+        attributes: A dict of fields to set (must be in the FIELDS of the mtype).
 
     Returns:
         a Message object
@@ -29,6 +36,29 @@ class Message:
     TileDone = 7
     Ping = 8
 
+    # Set to True to check the fields of every Message as it is created (debug mode).
+    validate = False
+
+    # The fields (beyond those of every Message) which the mtype carries.
+    FIELDS = ()
+
+    __slots__ = ("source", "destination", "sent_clock", "recv_clock", "message_id", "seq_num", "mtype")
+
+    def __new__(cls, source, destination, mtype, message_id = None, seq_num = None, attributes = None):
+        if cls is not Message:
+            return object.__new__(cls)
+
+        if mtype is None:
+            raise ValueError("Cannot create a message with type None.")
+
+        if not isinstance(mtype, int):
+            raise ValueError("The message type needs to be an integer.")
+
+        if mtype not in MESSAGE_TYPES:
+            raise ValueError("Please choose a supported mtype: "+str(set(MESSAGE_TYPES)))
+
+        return object.__new__(MESSAGE_TYPES[mtype])
+
     def __init__(self, source, destination, mtype, message_id = None, seq_num = None, attributes = None):
         self.source = source
         self.destination = destination
@@ -42,59 +72,188 @@ class Message:
 
         self.mtype = mtype
 
-        self._supported_types = {self.MemWrite, self.MemWriteDone, self.MemRead, self.MemReadDone, self.PECmd, self.PEDone, self.TileCmd, self.TileDone, self.Ping}
-
-        # If a keyword argument dictionary was supplied, set this object's attributes. 
+        # If a keyword argument dictionary was supplied, set this object's fields.
         if attributes is not None:
-            for k, v in attributes.items():
-                setattr(self, k, v)
+            try:
+                for k, v in attributes.items():
+                    setattr(self, k, v)
+            except AttributeError:
+                raise ValueError(type(self).__name__+" does not have the field(s): "+str(set(attributes) - set(self.FIELDS)))
 
-        if self.mtype is None:
-            raise ValueError("Cannot create a message with type None.")
+        if Message.validate:
+            self._validate()
+
+    def _validate(self):
+        ''' _validate: Checks the fields of this Message (debug mode).
+        '''
+        pass
+
+    def _require(self, *fields):
+        for field in fields:
+            if not hasattr(self, field):
+                raise ValueError(type(self).__name__+" requires the field: "+field)
+
+    def _clear(self):
+        ''' _clear: Unsets the fields of this Message, so it can be reused.
+        '''
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                delattr(self, field)
+
+
+class MemWriteMessage(Message):
+    FIELDS = ("addr", "content", "dtype")
+    __slots__ = FIELDS
+
+    def _validate(self):
+        self._require("addr", "content")
 
-        if not isinstance(self.mtype, int):
-            raise ValueError("The message type needs to be an integer.")
 
-        if not self.mtype in self._supported_types:
-            raise ValueError("Please choose a supported mtype: "+str(self._supported_types))
+class MemWriteDoneMessage(Message):
+    __slots__ = ()
 
-        if self.mtype == self.MemWrite:
-            assert hasattr(self, "addr")
-            assert hasattr(self, "content")
 
-        elif self.mtype == self.MemRead:
-            assert hasattr(self, "addr")
+class MemReadMessage(Message):
+    # (A read with fill set only fills a cache line, and is answered with None for a word which cannot be read.)
+    FIELDS = ("addr", "fill")
+    __slots__ = FIELDS
 
-        elif self.mtype == self.MemReadDone:
-            assert hasattr(self, "addr")
-            assert hasattr(self, "content")
+    def _validate(self):
+        self._require("addr")
 
-        elif self.mtype == self.PECmd:
-            self.num_operands = 2
-            if hasattr(self, "op3"):
-                self.num_operands += 1
-            assert hasattr(self, "operation")
-            assert hasattr(self, "dtype")
 
-        elif self.mtype == self.PEDone:
-            assert hasattr(self, "result")
+class MemReadDoneMessage(Message):
+    FIELDS = ("addr", "content")
+    __slots__ = FIELDS
+
+    def _validate(self):
+        self._require("addr", "content")
+
+
+class PECmdMessage(Message):
+    FIELDS = ("operation", "dtype", "op1", "op2", "op3", "num_beats", "num_operands")
+    __slots__ = FIELDS
+
+    def __init__(self, source, destination, mtype, message_id = None, seq_num = None, attributes = None):
+        Message.__init__(self, source, destination, mtype, message_id, seq_num, attributes)
+        self.num_operands = 3 if hasattr(self, "op3") else 2
+
+    def _validate(self):
+        self._require("operation", "dtype")
 
-        elif self.mtype == self.TileCmd:
 
-            assert hasattr(self, "res_addr")
-            assert hasattr(self, "operation")
-            assert hasattr(self, "dtype")
+class PEDoneMessage(Message):
+    FIELDS = ("result",)
+    __slots__ = FIELDS
+
+    def _validate(self):
+        self._require("result")
+
+
+class TileCmdMessage(Message):
+    ''' TileCmdMessage: A tile command.
+
+    Notes:
+        A DOT reads either the addresses listed by row_addrs and col_addrs, or (covering several outputs)
+        those described by the AffineAccesses row_access and col_access; res_access and bias_access then
+        describe the address each output is written to, and the address of its bias.
+    '''
+    FIELDS = ("res_addr", "operation", "dtype", "row_addrs", "col_addrs", "bias", "op1", "op1_addr", "op2", "op2_addr",
+              "row_access", "col_access", "res_access", "bias_access")
+    __slots__ = FIELDS
+
+    def __init__(self, source, destination, mtype, message_id = None, seq_num = None, attributes = None):
+        Message.__init__(self, source, destination, mtype, message_id, seq_num, attributes)
+        if not hasattr(self, "bias"):
+            self.bias = None
+
+    def _validate(self):
+        self._require("res_addr", "operation", "dtype")
+
+        if self.operation == Operator.DOT:
+            if hasattr(self, "col_access"):
+                self._require("row_access", "res_access")
+            else:
+                self._require("row_addrs", "col_addrs")
+
+        elif self.operation in {Operator.ADD, Operator.MUL, Operator.SUB, Operator.DIV, Operator.MAX}:
+            if not hasattr(self, "op1_addr"):
+                self._require("op1")
+
+            if not hasattr(self, "op2_addr"):
+                self._require("op2")
+
+
+class TileDoneMessage(Message):
+    __slots__ = ()
+
+
+class PingMessage(Message):
+    __slots__ = ()
+
+
+# The specialization of Message for each mtype.
+MESSAGE_TYPES = {
+    Message.MemWrite : MemWriteMessage,
+    Message.MemWriteDone : MemWriteDoneMessage,
+    Message.MemRead : MemReadMessage,
+    Message.MemReadDone : MemReadDoneMessage,
+    Message.PECmd : PECmdMessage,
+    Message.PEDone : PEDoneMessage,
+    Message.TileCmd : TileCmdMessage,
+    Message.TileDone : TileDoneMessage,
+    Message.Ping : PingMessage
+}
+
+
+class MessagePool:
+    ''' MessagePool: Creates Messages, and (optionally) recycles those which devices are done with.
+
+    Notes:
+        Devices create their Messages with `message` (same arguments as Message), and hand
+        a Message back with `release` once they have consumed it (i.e., after fetching and processing it).
+        Nothing may refer to a Message after it is released.
+
+    Args:
+        recycle: If True, released Messages are kept on a free-list (per mtype) and reused by `message`.
+                 Otherwise, `message` always creates a new Message and `release` does nothing.
+
+    Returns:
+        A MessagePool object.
+    '''
+    def __init__(self, recycle = False):
+        self._recycle = recycle
+        self._free_lists = {mtype : list() for mtype in MESSAGE_TYPES}
+        self._num_created = 0
+        self._num_reused = 0
 
+    def message(self, source, destination, mtype, message_id = None, seq_num = None, attributes = None):
+        if self._recycle:
+            free_list = self._free_lists.get(mtype)
+            if free_list:
+                message = free_list.pop()
+                message.__init__(source, destination, mtype, message_id, seq_num, attributes)
+                self._num_reused += 1
+                return message
+        self._num_created += 1
+        return Message(source, destination, mtype, message_id, seq_num, attributes)
 
-            if self.operation == Operator.DOT:
-                assert hasattr(self, "row_addrs")
-                assert hasattr(self, "col_addrs")
-                if not hasattr(self, "bias"):
-                    self.bias = None
+    def release(self, message):
+        if not self._recycle:
+            return
+        free_list = self._free_lists[message.mtype]
+        if Message.validate and any(message is free for free in free_list):
+            raise ValueError("Message was released twice: "+str(message))
+        message._clear()
+        free_list.append(message)
 
-            elif self.operation in {Operator.ADD, Operator.MUL, Operator.SUB, Operator.DIV, Operator.MAX}:
-                if not hasattr(self, "op1_addr"):
-                    assert hasattr(self, "op1")
+    def statistics(self):
+        ''' statistics: Reports how many Messages were created and how many were reused.
 
-                if not hasattr(self, "op2_addr"):
-                    assert hasattr(self, "op2")
+        Returns:
+            A dict of: created, reused
+        '''
+        return {
+            "created" : self._num_created,
+            "reused" : self._num_reused
+        }
@@ -0,0 +1,162 @@
+''' session.py: Runs a translated model on an accelerator for many inputs, back to back.
+
+'''
+
+import os
+import time
+
+import numpy as np
+
+
+def load_inputs(path, input_name, shape, dtype):
+    ''' load_inputs: Reads a dataset of inputs to a model.
+
+    Notes:
+        A .npy file is memory-mapped, so only the inputs being run are read from it. A .npz file holds
+        its arrays compressed, so the array named input_name (or its only array) is read into memory.
+        Any other file is memory-mapped as raw inputs of the model's dtype, one after another.
+
+    Args:
+        path: The path to the dataset.
+        input_name: The name of the model's input.
+        shape: The shape of the model's input.
+        dtype: The dtype of the model's input.
+
+    Returns:
+        An array of inputs, indexed by the first dimension (see InferenceSession.run).
+    '''
+    extension = os.path.splitext(path)[1]
+    if extension == ".npy":
+        return np.load(path, mmap_mode="r")
+
+    if extension == ".npz":
+        with np.load(path) as dataset:
+            if input_name in dataset.files:
+                return dataset[input_name]
+            if len(dataset.files) != 1:
+                raise ValueError("Please name the array of inputs in "+str(path)+" after the model's input: "+str(input_name))
+            return dataset[dataset.files[0]]
+
+    return np.memmap(path, dtype=dtype, mode="r").reshape((-1,) + tuple(shape))
+
+
+class InferenceSession:
+    ''' InferenceSession: Runs a translated model on an accelerator for each of a set of inputs, and
+    reports the cycles of each input, and of all of them.
+
+    Notes:
+        The model is translated once, and every input reuses its FlexNodes (and, if the accelerator has a
+        CompileCache, the layers compiled for the earlier inputs). The first input also pays for
+        everything which is only done once (e.g., uploading resident weights, and warming the caches),
+        so the steady-state cycles leave it out.
+
+    Args:
+        onnx2flex: A (translated) ONNX2Flex.
+        accelerator: The accelerator to run each layer on (e.g., Nio).
+        reference: If given, a callable which returns the expected output of an input
+                   (e.g., from ONNX Runtime); each output is checked against it.
+
+    Returns:
+        An InferenceSession object.
+    '''
+    def __init__(self, onnx2flex, accelerator, reference = None):
+        self._onnx2flex = onnx2flex
+        self._accelerator = accelerator
+        self._reference = reference
+        self._input_name, self._input_shape, self._input_dtype = onnx2flex.get_input_attributes()
+
+        self._results = list()
+
+    def inputs(self, array):
+        ''' inputs: Splits an array into the inputs of the model.
+
+        Notes:
+            The array may be a single input (of the model's input shape), or a dataset of them
+            along its first dimension; a model with a batch of 1 also accepts a dataset of unbatched inputs.
+
+        Returns:
+            An iterator of the inputs (views of the array).
+        '''
+        shape = tuple(self._input_shape)
+        if array.shape == shape:
+            return iter([array])
+        if array.shape[1:] == shape:
+            return iter(array)
+        if shape[0] == 1 and array.shape[1:] == shape[1:]:
+            return (item.reshape(shape) for item in array)
+        raise ValueError("The inputs of shape "+str(array.shape)+" do not match the model's input: "+str(shape))
+
+    def run_input(self, tensor):
+        ''' run_input: Runs the model on one input.
+
+        Returns:
+            A dict of: cycles, layer_cycles (a list of (layer name, cycles)), seconds (of simulation),
+            output (a copy of the model's output), and matches (whether it matches the reference, or None).
+        '''
+        self._onnx2flex.set_input(self._input_name, tensor)
+        self._onnx2flex.reset()
+
+        layer_cycles = list()
+        start_time = time.time()
+        layer = self._onnx2flex.next_layer()
+        while layer is not None:
+            self._accelerator.forward(layer)
+            layer_cycles.append((layer.get_op_name(), self._accelerator.cycles_per_layer()))
+            layer = self._onnx2flex.next_layer()
+        end_time = time.time()
+
+        output = np.array(self._onnx2flex.get_output(), copy=True)
+        matches = None
+        if self._reference is not None:
+            matches = bool(np.allclose(output, self._reference(np.asarray(tensor, dtype=self._input_dtype))))
+
+        result = {
+            "cycles" : sum(cycles for _, cycles in layer_cycles),
+            "layer_cycles" : layer_cycles,
+            "seconds" : end_time - start_time,
+            "output" : output,
+            "matches" : matches
+        }
+        self._results.append(result)
+        return result
+
+    def run(self, inputs, num_inputs = None):
+        ''' run: Runs the model on each input, back to back.
+
+        Args:
+            inputs: An array of inputs (see inputs), e.g., from load_inputs.
+            num_inputs: If given, only the first num_inputs inputs are run.
+
+        Returns:
+            A list with the dict of run_input for each input.
+        '''
+        results = list()
+        for index, tensor in enumerate(self.inputs(inputs)):
+            if num_inputs is not None and index >= num_inputs:
+                break
+            results.append(self.run_input(tensor))
+        return results
+
+    def statistics(self):
+        ''' statistics: Reports the cycles and simulation time of every input run so far.
+
+        Returns:
+            A dict of: inputs, total_cycles, mean_cycles, min_cycles, max_cycles, steady_state_cycles
+            (the mean cycles of every input after the first), seconds, cycles_per_second and
+            inputs_per_second (of simulation), and mismatches (the outputs which did not match the reference).
+        '''
+        cycles = [result["cycles"] for result in self._results]
+        seconds = sum(result["seconds"] for result in self._results)
+        steady_state = cycles[1:] if len(cycles) > 1 else cycles
+        return {
+            "inputs" : len(cycles),
+            "total_cycles" : sum(cycles),
+            "mean_cycles" : sum(cycles)/len(cycles) if cycles else 0,
+            "min_cycles" : min(cycles, default=0),
+            "max_cycles" : max(cycles, default=0),
+            "steady_state_cycles" : sum(steady_state)/len(steady_state) if steady_state else 0,
+            "seconds" : seconds,
+            "cycles_per_second" : sum(cycles)/max(seconds, 1e-9),
+            "inputs_per_second" : len(cycles)/max(seconds, 1e-9),
+            "mismatches" : sum(1 for result in self._results if result["matches"] is False)
+        }
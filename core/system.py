@@ -48,9 +48,16 @@ class System:
         raise NotImplementedError("Please specialize according to the Accelerator Specification")
 
 
-    def tick(self):
-        ''' Moves the system clock count forward 1 tick.
+    def tick(self, cycles = 1):
+        ''' Moves the system clock count forward (default: 1 tick).
+
+        Args:
+            cycles: The number of ticks to move forward. Values larger than 1 are only
+                    valid when no device has work scheduled in the skipped cycles.
         '''
-        self._system_clock.clock()
+        if cycles == 1:
+            self._system_clock.clock()
+        else:
+            self._system_clock.advance(cycles)
 
 
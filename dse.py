@@ -0,0 +1,222 @@
+#!/usr/bin/env python3.8
+
+
+''' dse.py: Explores the design space of an accelerator, by simulating a model on every configuration of a sweep.
+
+Notes:
+    A sweep is a YAML file such as:
+
+        model: examples/mnist.onnx
+        base: examples/accel.yaml     # (or the configuration itself, as a dict)
+        num_inputs: 1
+        seed: 0
+        sweep:
+            num_tile_cols: [1, 2, 4]
+            cache_entries: [1000, 10000]
+        objectives: [cycles, num_tile_cols, cache_entries]
+        share_tensors: true
+
+    Every combination of the swept values is applied to the base configuration, and simulated
+    (in its own process) on the same inputs. Unless share_tensors is false, the model is loaded (and its shapes
+    inferred) once, and published as a bundle (see ONNX2Flex.publish_tensors) which every process attaches to, sharing
+    the initializers' memory. The objectives (all minimized) default to the cycles,
+    and every numeric parameter which is swept (as a proxy of the accelerator's cost).
+'''
+
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import yaml
+import numpy as np
+
+from nnflex import build_accelerator
+from translator.onnx2flex import ONNX2Flex
+from core.session import InferenceSession, load_inputs
+
+
+def expand_sweep(base, sweep):
+    ''' expand_sweep: Applies every combination of the swept values to the base configuration.
+
+    Args:
+        base: A dict of the accelerator's configuration.
+        sweep: A dict of each swept parameter to its list of values.
+
+    Returns:
+        A list of (parameters, configuration): the swept values, and the configuration with them applied.
+    '''
+    names = list(sweep)
+    for name in names:
+        if not isinstance(sweep[name], list) or len(sweep[name]) == 0:
+            raise ValueError("Please list the values to sweep of: "+str(name))
+
+    points = list()
+    for values in itertools.product(*[sweep[name] for name in names]):
+        parameters = dict(zip(names, values))
+        configuration = dict(base)
+        configuration.update(parameters)
+        points.append((parameters, configuration))
+    return points
+
+
+def run_point(point):
+    ''' run_point: Simulates the model on one configuration (the work of a process of the pool).
+
+    Args:
+        point: A tuple of (parameters, configuration, model, bundle, inputs, num_inputs, seed), where bundle is
+               the directory of the model's published tensors (or None, to load the model itself).
+
+    Returns:
+        A dict of the swept parameters, with: cycles (the mean per input), total_cycles, stalls,
+        seconds (of simulation), cycles_per_second, and error (or None, if the configuration ran).
+    '''
+    parameters, configuration, model, bundle, inputs, num_inputs, seed = point
+    # Every process would write its trace to the same file, so the memory's transactions are not logged.
+    configuration = dict(configuration, transaction_log = None)
+    row = dict(parameters)
+    row.update({"cycles" : None, "total_cycles" : None, "stalls" : None, "seconds" : None, "cycles_per_second" : None, "error" : None})
+
+    # The simulator reports every layer; only the table is kept.
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            onnx2flex = ONNX2Flex(model) if bundle is None else ONNX2Flex.attach(bundle)
+            onnx2flex.translate()
+            accelerator = build_accelerator(configuration)
+
+            name, shape, dtype = onnx2flex.get_input_attributes()
+            if inputs is None:
+                dataset = np.random.default_rng(seed).random((num_inputs,) + tuple(shape)).astype(dtype)
+            else:
+                dataset = load_inputs(inputs, name, shape, dtype)
+
+            session = InferenceSession(onnx2flex, accelerator)
+            session.run(dataset, num_inputs)
+        except Exception as error:
+            # (A bad value of a swept parameter may raise anything; it fails its row, not the sweep.)
+            row["error"] = type(error).__name__+": "+str(error)
+            return row
+
+    statistics = session.statistics()
+    row.update({
+        "cycles" : statistics["mean_cycles"],
+        "total_cycles" : statistics["total_cycles"],
+        "stalls" : accelerator.number_of_stalled_cycles(),
+        "seconds" : statistics["seconds"],
+        "cycles_per_second" : statistics["cycles_per_second"],
+    })
+    return row
+
+
+def pareto_front(rows, objectives):
+    ''' pareto_front: Finds the rows which no other row dominates (i.e., is at least as good in every
+    objective, and better in one). Every objective is minimized; rows with an error are left out.
+
+    Returns:
+        A list of the indices of the rows on the front.
+    '''
+    candidates = [index for index, row in enumerate(rows) if row.get("error") is None]
+    front = list()
+    for index in candidates:
+        scores = [rows[index][objective] for objective in objectives]
+        dominated = False
+        for other in candidates:
+            other_scores = [rows[other][objective] for objective in objectives]
+            if all(o <= s for o, s in zip(other_scores, scores)) and any(o < s for o, s in zip(other_scores, scores)):
+                dominated = True
+                break
+        if not dominated:
+            front.append(index)
+    return front
+
+
+def write_table(rows, path):
+    ''' write_table: Writes the rows as a CSV file, or as JSON if path ends with .json.
+    '''
+    if os.path.splitext(path)[1] == ".json":
+        with open(path, "w") as file:
+            json.dump(rows, file, indent=2)
+        return
+
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def explore(spec, workers = None):
+    ''' explore: Simulates every configuration of a sweep, with a pool of processes.
+
+    Args:
+        spec: A dict of the sweep (see Notes of this module).
+        workers: The number of processes (Default: one per CPU).
+
+    Returns:
+        A list with a row (see run_point) per configuration, in the order of the sweep;
+        each row is marked as on (or off) the pareto front of the objectives.
+    '''
+    if "model" not in spec or "sweep" not in spec:
+        raise ValueError("A sweep requires a model, and the parameters to sweep.")
+
+    base = spec.get("base", dict())
+    if isinstance(base, str):
+        with open(base, 'r') as file:
+            base = yaml.load(file, Loader=yaml.SafeLoader)
+
+    sweep = spec["sweep"]
+    configurations = expand_sweep(base, sweep)
+
+    objectives = spec.get("objectives", None)
+    if objectives is None:
+        objectives = ["cycles"] + [name for name in sweep if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in sweep[name])]
+
+    with tempfile.TemporaryDirectory() as bundle:
+        if spec.get("share_tensors", True):
+            ONNX2Flex(spec["model"]).publish_tensors(bundle)
+        else:
+            bundle = None
+
+        points = [(parameters, configuration, spec["model"], bundle, spec.get("inputs", None), int(spec.get("num_inputs", 1)), int(spec.get("seed", 0)))
+                  for parameters, configuration in configurations]
+        with multiprocessing.Pool(workers) as pool:
+            rows = pool.map(run_point, points, chunksize=1)
+
+    front = set(pareto_front(rows, objectives))
+    for index, row in enumerate(rows):
+        row["pareto"] = index in front
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NNFlex: Design-Space Exploration of an accelerator")
+    parser.add_argument('-s','--sweep', help='The YAML file describing the sweep', required=True)
+    parser.add_argument('-o','--output', default='dse.csv', help='The table of results: a .csv or .json file (Default: dse.csv)')
+    parser.add_argument('-j','--workers', type=int, default=None, help='The number of processes to simulate with (Default: one per CPU)')
+    args = parser.parse_args()
+
+    with open(args.sweep, 'r') as file:
+        spec = yaml.load(file, Loader=yaml.SafeLoader)
+
+    start_time = time.time()
+    rows = explore(spec, args.workers)
+    write_table(rows, args.output)
+
+    print("Explored {} configurations in {:.2f} seconds; results written to: {}".format(len(rows), time.time() - start_time, args.output))
+    print("\nPareto Front:\n")
+    for row in rows:
+        if row["pareto"]:
+            print(", ".join("{}: {}".format(key, value) for key, value in row.items() if key not in ("pareto", "error")))
+
+    for row in rows:
+        if row["error"] is not None:
+            print("Failed: "+str({key : row[key] for key in spec["sweep"]})+": "+row["error"])
+
+
+if __name__ == "__main__":
+    main()
@@ -8,21 +8,37 @@ Notes:
 '''
 
 import argparse
+import inspect
 import yaml
 
 import onnxruntime as rt
 
 from accelerators import Nio
 from translator.onnx2flex import ONNX2Flex
+from core.messaging import Message
+from core.compile_cache import CompileCache, digest_file
+from core.session import InferenceSession, load_inputs
 import numpy as np
 
 import cProfile
 
-def configure_accelerator(yaml_config):
+def configure_accelerator(yaml_config, event_driven = False, vector_dot = False, analytical = False, recycle_messages = False, credit_based = False, compile_cache = None):
     print("Configuring Accelerator from: ", yaml_config)
     with open(yaml_config, 'r') as file:
         parsed_config = yaml.load(file, Loader=yaml.SafeLoader)
-    
+
+    return build_accelerator(parsed_config, event_driven, vector_dot, analytical, recycle_messages, credit_based, compile_cache)
+
+
+def build_accelerator(parsed_config, event_driven = False, vector_dot = False, analytical = False, recycle_messages = False, credit_based = False, compile_cache = None):
+    ''' build_accelerator: Creates the accelerator described by a (parsed) configuration.
+
+    Args:
+        parsed_config: A dict of the accelerator's configuration (see examples/accel.yaml).
+
+    Returns:
+        The accelerator.
+    '''
     if "accelerator" not in parsed_config:
         raise ValueError("NNFlex requires the user to request for an accelerator. Example: 'accelerator: nio'")
 
@@ -34,10 +50,24 @@ def configure_accelerator(yaml_config):
         if "num_tile_cols" not in parsed_config:
             raise ValueError("Nio requires the num_tile_cols to be defined.")
 
-        num_tile_rows = parsed_config["num_tile_rows"]
-        num_tile_cols = parsed_config["num_tile_cols"]
-
-        return Nio(num_tile_rows = num_tile_rows, num_tile_cols = num_tile_cols)
+        # Every other key is optional, and is one of Nio's keyword arguments (see examples/accel.yaml for their defaults),
+        # but for the modes given on the command line.
+        parameters = inspect.signature(Nio.__init__).parameters
+        modes = {"event_driven" : event_driven, "vector_dot" : vector_dot, "analytical" : analytical, "recycle_messages" : recycle_messages,
+                 "credit_based" : credit_based, "compile_cache" : compile_cache}
+        config = dict()
+        for key, value in parsed_config.items():
+            if key == "accelerator":
+                continue
+            if key not in parameters or key == "self" or key in modes:
+                raise ValueError("Nio does not have a configuration parameter named: "+str(key))
+            # Numbers are converted to the type of their default (e.g., a YAML float for an int), and None is kept.
+            default = parameters[key].default
+            if value is not None and isinstance(default, (int, float)) and not isinstance(default, bool):
+                value = type(default)(value)
+            config[key] = value
+
+        return Nio(**config, **modes)
     else:
         raise Exception("Accelerator not supported.")
 
@@ -49,38 +79,93 @@ def train(model, onnx2flex, accelerator):
     raise NotImplementedError("Training is not yet implemented.")
 
 
-def inference(model, onnx2flex, accelerator):
+def calibration_report(layers):
+    ''' calibration_report: Displays the analytical estimate of each layer against its simulated cycles.
+
+    Args:
+        layers: A list of (name, op_type, estimated_cycles, simulated_cycles), where estimated_cycles
+                is None for layers without an estimate.
     '''
+    print("\nCalibration Report (Analytical vs. Cycle-Accurate):\n")
+    print("{:<20} {:<15} {:>12} {:>12} {:>9}".format("Layer", "Operation", "Estimated", "Simulated", "Error"))
+
+    errors = list()
+    for name, op_type, estimated, simulated in layers:
+        if estimated is None:
+            print("{:<20} {:<15} {:>12} {:>12} {:>9}".format(name, op_type, "-", simulated, "-"))
+            continue
+        error = 0.0 if simulated == 0 else 100*(estimated - simulated)/simulated
+        errors.append(abs(error))
+        print("{:<20} {:<15} {:>12} {:>12} {:>8.2f}%".format(name, op_type, estimated, simulated, error))
+
+    if errors:
+        print("\nMean Absolute Error: {:.2f}%".format(sum(errors)/len(errors)))
+
+
+def inference(model, onnx2flex, accelerator, calibrate = False, inputs = None, num_inputs = None):
+    ''' inference: Runs the model on each input (back to back), and checks every output against ONNX Runtime.
+
+    Args:
+        model: The path to the ONNX model.
+        inputs: If given, the path to a dataset of inputs (see core.session.load_inputs);
+                otherwise, random inputs are run.
+        num_inputs: The number of inputs to run (Default: every input of the dataset, or 1 random input).
     '''
-    # First, fetch the input:
     name, shape, dtype = onnx2flex.get_input_attributes()
-    # Using the size of the input,
-    # create a random tensor.
-    new_tensor = np.random.random_sample(shape).astype(dtype)
+    if inputs is None:
+        # Using the size of the input, create random tensors.
+        dataset = np.random.random_sample((1 if num_inputs is None else num_inputs,) + tuple(shape)).astype(dtype)
+    else:
+        dataset = load_inputs(inputs, name, shape, dtype)
 
-    # new_tensor = tensor
+    # The ONNX Runtime session is created once, and checks every input.
+    sess = rt.InferenceSession(model)
+    input_name = sess.get_inputs()[0].name
+    reference = lambda tensor: sess.run(None, {input_name: tensor})[0]
+    session = InferenceSession(onnx2flex, accelerator, reference)
 
-    # Now, set the input as the random tensor
-    onnx2flex.set_input(name, new_tensor)
+    # The estimates do not depend on the input.
+    estimates = list()
+    if calibrate:
+        onnx2flex.reset()
+        layer = onnx2flex.next_layer()
+        while layer is not None:
+            estimates.append((layer, accelerator.estimate_cycles(layer)))
+            layer = onnx2flex.next_layer()
 
     print("Executing Inference:\n")
 
-    layer = onnx2flex.next_layer()
-    while layer is not None:
-        prev_layer = layer
-        accelerator.forward(layer)
-        layer = onnx2flex.next_layer()
+    results = list()
+    for index, tensor in enumerate(session.inputs(dataset)):
+        if num_inputs is not None and index >= num_inputs:
+            break
+        result = session.run_input(tensor)
+        results.append(result)
 
-    sess = rt.InferenceSession(model)
-    input_name = sess.get_inputs()[0].name
-    pred_onx = sess.run(None, {input_name: new_tensor})[0]
+        if result["matches"]:
+            print("NNFlex Matches ONNX Runtime.")
+        else:
+            print("NNFlex Mismatch: Results are not equal with respect to ONNX Runtime")
+            print("ONNX Runtime: " + str(reference(np.asarray(tensor, dtype=dtype))))
+            print("NNFlex: " + str(result["output"]))
 
-    if np.allclose(onnx2flex.get_output(), pred_onx):
-        print("NNFlex Matches ONNX Runtime.")
-    else:
-        print("NNFlex Mismatch: Results are not equal with respect to ONNX Runtime")
-        print("ONNX Runtime: " + str(pred_onx))
-        print("NNFlex: " + str(onnx2flex.get_output()))
+    if len(results) > 1:
+        print("\nInference Report:\n")
+        print("{:<8} {:>12} {:>12} {:>16}".format("Input", "Cycles", "Seconds", "Cycles/sec"))
+        for index, result in enumerate(results):
+            print("{:<8} {:>12} {:>12.2f} {:>16.2f}".format(index, result["cycles"], result["seconds"], result["cycles"]/max(result["seconds"], 1e-9)))
+
+        statistics = session.statistics()
+        print("\nInputs: {inputs}; Mismatches: {mismatches}".format(**statistics))
+        print("Cycles: {total_cycles} total, {mean_cycles:.2f} mean ({min_cycles} - {max_cycles}), {steady_state_cycles:.2f} steady-state".format(**statistics))
+        print("Simulator Throughput: {cycles_per_second:10.2f} cycles/sec, {inputs_per_second:.4f} inputs/sec".format(**statistics))
+
+    if calibrate:
+        calibration_report([(layer.get_op_name(), layer.get_op_type(), estimated, simulated) for (layer, estimated), (_, simulated) in zip(estimates, results[0]["layer_cycles"])])
+
+        miss_overlap = accelerator.fit_miss_overlap([(layer, simulated) for (layer, _), (_, simulated) in zip(estimates, results[0]["layer_cycles"])])
+        if miss_overlap is not None:
+            print("Fitted miss_overlap: {:.4f} (set it in the configuration to estimate with it)".format(miss_overlap))
 
 
 def main():
@@ -89,17 +174,65 @@ def main():
     parser.add_argument('-c','--config', help="The YAML file representing the configuation of the accelerator", required=True)
     parser.add_argument('-v','--verbose', action='store_true',  default=False, help='Shows Debug Information.')
     parser.add_argument('--train', action='store_true',  default=False, help='Trains the network with the request accelerator (Default: False)')    
+    parser.add_argument('--event-driven', action='store_true',  default=False, help='Skips idle devices and idle cycles during simulation; only faster when devices idle for long stretches, see the README (Default: False)')
+    parser.add_argument('--vector-dot', action='store_true',  default=False, help='Executes each dot-product as a single vector PE command (Default: False)')
+    parser.add_argument('--analytical', action='store_true',  default=False, help='Estimates the cycles of each layer in closed-form instead of simulating it (Default: False)')
+    parser.add_argument('--calibrate', action='store_true',  default=False, help='Reports the analytical estimate of each simulated layer against its cycles (Default: False)')
+    parser.add_argument('--recycle-messages', action='store_true',  default=False, help='Reuses the Messages between devices once they are consumed (Default: False)')
+    parser.add_argument('--credit-based', action='store_true',  default=False, help='Senders wait for credits instead of retrying full queues every cycle (Default: False)')
+    parser.add_argument('--validate-messages', action='store_true',  default=False, help='Checks the fields of every Message as it is created (Default: False)')
+    parser.add_argument('--resident-weights', action='store_true',  default=False, help='Uploads the weights to memory once, and keeps them there for every layer and inference (Default: False)')
+    parser.add_argument('--compile-cache', default=None, help='A directory to keep the compiled layers in, and reuse them from on the next run (Default: None)')
+    parser.add_argument('--inputs', default=None, help='A dataset of inputs to run back to back: a .npy (memory-mapped), .npz, or raw file of the input dtype (Default: 1 random input)')
+    parser.add_argument('--num-inputs', type=int, default=None, help='The number of inputs to run (Default: every input of --inputs, or 1 random input)')
 
     args = parser.parse_args()
 
+    if args.num_inputs is not None and args.num_inputs < 1:
+        parser.error("--num-inputs must be at least 1")
+
+    if args.analytical and args.calibrate:
+        parser.error("--calibrate compares against the cycle-accurate simulation, and cannot be used with --analytical")
+
+    Message.validate = args.validate_messages
+
     onnx2flex = ONNX2Flex(args.model)
     onnx2flex.translate()
-    accelerator = configure_accelerator(args.config)
+    compile_cache = None
+    if args.compile_cache is not None:
+        compile_cache = CompileCache(args.compile_cache, digest_file(args.model))
+    elif args.inputs is not None or (args.num_inputs or 1) > 1:
+        # Compile each layer once, for every input.
+        compile_cache = CompileCache(None)
+    accelerator = configure_accelerator(args.config, args.event_driven, args.vector_dot, args.analytical, args.recycle_messages, args.credit_based, compile_cache)
+
+    if args.resident_weights:
+        accelerator.pin_tensors(onnx2flex.get_initializers())
 
     if args.train:
         train(args.model, onnx2flex, accelerator)
     else:
-        inference(args.model, onnx2flex, accelerator)
+        inference(args.model, onnx2flex, accelerator, args.calibrate, args.inputs, args.num_inputs)
+
+    if compile_cache is not None:
+        print("Compile Cache: "+str(compile_cache.statistics()))
+
+    if args.resident_weights:
+        residency = accelerator.residency_statistics()
+        print("Resident Tensors: {} ({} words); Uploads Avoided: {} words (~{} memory cycles)".format(
+            residency["resident_arrays"], residency["resident_words"], residency["avoided_words"], residency["avoided_cycles"]))
+
+    if not args.train:
+        for tile_id, statistics in enumerate(accelerator.cache_statistics()):
+            print("Tile "+str(tile_id)+" Cache: "+str(statistics))
+
+        memory = accelerator.memory_statistics()
+        for bank_id, statistics in enumerate(memory["banks"]):
+            print("Memory Bank "+str(bank_id)+": "+str(statistics))
+        for port_id, statistics in enumerate(memory["ports"]):
+            print("Memory Port {}: requests: {}, conflicts: {}, utilization: {:.1%}".format(port_id, statistics["requests"], statistics["conflicts"], statistics["utilization"]))
+        if "row_hit_rate" in memory:
+            print("DRAM Row Hit Rate: {:.1%}; Mean Latency: {:.1f} cycles".format(memory["row_hit_rate"], memory["mean_latency"]))
 
 
 
@@ -3,8 +3,8 @@
 Implement's the arithmetic ONNX node as a flexnode (for use with any accelerator)
 
 '''
-import uuid
 
+import numpy as np
 
 from operators.flexnode import FlexNode
 from core.defines import Operator
@@ -53,8 +53,8 @@ class Arithmetic(FlexNode):
 
         self._length = len(self._in1_flat)
                 
-        self._in1_offset = memory_mapper.map(self._in1_flat)
-        self._in2_offset = memory_mapper.map(self._in2_flat)
+        self._in1_offset = memory_mapper.map(self._in1_flat, self._inputs[0])
+        self._in2_offset = memory_mapper.map(self._in2_flat, self._inputs[1])
         self._out_offset = memory_mapper.map(self._out_flat)
         self._inputs2mem(memory_mapper)
 
@@ -69,16 +69,13 @@ class Arithmetic(FlexNode):
         memory_xfer_engine.sys2mem(self._in2_flat, self._in2_offset)
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._outputs[0].shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
 
-    def compile(self, source, destinations):
+    def compile_stream(self, source, destinations):
         '''
         '''
 
-        tile_commands = list()
+        message_stamp = 0
         num_destinations = len(destinations)
         which_dest = 0
 
@@ -94,10 +91,24 @@ class Arithmetic(FlexNode):
                 "dtype" : self._out_flat.dtype
             }
             destination = destinations[which_dest]
-            message_stamp = uuid.uuid4()
-            tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
-            tile_commands.append(tile_command)
+            yield Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
+            message_stamp += 1
             which_dest += 1
             which_dest = which_dest % num_destinations
 
-        return tile_commands
+    def workload(self):
+        return {
+            "operation" : self._operation,
+            "commands" : self._outputs[0].size,
+            "beats" : 1,
+            "reads" : 2,
+        }
+
+    def evaluate(self):
+        functions = {
+            Operator.ADD : np.add,
+            Operator.MUL : np.multiply,
+            Operator.DIV : np.divide,
+        }
+        result = functions[self._operation](self._inputs[0], self._inputs[1])
+        np.copyto(self._outputs[0], result.astype(self._outputs[0].dtype))
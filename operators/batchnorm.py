@@ -6,7 +6,6 @@ From the ONNX Operator guide: Y = (X - input_mean) / sqrt(input_var + epsilon) *
 
 
 '''
-import uuid
 
 import numpy as np
 
@@ -75,10 +74,7 @@ class BatchNorm(FlexNode):
 
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._out_shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
 
 
     def compile(self, source, destinations):
@@ -120,7 +116,7 @@ class BatchNorm(FlexNode):
                             "op2_addr" : self._bias_offset + c,
                         }
 
-                        message_stamp = uuid.uuid4()
+                        message_stamp = len(tile_commands)
                         tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
                         tile_commands.append(tile_command)
                         which_dest += 1
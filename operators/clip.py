@@ -3,7 +3,6 @@
 Implement's the clip ONNX node as a flexnode (for use with any accelerator)
 
 '''
-import uuid
 
 import numpy as np
 
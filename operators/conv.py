@@ -4,13 +4,13 @@ Implement's the conv ONNX node as a flexnode (for use with any accelerator)
 
 '''
 import itertools
-import uuid
 
 import numpy as np
 
 from operators.flexnode import FlexNode
 from core.defines import Operator
 from core.messaging import Message
+from core.command_buffer import TileCommandBuffer, AffineAccess
   
 class Conv(FlexNode):
 
@@ -80,12 +80,12 @@ class Conv(FlexNode):
             self._in3_shape = in3.shape
             self._in3_flat = in3.flatten()
 
-        self._in1_offset = memory_mapper.map(self._in1_flat)
-        self._in2_offset = memory_mapper.map(self._in2_flat)
+        self._in1_offset = memory_mapper.map(self._in1_flat, self._inputs[0])
+        self._in2_offset = memory_mapper.map(self._in2_flat, self._inputs[1])
         self._out_offset = memory_mapper.map(self._out_flat)
 
         if self._in3_flat is not None:
-            self._in3_offset = memory_mapper.map(self._in3_flat)     
+            self._in3_offset = memory_mapper.map(self._in3_flat, self._inputs[2])     
         self._inputs2mem(memory_mapper)
 
     def unmap(self, memory_mapper):
@@ -104,79 +104,181 @@ class Conv(FlexNode):
             memory_xfer_engine.sys2mem(self._in3_flat, self._in3_offset)
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._out_shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
+
+    def compile_stream(self, source, destinations):
+        return self.compile_buffer().messages(source, destinations)
+
+    def compile_buffer(self):
+        kernel_shape, strides, dilations, pads = self._window_attributes()
+        batch_size, num_channels, in_rows, in_cols = self._in1_shape
+        num_feature_maps, channels_per_group = self._in2_shape[:2]
+        maps_per_group = num_feature_maps // self._group
+        taps_per_map = channels_per_group*kernel_shape[0]*kernel_shape[1]
+
+        # For each output position: the input offsets (relative to the group's first channel) of each
+        # tap, ordered by channel then kernel row and column (i.e., as the weights are laid out).
+        plane_offsets, plane_valid = self.im2col((in_rows, in_cols), self._out_shape[2:], kernel_shape, strides, dilations, pads)
+        num_positions = len(plane_offsets)
+        channel_offsets = np.arange(channels_per_group)[:, None]*in_rows*in_cols
+        in_offsets = (plane_offsets[:, None, :] + channel_offsets).reshape(num_positions, taps_per_map)
+        valid = np.tile(plane_valid, channels_per_group)
+        lengths = valid.sum(axis=1)
+        in_starts = np.cumsum(lengths) - lengths
+
+        # The pool holds the input offsets of each output position's valid taps, then the weight offsets
+        # (relative to the feature map's first weight) of those taps; every batch, group and feature map
+        # shares them. Without padding, every output position reads every weight, so one run is shared.
+        in_pool = in_offsets[valid]
+        if valid.all():
+            wt_pool = np.arange(taps_per_map)
+            wt_starts = len(in_pool)
+        else:
+            wt_pool = np.nonzero(valid)[1]
+            wt_starts = len(in_pool) + in_starts
+
+        buffer = TileCommandBuffer(batch_size*num_feature_maps*num_positions, np.concatenate((in_pool, wt_pool)), self._out_flat.dtype)
+
+        # Index the commands as [batch, feature map, output position].
+        commands = buffer.commands.reshape(batch_size, num_feature_maps, num_positions)
+        batches = np.arange(batch_size)[:, None, None]
+        maps = np.arange(num_feature_maps)[None, :, None]
+        groups = maps // maps_per_group
+
+        commands["res_addr"] = self._out_offset + np.arange(len(buffer)).reshape(commands.shape)
+        commands["col_offset"] = in_starts
+        commands["col_base"] = self._in1_offset + (batches*num_channels + groups*channels_per_group)*in_rows*in_cols
+        commands["row_offset"] = wt_starts
+        commands["row_base"] = self._in2_offset + maps*taps_per_map
+        commands["length"] = lengths
+        if self._in3_flat is not None:
+            commands["bias"] = self._in3_offset + maps
 
-    def compile(self, source, destinations):
+        return buffer
 
-        tile_commands = list()
+    def compile_affine(self, source, destinations, outputs_per_command):
+        kernel_shape, strides, dilations, pads = self._window_attributes()
+        batch_size, num_channels, in_rows, in_cols = self._in1_shape
+        num_feature_maps, channels_per_group = self._in2_shape[:2]
+        out_rows, out_cols = self._out_shape[2:]
+        maps_per_group = num_feature_maps // self._group
+        taps_per_map = channels_per_group*kernel_shape[0]*kernel_shape[1]
 
-        batch_size = self._in1_shape[0]
-        num_channels = self._in1_shape[1]
-        num_feature_maps = self._in2_shape[0]
-        out_shape = self._out_shape
+        # The windows of the output positions which overlap the padding are not affine; those
+        # positions keep their address lists (from the TileCommandBuffer).
+        _, plane_valid = self.im2col((in_rows, in_cols), (out_rows, out_cols), kernel_shape, strides, dilations, pads)
+        interior = plane_valid.all(axis=1).reshape(out_rows, out_cols)
+        buffer = None if interior.all() else self.compile_buffer()
 
+        tile_commands = list()
         num_destinations = len(destinations)
-        which_dest = 0
-
-        seen_output = set()
-
         for b in range(batch_size):
             for m in range(num_feature_maps):
-                o0 = 0
-                i0 = 0
-                while o0 < self._out_shape[2]:
-
-                    o1 = 0
-                    i1 = 0 
-                    while o1 < self._out_shape[3]:
-                        in_addrs = list()
-                        wt_addrs = list()
-                        destination = destinations[which_dest]
-
-                        out_idx = self.ravel_multi_index([b, m, o0, o1], out_shape) + self._out_offset
-                        if out_idx not in seen_output:
-                            seen_output.add(out_idx)
-                        else:
-                            raise ValueError("Seen this output before: "+str(seen_output))
-
-                        for c in range(num_channels):
-                            for kern0 in range(self._kernel_shape[0]):
-                                for kern1 in range(self._kernel_shape[1]):
-
-                                    ii0 = i0 + kern0 + self._dilations[0] -1 
-                                    if ii0 < 0 or ii0 >= self._in1_shape[2]:
-                                        continue
-                                    ii1 = i1 + kern1 + self._dilations[1] -1 
-                                    if ii1 < 0 or ii1 >= self._in1_shape[3]:
-                                        continue
-
-                                    in_addrs.append(self.ravel_multi_index([b, c, i0+kern0, i1+kern1], self._in1_shape) + self._in1_offset)
-                                    wt_addrs.append(self.ravel_multi_index([m, c, kern0, kern1], self._in2_shape) + self._in2_offset)
-
+                group = m // maps_per_group
+                in_base = self._in1_offset + (b*num_channels + group*channels_per_group)*in_rows*in_cols
+                map_index = (b*num_feature_maps + m)*out_rows*out_cols
+                for row in range(out_rows):
+                    col = 0
+                    while col < out_cols:
+                        destination = destinations[len(tile_commands) % num_destinations]
+                        out_idx = map_index + row*out_cols + col
+
+                        if not interior[row, col]:
+                            tile_commands.append(buffer.message(source, destination, out_idx, len(tile_commands)))
+                            col += 1
+                            continue
+
+                        # A run of interior output positions along the row.
+                        num_outputs = 1
+                        while num_outputs < outputs_per_command and col + num_outputs < out_cols and interior[row, col + num_outputs]:
+                            num_outputs += 1
+
+                        in_row = row*strides[0] - pads[0]
+                        in_col = col*strides[1] - pads[1]
                         attributes = {
-                            "res_addr" : out_idx,
+                            "res_addr" : self._out_offset + out_idx,
                             "operation" : Operator.DOT,
                             "dtype" : self._out_flat.dtype,
-                            "col_addrs" : in_addrs,
-                            "row_addrs" : wt_addrs,
+                            "col_access" : AffineAccess(in_base + in_row*in_cols + in_col,
+                                                        (strides[1], in_rows*in_cols, dilations[0]*in_cols, dilations[1]),
+                                                        (num_outputs, channels_per_group, kernel_shape[0], kernel_shape[1])),
+                            "row_access" : AffineAccess(self._in2_offset + m*taps_per_map, (0, 1), (num_outputs, taps_per_map)),
+                            "res_access" : AffineAccess(self._out_offset + out_idx, (1,), (num_outputs,)),
                         }
-
                         if self._in3_flat is not None:
-                            attributes["bias"] = m + self._in3_offset
-                        message_stamp = uuid.uuid4()
-                        tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
-                        tile_commands.append(tile_command)
+                            attributes["bias_access"] = AffineAccess(self._in3_offset + m, (0,), (num_outputs,))
+                        tile_commands.append(Message(source, destination, Message.TileCmd, len(tile_commands), attributes=attributes))
+                        col += num_outputs
 
-                        which_dest += 1
-                        which_dest = which_dest % num_destinations
+        return tile_commands
 
-                        i1 += self._strides[1]
-                        o1 += 1
+    def _window_attributes(self):
+        ''' _window_attributes: Returns the (kernel_shape, strides, dilations, pads) of the convolution,
+        applying the ONNX defaults for any attribute the node does not specify.
+        '''
+        kernel_shape = self._kernel_shape if self._kernel_shape is not None else self._inputs[1].shape[2:]
+        strides = self._strides if self._strides is not None else [1, 1]
+        dilations = self._dilations if self._dilations is not None else [1, 1]
+        pads = self._pads if self._pads is not None else [0, 0, 0, 0]
+        return kernel_shape, strides, dilations, pads
+
+    def workload(self):
+        batch_size, num_channels, in_rows, in_cols = self._inputs[0].shape
+        num_feature_maps, channels_per_group = self._inputs[1].shape[:2]
+        maps_per_group = num_feature_maps // self._group
+        out_rows, out_cols = self._outputs[0].shape[2:]
+        kernel_shape, strides, dilations, pads = self._window_attributes()
+
+        outputs_per_map = out_rows*out_cols
+        # Taps which fall in the padding are not read (see compile_buffer), so commands near the border
+        # are shorter; the workload describes the mean command.
+        offsets, valid = self.im2col((in_rows, in_cols), (out_rows, out_cols), kernel_shape, strides, dilations, pads)
+        macs = channels_per_group*valid.sum()/outputs_per_map
+        # Only the input positions (and weights) covered by a valid tap are ever read.
+        used_inputs = channels_per_group*len(np.unique(offsets[valid]))
+        used_weights = channels_per_group*int(valid.any(axis=0).sum())
+
+        operands = [
+            # Each output position reads a window of its group's channels, which every feature map of the group reads again.
+            (used_inputs, batch_size*self._group, maps_per_group*outputs_per_map, 1,
+             (macs, batch_size*self._group*outputs_per_map, maps_per_group, outputs_per_map)),
+            (used_weights, num_feature_maps, outputs_per_map, 1),
+        ]
+        if len(self._inputs) == 3:
+            operands.append((1, num_feature_maps, outputs_per_map, 1))
+
+        return {
+            "operation" : Operator.DOT,
+            "commands" : batch_size*num_feature_maps*outputs_per_map,
+            "beats" : macs + (len(self._inputs) == 3),
+            "reads" : 2*macs + (len(self._inputs) == 3),
+            "operands" : operands,
+            # The first feature map of each group reads new inputs, every other map only reads new weights.
+            "refills" : batch_size*self._group*outputs_per_map + num_feature_maps - self._group,
+        }
+
+    def evaluate(self):
+        in1 = self._inputs[0]
+        in2 = self._inputs[1]
+        out_rows, out_cols = self._outputs[0].shape[2:]
+        kernel_shape, strides, dilations, pads = self._window_attributes()
+
+        padded = np.pad(in1, ((0, 0), (0, 0), (pads[0], pads[2]), (pads[1], pads[3])))
+        channels_per_group = in2.shape[1]
+        maps_per_group = in2.shape[0] // self._group
+
+        result = np.zeros(self._outputs[0].shape, dtype=np.float64)
+        for g in range(self._group):
+            channels = slice(g*channels_per_group, (g+1)*channels_per_group)
+            maps = slice(g*maps_per_group, (g+1)*maps_per_group)
+            for kern0 in range(kernel_shape[0]):
+                for kern1 in range(kernel_shape[1]):
+                    row = kern0*dilations[0]
+                    col = kern1*dilations[1]
+                    window = padded[:, channels, row:row + (out_rows-1)*strides[0] + 1:strides[0], col:col + (out_cols-1)*strides[1] + 1:strides[1]]
+                    result[:, maps] += np.einsum("bchw,mc->bmhw", window, in2[maps, :, kern0, kern1])
 
-                    i0 += self._strides[0]
-                    o0 += 1
+        if len(self._inputs) == 3:
+            result += self._inputs[2].reshape(1, -1, 1, 1)
 
-        return tile_commands
+        np.copyto(self._outputs[0], result.astype(self._outputs[0].dtype))
@@ -17,6 +17,12 @@ class FlexNode:
     def get_op_type(self):
         return self._onnx_node.op_type
 
+    def get_inputs(self):
+        return self._inputs
+
+    def get_outputs(self):
+        return self._outputs
+
     def map(self, memory_mapper):
         ''' map: Maps all numpy arrays into the memory-system referenced by memory_mapper via
                 NNFlex's memory-allocator.
@@ -56,9 +62,107 @@ class FlexNode:
     def compile(self, source, destinations):
         ''' Compiles the computations for the FlexNode as Tile Messages.
 
+        Notes:
+            By default, this collects the Tile Messages of compile_stream into a list.
+
+        Args:
+            source: the Device which is sending the messages.
+            destinations: a list of all possible destination devices which can compute this.
+        '''
+        return list(self.compile_stream(source, destinations))
+
+
+    def compile_stream(self, source, destinations):
+        ''' Compiles the computations for the FlexNode as Tile Messages, lazily (as an iterator),
+        so only the Tile Messages an accelerator has yet to send need to be held.
+
+        Notes:
+            Specializations which only specify compile are streamed from its list.
+
+        Args:
+            source: the Device which is sending the messages.
+            destinations: a list of all possible destination devices which can compute this.
+        '''
+        if type(self).compile is FlexNode.compile:
+            raise NotImplementedError("Specializations must specify this.")
+        return iter(self.compile(source, destinations))
+
+
+    def compile_buffer(self):
+        ''' compile_buffer: Compiles the computations for the FlexNode as a TileCommandBuffer, a compact
+        (struct-of-arrays) store of its tile commands which compile_stream creates the Tile Messages from.
+
+        Returns:
+            A TileCommandBuffer, or None if the FlexNode does not compile to one (its tile commands are not all DOTs).
+        '''
+        return None
+
+
+    def compile_affine(self, source, destinations, outputs_per_command):
+        ''' compile_affine: Compiles the computations for the FlexNode as Tile Messages which carry affine
+        access descriptors (see core.command_buffer.AffineAccess) instead of address lists, each covering a
+        tile of up to outputs_per_command outputs.
+
         Args:
             source: the Device which is sending the messages.
             destinations: a list of all possible destination devices which can compute this.
+            outputs_per_command: The most outputs a Tile Message may cover.
+
+        Returns:
+            A list of Tile Messages, or None if the FlexNode does not compile to affine accesses.
+        '''
+        return None
+
+
+    def compile_key(self):
+        ''' compile_key: Describes everything the tile commands of this FlexNode depend on: the ONNX node,
+        the shapes and dtypes of its inputs and outputs, and where they are mapped in memory (i.e., after map).
+
+        Returns:
+            bytes
+        '''
+        key = [self._onnx_node.SerializeToString()]
+        for tensor in list(self._inputs) + list(self._outputs):
+            key.append(repr((tensor.shape, str(tensor.dtype))).encode())
+        offsets = sorted((name, int(value)) for name, value in vars(self).items() if name.endswith("_offset"))
+        key.append(repr(offsets).encode())
+        return b"\0".join(key)
+
+
+    def num_commands(self):
+        ''' num_commands: The number of Tile Messages compile (or compile_stream) produces, without compiling.
+
+        Returns:
+            An int, or None if the FlexNode does not know it ahead of compiling (see workload).
+        '''
+        workload = self.workload()
+        if workload is None:
+            return None
+        return workload["commands"]
+
+
+    def workload(self):
+        ''' workload: Summarizes the tile commands this FlexNode compiles to, without compiling them.
+        This is what analytical (closed-form) performance models are built on.
+
+        Returns:
+            None if the FlexNode does not provide a summary, otherwise a dict with:
+                operation: The Operator each tile command performs.
+                commands: The number of tile commands.
+                beats: The number of PE operations per tile command.
+                reads: The number of memory operands per tile command.
+                operands: (DOT only) A list of (group_size, num_groups, uses_per_group, use_stride[, windows]) describing
+                          each cacheable input; a group is a set of addresses which a command reads together,
+                          and use_stride is the distance (in commands) between consecutive uses of a group.
+                          If the commands only read parts of a group, windows describes those parts (with the
+                          same fields), so a tile which is dealt some of the parts is not charged the whole group.
+                refills: (DOT only) The number of commands which read an address no earlier command has read.
+        '''
+        return None
+
+
+    def evaluate(self):
+        ''' evaluate: Computes the outputs of this FlexNode directly with NumPy (i.e., without an accelerator).
         '''
         raise NotImplementedError("Specializations must specify this.")
 
@@ -99,6 +203,35 @@ class FlexNode:
         '''
         return np.ravel_multi_index(tuple(indexes), tuple(dims))
 
+    def im2col(self, in_dims, out_dims, kernel_shape, strides, dilations, pads):
+        ''' im2col:
+
+        Computes, for every output position of a 2D sliding window, the flat index (within an
+        input plane of in_dims) of each kernel tap, for use in compiling addresses without a loop per element.
+
+        Args:
+            in_dims: The (rows, cols) of the input plane.
+            out_dims: The (rows, cols) of the output plane.
+            kernel_shape, strides, dilations: The (rows, cols) of each window attribute.
+            pads: The [top, left, bottom, right] padding of the input plane.
+
+        Returns:
+            (offsets, valid): Two arrays of shape (out_rows*out_cols, kernel_rows*kernel_cols), with outputs
+            and taps in row-major order. A tap which falls in the padding is not valid (and its offset is meaningless).
+        '''
+        rows = np.arange(out_dims[0])[:, None]*strides[0] - pads[0] + np.arange(kernel_shape[0])[None, :]*dilations[0]
+        cols = np.arange(out_dims[1])[:, None]*strides[1] - pads[1] + np.arange(kernel_shape[1])[None, :]*dilations[1]
+
+        # Index as [out_row, out_col, kernel_row, kernel_col].
+        rows = rows[:, None, :, None]
+        cols = cols[None, :, None, :]
+        offsets = rows*in_dims[1] + cols
+        valid = (rows >= 0) & (rows < in_dims[0]) & (cols >= 0) & (cols < in_dims[1])
+
+        num_positions = out_dims[0]*out_dims[1]
+        num_taps = kernel_shape[0]*kernel_shape[1]
+        return offsets.reshape(num_positions, num_taps), np.broadcast_to(valid, offsets.shape).reshape(num_positions, num_taps)
+
     def unravel_index(self, index, dims):
         ''' unravel_index:
 
@@ -3,13 +3,13 @@
 Implement's the GeMM ONNX node as a flexnode (for use with any accelerator)
 
 '''
-import uuid
 
 import numpy as np
 
 from operators.flexnode import FlexNode
 from core.defines import Operator
 from core.messaging import Message
+from core.command_buffer import TileCommandBuffer, AffineAccess
   
 class GeMM(FlexNode):
 
@@ -75,11 +75,12 @@ class GeMM(FlexNode):
             self._in3_shape = in3.shape
             self._in3_flat = in3.flatten()
 
-        self._in1_offset = memory_mapper.map(self._in1_flat)
-        self._in2_offset = memory_mapper.map(self._in2_flat)
+        # (The layouts tell arrays made differently from the same tensor apart.)
+        self._in1_offset = memory_mapper.map(self._in1_flat, self._inputs[0], None if self._transA == 0 and self._alpha == 1 else ("gemm_a", self._transA, self._alpha))
+        self._in2_offset = memory_mapper.map(self._in2_flat, self._inputs[1], None if self._transB == 0 else ("gemm_b", self._transB))
         self._out_offset = memory_mapper.map(self._out_flat)
         if self._in3_flat is not None:
-            self._in3_offset = memory_mapper.map(self._in3_flat)
+            self._in3_offset = memory_mapper.map(self._in3_flat, self._inputs[2], ("gemm_c", self._beta, self._out_shape))
         self._inputs2mem(memory_mapper)
 
     def unmap(self, memory_mapper):
@@ -97,60 +98,89 @@ class GeMM(FlexNode):
             memory_xfer_engine.sys2mem(self._in3_flat, self._in3_offset)
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._out_shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
-
-    def compile(self, source, destinations):
-        '''
-        '''
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
+
+    def compile_stream(self, source, destinations):
+        return self.compile_buffer().messages(source, destinations)
+
+    def compile_buffer(self):
+        in1_rows = self._in1_shape[0]
+        in2_rows, in2_cols = self._in2_shape
+
+        # Column j of in2 is in2_offset + j + k*in2_cols, and row i of in1 is in1_offset + i*in2_rows + k,
+        # so every command shares one run of the pool for each.
+        k = np.arange(in2_rows)
+        buffer = TileCommandBuffer(in1_rows*in2_cols, np.concatenate((k*in2_cols, k)), self._out_flat.dtype)
+
+        # Index the commands as [row of in1, column of in2].
+        commands = buffer.commands.reshape(in1_rows, in2_cols)
+        out_idx = np.arange(len(buffer)).reshape(commands.shape)
+
+        commands["res_addr"] = self._out_offset + out_idx
+        commands["col_offset"] = 0
+        commands["col_base"] = self._in2_offset + np.arange(in2_cols)[None, :]
+        commands["row_offset"] = in2_rows
+        commands["row_base"] = self._in1_offset + np.arange(in1_rows)[:, None]*in2_rows
+        commands["length"] = in2_rows
+        if self._in3_flat is not None:
+            commands["bias"] = self._in3_offset + out_idx
 
-        tile_commands = list()
-        out_shape = self._out_shape
-        in1_shape = self._in1_shape
-        in2_shape = self._in2_shape
+        return buffer
 
-        in1_rows = in1_shape[0]
-        in2_rows = in2_shape[0]
-        in2_cols = in2_shape[1]
+    def compile_affine(self, source, destinations, outputs_per_command):
+        in1_rows = self._in1_shape[0]
+        in2_rows, in2_cols = self._in2_shape
 
+        tile_commands = list()
         num_destinations = len(destinations)
-        which_dest = 0
-
-        seen_output = set()
-
+        # Each tile command covers a run of columns of in2 (and of the output), for a row of in1.
         for i in range(in1_rows):
-            for j in range(in2_cols):
-                row_addrs = list()
-                col_addrs = list()
-                out_idx = self.ravel_multi_index([i,j], out_shape) + self._out_offset
-
-                if out_idx not in seen_output:
-                    seen_output.add(out_idx)
-                else:
-                    raise ValueError("Seen this output before: "+str(seen_output))                
-
-                destination = destinations[which_dest]
-
-                for k in range(in2_rows):
-                    row_addrs.append(self.ravel_multi_index([i,k], in1_shape) + self._in1_offset)
-                    col_addrs.append(self.ravel_multi_index([k,j], in2_shape) + self._in2_offset)
-
+            for j in range(0, in2_cols, outputs_per_command):
+                num_outputs = min(outputs_per_command, in2_cols - j)
+                out_idx = i*in2_cols + j
                 attributes = {
-                    "res_addr" : out_idx,
+                    "res_addr" : out_idx + self._out_offset,
                     "operation" : Operator.DOT,
                     "dtype" : self._out_flat.dtype,
-                    "col_addrs" : col_addrs,
-                    "row_addrs" : row_addrs,
+                    "col_access" : AffineAccess(self._in2_offset + j, (1, in2_cols), (num_outputs, in2_rows)),
+                    "row_access" : AffineAccess(self._in1_offset + i*in2_rows, (0, 1), (num_outputs, in2_rows)),
+                    "res_access" : AffineAccess(out_idx + self._out_offset, (1,), (num_outputs,)),
                 }
-
                 if self._in3_flat is not None:
-                    attributes["bias"] = self.ravel_multi_index([i,j], out_shape) + self._in3_offset
-                message_stamp = uuid.uuid4()
-                tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
-                tile_commands.append(tile_command)
-                which_dest += 1
-                which_dest = which_dest % num_destinations
+                    attributes["bias_access"] = AffineAccess(out_idx + self._in3_offset, (1,), (num_outputs,))
+                destination = destinations[len(tile_commands) % num_destinations]
+                tile_commands.append(Message(source, destination, Message.TileCmd, len(tile_commands), attributes=attributes))
 
         return tile_commands
+
+    def workload(self):
+        in1_rows, in1_cols = self._inputs[0].shape[::(1 if self._transA == 0 else -1)]
+        in2_cols = self._inputs[1].shape[1 if self._transB == 0 else 0]
+        has_bias = len(self._inputs) == 3
+
+        operands = [
+            (in1_cols, in1_rows, in2_cols, 1),
+            (in1_cols, in2_cols, in1_rows, in2_cols),
+        ]
+        if has_bias:
+            operands.append((1, in1_rows*in2_cols, 1, 1))
+
+        return {
+            "operation" : Operator.DOT,
+            "commands" : in1_rows*in2_cols,
+            "beats" : in1_cols + has_bias,
+            "reads" : 2*in1_cols + has_bias,
+            "operands" : operands,
+            # Every output has its own bias, otherwise only a new row or column is read.
+            "refills" : in1_rows*in2_cols if has_bias else in1_rows + in2_cols - 1,
+        }
+
+    def evaluate(self):
+        in1 = self._inputs[0] if self._transA == 0 else np.transpose(self._inputs[0])
+        in2 = self._inputs[1] if self._transB == 0 else np.transpose(self._inputs[1])
+
+        result = self._alpha*np.matmul(in1.astype(np.float64), in2)
+        if len(self._inputs) == 3:
+            result += self._beta*np.broadcast_to(self._inputs[2], self._outputs[0].shape)
+
+        np.copyto(self._outputs[0], result.astype(self._outputs[0].dtype))
@@ -3,13 +3,13 @@
 Implement's the MatMul ONNX node as a flexnode (for use with any accelerator)
 
 '''
-import uuid
 
 import numpy as np
 
 from operators.flexnode import FlexNode
 from core.defines import Operator
 from core.messaging import Message
+from core.command_buffer import TileCommandBuffer, AffineAccess
   
 class MatMul(FlexNode):
 
@@ -46,8 +46,8 @@ class MatMul(FlexNode):
         self._out_shape = out.shape
         self._out_flat = out.flatten()
 
-        self._in1_offset = memory_mapper.map(self._in1_flat)
-        self._in2_offset = memory_mapper.map(self._in2_flat)
+        self._in1_offset = memory_mapper.map(self._in1_flat, self._inputs[0])
+        self._in2_offset = memory_mapper.map(self._in2_flat, self._inputs[1])
         self._out_offset = memory_mapper.map(self._out_flat)
 
         self._inputs2mem(memory_mapper)
@@ -63,58 +63,75 @@ class MatMul(FlexNode):
         memory_xfer_engine.sys2mem(self._in2_flat, self._in2_offset)
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._out_shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
 
-    def compile(self, source, destinations):
-        '''
-        '''
+    def compile_stream(self, source, destinations):
+        return self.compile_buffer().messages(source, destinations)
 
-        tile_commands = list()
-        out_shape = self._out_shape
-        in1_shape = self._in1_shape
-        in2_shape = self._in2_shape
-
-        in1_rows = in1_shape[0]
-        in2_rows = in2_shape[0]
-        in2_cols = in2_shape[1]
+    def compile_buffer(self):
+        in1_rows = self._in1_shape[0]
+        in2_rows, in2_cols = self._in2_shape
 
-        num_destinations = len(destinations)
-        which_dest = 0
+        # Column j of in2 is in2_offset + j + k*in2_cols, and row i of in1 is in1_offset + i*in2_rows + k,
+        # so every command shares one run of the pool for each.
+        k = np.arange(in2_rows)
+        buffer = TileCommandBuffer(in1_rows*in2_cols, np.concatenate((k*in2_cols, k)), self._out_flat.dtype)
 
-        seen_output = set()
-
-        for i in range(in1_rows):
-            for j in range(in2_cols):
-                row_addrs = list()
-                col_addrs = list()
-                out_idx = self.ravel_multi_index([i,j], out_shape) + self._out_offset
+        # Index the commands as [row of in1, column of in2].
+        commands = buffer.commands.reshape(in1_rows, in2_cols)
+        out_idx = np.arange(len(buffer)).reshape(commands.shape)
 
-                if out_idx not in seen_output:
-                    seen_output.add(out_idx)
-                else:
-                    raise ValueError("Seen this output before: "+str(seen_output))                
+        commands["res_addr"] = self._out_offset + out_idx
+        commands["col_offset"] = 0
+        commands["col_base"] = self._in2_offset + np.arange(in2_cols)[None, :]
+        commands["row_offset"] = in2_rows
+        commands["row_base"] = self._in1_offset + np.arange(in1_rows)[:, None]*in2_rows
+        commands["length"] = in2_rows
 
-                destination = destinations[which_dest]
+        return buffer
 
-                for k in range(in2_rows):
-                    row_addrs.append(self.ravel_multi_index([i,k], in1_shape) + self._in1_offset)
-                    col_addrs.append(self.ravel_multi_index([k,j], in2_shape) + self._in2_offset)
+    def compile_affine(self, source, destinations, outputs_per_command):
+        in1_rows = self._in1_shape[0]
+        in2_rows, in2_cols = self._in2_shape
 
+        tile_commands = list()
+        num_destinations = len(destinations)
+        # Each tile command covers a run of columns of in2 (and of the output), for a row of in1.
+        for i in range(in1_rows):
+            for j in range(0, in2_cols, outputs_per_command):
+                num_outputs = min(outputs_per_command, in2_cols - j)
+                out_idx = i*in2_cols + j
                 attributes = {
-                    "res_addr" : out_idx,
+                    "res_addr" : out_idx + self._out_offset,
                     "operation" : Operator.DOT,
                     "dtype" : self._out_flat.dtype,
-                    "col_addrs" : col_addrs,
-                    "row_addrs" : row_addrs,
+                    "col_access" : AffineAccess(self._in2_offset + j, (1, in2_cols), (num_outputs, in2_rows)),
+                    "row_access" : AffineAccess(self._in1_offset + i*in2_rows, (0, 1), (num_outputs, in2_rows)),
+                    "res_access" : AffineAccess(out_idx + self._out_offset, (1,), (num_outputs,)),
                 }
-
-                message_stamp = uuid.uuid4()
-                tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
-                tile_commands.append(tile_command)
-                which_dest += 1
-                which_dest = which_dest % num_destinations
+                destination = destinations[len(tile_commands) % num_destinations]
+                tile_commands.append(Message(source, destination, Message.TileCmd, len(tile_commands), attributes=attributes))
 
         return tile_commands
+
+    def workload(self):
+        in1_rows, in1_cols = self._inputs[0].shape[-2:]
+        in2_cols = self._inputs[1].shape[-1]
+        batch_size = int(np.prod(self._outputs[0].shape[:-2]))
+
+        return {
+            "operation" : Operator.DOT,
+            "commands" : batch_size*in1_rows*in2_cols,
+            "beats" : in1_cols,
+            "reads" : 2*in1_cols,
+            "operands" : [
+                (in1_cols, batch_size*in1_rows, in2_cols, 1),
+                (in1_cols, batch_size*in2_cols, in1_rows, in2_cols),
+            ],
+            # Only a new row or column is read by each command.
+            "refills" : batch_size*(in1_rows + in2_cols - 1),
+        }
+
+    def evaluate(self):
+        result = np.matmul(self._inputs[0].astype(np.float64), self._inputs[1])
+        np.copyto(self._outputs[0], result.astype(self._outputs[0].dtype))
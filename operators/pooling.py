@@ -4,13 +4,13 @@ Implement's {Max, Average}Pool ONNX node as a flexnode (for use with any acceler
 
 '''
 import itertools
-import uuid
 
 import numpy as np
 
 from operators.flexnode import FlexNode
 from core.defines import Operator
 from core.messaging import Message
+from core.utils import float_to_int_repr_of_float
   
 class Pooling(FlexNode):
 
@@ -77,7 +77,7 @@ class Pooling(FlexNode):
         self._out_flat = out.flatten()
 
 
-        self._in1_offset = memory_mapper.map(self._in1_flat)
+        self._in1_offset = memory_mapper.map(self._in1_flat, self._inputs[0])
         self._out_offset = memory_mapper.map(self._out_flat)
 
         self._inputs2mem(memory_mapper)
@@ -92,88 +92,121 @@ class Pooling(FlexNode):
         memory_xfer_engine.sys2mem(self._in1_flat, self._in1_offset)
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._out_shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
 
-    def compile(self, source, destinations):
+    def compile_stream(self, source, destinations):
+        ''' Each output is computed by one tile command per (unpadded) tap of its window:
+        the first copies the tap into the output, and the others accumulate a tap into it.
+        Averaging then divides each output by its number of taps.
+        '''
 
-        tile_commands = list()
+        message_stamp = 0
 
-        batch_size = self._in1_shape[0]
-        num_channels = self._in1_shape[1]
-        out_shape = self._out_shape
+        kernel_shape, strides, dilations, pads = self._window_attributes()
+        batch_size, num_channels, in_rows, in_cols = self._in1_shape
 
         num_destinations = len(destinations)
         which_dest = 0
 
-        seen_output = set()
-
-        for b in range(batch_size):
-            for m in range(num_channels):
-                o0 = 0
-                i0 = 0
-                while o0 < self._out_shape[2]:
-
-                    o1 = 0
-                    i1 = 0 
-                    while o1 < self._out_shape[3]:
-                        in_addrs = list()
-                        wt_addrs = list()
-                        destination = destinations[which_dest]
-
-                        out_idx = self.ravel_multi_index([b, m, o0, o1], out_shape) + self._out_offset
-                        if out_idx not in seen_output:
-                            seen_output.add(out_idx)
-                        else:
-                            raise ValueError("Seen this output before: "+str(seen_output))
-
-                        for kern0 in range(self._kernel_shape[0]):
-                            for kern1 in range(self._kernel_shape[1]):
-
-                                ii0 = i0 + kern0 + self._dilations[0] -1 
-                                if ii0 < 0 or ii0 >= self._in1_shape[2]:
-                                    continue
-                                ii1 = i1 + kern1 + self._dilations[1] -1 
-                                if ii0 < 0 or ii0 >= self._in1_shape[3]:
-                                    continue
-
-                                in1 = self.ravel_multi_index([b, c, i0+kern0, i1+kern1], self._in1_shape) + self._in1_offset
-
-                                attributes = {
-                                    "res_addr" : out_idx,
-                                    "operation" : self._operation,
-                                    "dtype" : self._out_flat.dtype,
-                                    "in1_addr" : out_idx,
-                                    "in2_addr" : in1,
-                                }
-
-                                message_stamp = uuid.uuid4()
-                                tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
-                                tile_commands.append(tile_command)
-
-                        if self._specialization == "AVG":
-                            # This implies tha
-                            attributes = {
-                                "res_addr" : out_idx,
-                                "operation" : Operator.DIV,
-                                "dtype" : self._out_flat.dtype,
-                                "in1_addr" : out_idx,
-                                "in2" : self._kernel_shape[0]*self._kernel_shape[1],
-                            }
-
-                            message_stamp = uuid.uuid4()
-                            tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
-                            tile_commands.append(tile_command)                            
-
-                        which_dest += 1
-                        which_dest = which_dest % num_destinations
-
-                        i1 += self._strides[1]
-                        o1 += 1
-
-                    i0 += self._strides[0]
-                    o0 += 1
-
-        return tile_commands
+        plane_offsets, valid = self.im2col((in_rows, in_cols), self._out_shape[2:], kernel_shape, strides, dilations, pads)
+        num_positions = len(plane_offsets)
+        position_offsets = [plane_offsets[p][valid[p]] for p in range(num_positions)]
+
+        out_idx = self._out_offset
+        for plane in range(batch_size*num_channels):
+            in_addrs = [(offsets + self._in1_offset + plane*in_rows*in_cols).tolist() for offsets in position_offsets]
+
+            for p in range(num_positions):
+                destination = destinations[which_dest]
+
+                for tap, in_addr in enumerate(in_addrs[p]):
+                    attributes = {
+                        "res_addr" : out_idx,
+                        "operation" : self._operation,
+                        "dtype" : self._out_flat.dtype,
+                        "op1_addr" : in_addr if tap == 0 else out_idx,
+                    }
+                    if tap == 0 and self._specialization != "Max":
+                        attributes["op2"] = float_to_int_repr_of_float(0)
+                    else:
+                        attributes["op2_addr"] = in_addr
+
+                    yield Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
+                    message_stamp += 1
+
+                if self._specialization != "Max":
+                    # Padding is not counted towards the average.
+                    attributes = {
+                        "res_addr" : out_idx,
+                        "operation" : Operator.DIV,
+                        "dtype" : self._out_flat.dtype,
+                        "op1_addr" : out_idx,
+                        "op2" : float_to_int_repr_of_float(len(in_addrs[p])),
+                    }
+
+                    yield Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
+                    message_stamp += 1
+
+                out_idx += 1
+                which_dest += 1
+                which_dest = which_dest % num_destinations
+
+    def _window_attributes(self):
+        ''' _window_attributes: Returns the (kernel_shape, strides, dilations, pads) of the pooling window,
+        applying the ONNX defaults for any attribute the node does not specify.
+        '''
+        strides = self._strides if self._strides is not None else [1, 1]
+        dilations = self._dilations if self._dilations is not None else [1, 1]
+        pads = self._pads if self._pads is not None else [0, 0, 0, 0]
+        return self._kernel_shape, strides, dilations, pads
+
+    def workload(self):
+        kernel_shape, strides, dilations, pads = self._window_attributes()
+        batch_size, num_channels, in_rows, in_cols = self._inputs[0].shape
+        num_outputs = self._outputs[0].size
+        # A command per tap, except for taps in the padding.
+        _, valid = self.im2col((in_rows, in_cols), self._outputs[0].shape[2:], kernel_shape, strides, dilations, pads)
+        commands = batch_size*num_channels*int(valid.sum())
+        if self._specialization != "Max":
+            # Averaging requires a division per output.
+            commands += num_outputs
+
+        return {
+            "operation" : self._operation,
+            "commands" : commands,
+            "beats" : 1,
+            "reads" : 2,
+        }
+
+    def evaluate(self):
+        in1 = self._inputs[0]
+        out_rows, out_cols = self._outputs[0].shape[2:]
+        kernel_shape, strides, dilations, pads = self._window_attributes()
+        pad_width = ((0, 0), (0, 0), (pads[0], pads[2]), (pads[1], pads[3]))
+
+        if self._specialization == "Max":
+            padded = np.pad(in1, pad_width, constant_values=-np.inf)
+            result = np.full(self._outputs[0].shape, -np.inf)
+        else:
+            padded = np.pad(in1, pad_width)
+            # Padding is not counted towards the average.
+            counts = np.pad(np.ones(in1.shape), pad_width)
+            result = np.zeros(self._outputs[0].shape)
+            total = np.zeros(self._outputs[0].shape)
+
+        for kern0 in range(kernel_shape[0]):
+            for kern1 in range(kernel_shape[1]):
+                row = kern0*dilations[0]
+                col = kern1*dilations[1]
+                rows = slice(row, row + (out_rows-1)*strides[0] + 1, strides[0])
+                cols = slice(col, col + (out_cols-1)*strides[1] + 1, strides[1])
+                if self._specialization == "Max":
+                    result = np.maximum(result, padded[:, :, rows, cols])
+                else:
+                    result += padded[:, :, rows, cols]
+                    total += counts[:, :, rows, cols]
+
+        if self._specialization != "Max":
+            result /= total
+
+        np.copyto(self._outputs[0], result.astype(self._outputs[0].dtype))
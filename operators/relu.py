@@ -3,7 +3,6 @@
 Implement's the ReLU ONNX node as a flexnode (for use with any accelerator)
 
 '''
-import uuid
 
 import numpy as np
 
@@ -34,7 +33,7 @@ class ReLU(FlexNode):
         out = self._outputs[0]
         self._out_flat = out.flatten()
 
-        self._in1_offset = memory_mapper.map(self._in1_flat)
+        self._in1_offset = memory_mapper.map(self._in1_flat, self._inputs[0])
         self._out_offset = memory_mapper.map(self._out_flat)
         self._inputs2mem(memory_mapper)
 
@@ -47,16 +46,13 @@ class ReLU(FlexNode):
         memory_xfer_engine.sys2mem(self._in1_flat, self._in1_offset)
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._outputs[0].shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
 
-    def compile(self, source, destinations):
+    def compile_stream(self, source, destinations):
         '''
         '''
 
-        tile_commands = list()
+        message_stamp = 0
 
         num_destinations = len(destinations)
         which_dest = 0
@@ -74,10 +70,18 @@ class ReLU(FlexNode):
                 "dtype" : self._out_flat.dtype
             }
 
-            message_stamp = uuid.uuid4()
-            tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
-            tile_commands.append(tile_command)
+            yield Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
+            message_stamp += 1
             which_dest += 1
             which_dest = which_dest % num_destinations
 
-        return tile_commands
+    def workload(self):
+        return {
+            "operation" : self._operation,
+            "commands" : self._outputs[0].size,
+            "beats" : 1,
+            "reads" : 1,
+        }
+
+    def evaluate(self):
+        np.copyto(self._outputs[0], np.maximum(self._inputs[0], 0).astype(self._outputs[0].dtype))
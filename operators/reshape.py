@@ -3,7 +3,6 @@
 Implement's the Reshape ONNX node as a flexnode (for use with any accelerator)
 
 '''
-import uuid
 
 import numpy as np
 
@@ -17,7 +16,8 @@ class Reshape(FlexNode):
         FlexNode.__init__(self, onnx_node, inputs, outputs)
 
     def map(self, memory_mapper):
-        pass
+        # The output holds the same words as the input (in the same order), so it may stay where the input is.
+        memory_mapper.alias(self._outputs[0], self._inputs[0])
 
     def unmap(self, memory_mapper):
         pass
@@ -5,7 +5,6 @@ Softmax(input, axis) = Exp(input) / ReduceSum(Exp(input), axis=axis, keepdims=1)
 
 '''
 
-import uuid
 import itertools
 
 from operators.flexnode import FlexNode
@@ -49,7 +48,7 @@ class Softmax(FlexNode):
         self._out_shape = out.shape
         self._out_flat = out.flatten()
                 
-        self._in1_offset = memory_mapper.map(self._in1_flat)
+        self._in1_offset = memory_mapper.map(self._in1_flat, self._inputs[0])
         self._out_offset = memory_mapper.map(self._out_flat)
         self._inputs2mem(memory_mapper)
 
@@ -62,10 +61,7 @@ class Softmax(FlexNode):
         memory_xfer_engine.sys2mem(self._in1_flat, self._in1_offset)
 
     def _mem2output(self, memory_xfer_engine):
-        memory_xfer_engine.mem2sys(self._out_flat, self._out_offset)
-        for i in range(len(self._out_flat)):
-            multi_index = self.unravel_index(i, self._outputs[0].shape)
-            self._outputs[0][multi_index] = self._out_flat[i]
+        memory_xfer_engine.mem2sys(self._outputs[0], self._out_offset)
 
     def compile(self, source, destinations):
         '''
@@ -89,7 +85,7 @@ class Softmax(FlexNode):
                 "dtype" : self._out_flat.dtype
             }
             destination = destinations[which_dest]
-            message_stamp = uuid.uuid4()
+            message_stamp = len(tile_commands)
             tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
             tile_commands.append(tile_command)
             which_dest += 1
@@ -107,7 +103,7 @@ class Softmax(FlexNode):
                 "dtype" : self._out_flat.dtype
             }
             destination = destinations[which_dest]
-            message_stamp = uuid.uuid4()
+            message_stamp = len(tile_commands)
             tile_command = Message(source, destination, Message.TileCmd, message_stamp, attributes=attributes)
             tile_commands.append(tile_command)
             which_dest += 1
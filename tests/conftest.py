@@ -0,0 +1,57 @@
+'''conftest.py:
+
+The fixtures shared by the tests: a Conv of random inputs, and a comparison of the same layer on Nio's modes.
+'''
+
+import pytest
+import numpy as np
+from onnx import helper
+
+from accelerators import Nio
+from operators import Conv
+
+
+def make_conv(in_shape = (1, 2, 6, 6), out_channels = 4, bias = False, pads = (0, 0, 0, 0), strides = (1, 1), group = 1, seed = 0):
+	''' Builds a 3x3 Conv (with dilations of 1) of random inputs, weights and bias (drawn in that order).
+	'''
+	rng = np.random.default_rng(seed)
+	inputs = [rng.random(in_shape, dtype=np.float32), rng.random((out_channels, in_shape[1] // group, 3, 3), dtype=np.float32)]
+	if bias:
+		inputs.append(rng.random(out_channels, dtype=np.float32))
+	out_shape = [(in_shape[2+i] + pads[i] + pads[i+2] - 3) // strides[i] + 1 for i in range(2)]
+	conv_out = np.zeros((in_shape[0], out_channels) + tuple(out_shape), dtype=np.float32)
+	return Conv(helper.make_node("Conv", ["x", "w", "b"][:len(inputs)], ["y"], name="conv", kernel_shape=[3, 3], strides=list(strides), dilations=[1, 1], pads=list(pads), group=group),
+		inputs, [conv_out])
+
+
+def forward_modes(build, modes, num_tile_rows = 2, num_tile_cols = 2):
+	''' Forwards a new node (from build()) on a Nio of each mode (a dict of its keyword arguments),
+	and checks that every mode takes the same cycles, and computes the same outputs.
+
+	Returns:
+		A list of the Nio of each mode.
+	'''
+	cycles = list()
+	outputs = list()
+	accelerators = list()
+	for mode in modes:
+		node = build()
+		accelerator = Nio(num_tile_rows, num_tile_cols, **mode)
+		accelerator.forward(node)
+		cycles.append(accelerator.cycles_per_layer())
+		outputs.append(node._outputs[0])
+		accelerators.append(accelerator)
+
+	assert all(mode_cycles == cycles[0] for mode_cycles in cycles)
+	assert all(np.array_equal(output, outputs[0]) for output in outputs)
+	return accelerators
+
+
+@pytest.fixture
+def build_conv():
+	return make_conv
+
+
+@pytest.fixture
+def compare_modes():
+	return forward_modes
@@ -7,57 +7,67 @@ Note:
 		(1) https://github.com/ngiambla/libmem/blob/master/allocators/libbitmem.c
 		(2) https://tspace.library.utoronto.ca/bitstream/1807/101133/3/Giamblanco_Nicholas_Vincent_202006_MAS_thesis.pdf
 '''
+import functools
+import random
+
 import pytest
 
-from core.allocator import BitAlloc
+from core.allocator import BitAlloc, ExtentAlloc, NumpyBitAlloc
+
+
+ALLOCATORS = [BitAlloc, ExtentAlloc, functools.partial(ExtentAlloc, fit="best"), NumpyBitAlloc]
 
 
 
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
 @pytest.mark.parametrize("mem_size", [None, 0, -1, 34])
 @pytest.mark.parametrize("req_size", [None, 0, -1.0, 33])
-def test_allocator_instantiate_invalid(mem_size, req_size):
+def test_allocator_instantiate_invalid(allocator_class, mem_size, req_size):
 	''' checks if we catch invalid instantiations of the allocator.
 	'''
 	result = False
 	try:
-		BitAlloc(mem_size, req_size)
+		allocator_class(mem_size, req_size)
 	except ValueError as VE:
 		result = True
 
 	assert result
 
 
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
 @pytest.mark.parametrize("mem_size", [100,400,1000])
 @pytest.mark.parametrize("req_size", [4])
 @pytest.mark.parametrize("nbytes",   [4, 8, 16, 17, 32])
-def test_allocator_normal_once(mem_size, req_size, nbytes):
+def test_allocator_normal_once(allocator_class, mem_size, req_size, nbytes):
 	''' checks if a normal allocation is handled correctly.
 
 	We expect the first and only allocation to return an address of 0, 
 	regardless of the size.
 
 	'''
-	allocator = BitAlloc(mem_size, req_size)
+	allocator = allocator_class(mem_size, req_size)
 	assert allocator.alloc(nbytes) == 0
 
 
 
 
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
 @pytest.mark.parametrize("mem_size", [100])
 @pytest.mark.parametrize("req_size", [4])
 @pytest.mark.parametrize("nbytes",   [4, 8, 16, 32])
-def test_allocator_normal_successive(mem_size, req_size, nbytes):
+def test_allocator_normal_successive(allocator_class, mem_size, req_size, nbytes):
 	''' inspects normal successive allocation behaviour.
 	'''
-	allocator = BitAlloc(mem_size, req_size)
+	allocator = allocator_class(mem_size, req_size)
 	for i in range (0, 4):
 		assert allocator.alloc(nbytes) == nbytes*i
 
 
-def test_allocator_alloc_free_alloc():
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
+def test_allocator_alloc_free_alloc(allocator_class):
 	''' Validates the allocator can free memory correctly.
 	'''
-	allocator = BitAlloc(100, 4)
+	allocator = allocator_class(100, 4)
 	addr = None
 	for i in range (0, 4):
 		addr_tmp = allocator.alloc(32)
@@ -70,8 +80,9 @@ def test_allocator_alloc_free_alloc():
 	assert allocator.show_map() == "FFFF80FF0000000000000000"
 
 
-def test_allocator_alloc_free_alloc_misaligned():
-	allocator = BitAlloc(100, 4)
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
+def test_allocator_alloc_free_alloc_misaligned(allocator_class):
+	allocator = allocator_class(100, 4)
 	addr = None
 	for i in range (0, 4):
 		addr_tmp = allocator.alloc(31)
@@ -84,8 +95,9 @@ def test_allocator_alloc_free_alloc_misaligned():
 	assert allocator.show_map() == "FFFF80FF0000000000000000"
 
 
-def test_allocator_alloc_free_alloc_spill_ordered():
-	allocator = BitAlloc(100, 4)
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
+def test_allocator_alloc_free_alloc_spill_ordered(allocator_class):
+	allocator = allocator_class(100, 4)
 	addr0 = None
 	addr2 = None
 	for i in range (0, 4):
@@ -101,8 +113,9 @@ def test_allocator_alloc_free_alloc_spill_ordered():
 	allocator.alloc(4)
 	assert allocator.show_map() == "80FF00FF0000000000000000"
 
-def test_allocator_alloc_free_alloc_spill_unordered():
-	allocator = BitAlloc(100, 4)
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
+def test_allocator_alloc_free_alloc_spill_unordered(allocator_class):
+	allocator = allocator_class(100, 4)
 	addr0 = None
 	addr2 = None
 	for i in range (0, 4):
@@ -121,12 +134,78 @@ def test_allocator_alloc_free_alloc_spill_unordered():
 	assert allocator.show_map() == "00FF00FF0000000000000000"
 
 
-def test_allocator_oom():
+@pytest.mark.parametrize("allocator_class", ALLOCATORS)
+def test_allocator_oom(allocator_class):
 	result = False
-	allocator = BitAlloc(4,4)
+	allocator = allocator_class(4,4)
 
 	if allocator.alloc(8) is None:
 		result = True
 
 	assert result
 
+
+
+def _numpy_single_word_search(memory_size_in_bytes, min_request_size):
+	allocator = NumpyBitAlloc(memory_size_in_bytes, min_request_size)
+	allocator.SEARCH_WORDS = 1
+	return allocator
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("allocator_class", [ExtentAlloc, NumpyBitAlloc, _numpy_single_word_search])
+def test_allocator_matches_bitmap(allocator_class, seed):
+	''' first-fit allocators must reserve exactly what the bitmap allocator does.
+	'''
+	rng = random.Random(seed)
+	bitmap = BitAlloc(4100, 4)
+	other = allocator_class(4100, 4)
+
+	live = list()
+	for i in range(300):
+		if live and rng.random() < 0.45:
+			addr = live.pop(rng.randrange(len(live)))
+			bitmap.free(addr)
+			other.free(addr)
+		else:
+			nbytes = rng.randint(1, 200) if rng.random() < 0.8 else rng.randint(200, 1200)
+			addr = bitmap.alloc(nbytes)
+			assert other.alloc(nbytes) == addr
+			if addr is not None:
+				live.append(addr)
+		assert other.show_map() == bitmap.show_map()
+
+
+def test_allocator_best_fit():
+	allocator = ExtentAlloc(100, 4, fit="best")
+	addrs = [allocator.alloc(16), allocator.alloc(4), allocator.alloc(8), allocator.alloc(4)]
+	allocator.free(addrs[0])
+	allocator.free(addrs[2])
+	# The 2-bit hole is a better fit than the 4-bit hole before it.
+	assert allocator.alloc(8) == addrs[2]
+	assert allocator.show_map() == "0F0000000000000000000000"
+
+
+@pytest.mark.parametrize("fit", [None, "worst"])
+def test_allocator_extent_fit_invalid(fit):
+	result = False
+	try:
+		ExtentAlloc(100, 4, fit)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_allocator_extent_double_free():
+	allocator = ExtentAlloc(100, 4)
+	addr = allocator.alloc(8)
+	allocator.free(addr)
+
+	result = False
+	try:
+		allocator.free(addr)
+	except ValueError as VE:
+		result = True
+
+	assert result
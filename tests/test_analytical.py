@@ -0,0 +1,175 @@
+'''test_analytical.py:
+
+Tests the analytical (closed-form) mode of Nio against its cycle-accurate simulation.
+'''
+
+import pytest
+import numpy as np
+from onnx import helper
+
+from accelerators import Nio
+from operators import Conv, GeMM, Pooling, ReLU
+
+
+def build_nodes(seed):
+	''' Builds a Conv, ReLU and GeMM chain (in that order), with random inputs.
+	'''
+	rng = np.random.default_rng(seed)
+	conv_in = rng.random((1, 2, 6, 6), dtype=np.float32)
+	conv_wt = rng.random((3, 2, 3, 3), dtype=np.float32)
+	conv_bias = rng.random(3, dtype=np.float32)
+	conv_out = np.zeros((1, 3, 2, 2), dtype=np.float32)
+	conv = Conv(helper.make_node("Conv", ["x", "w", "b"], ["y"], name="conv", kernel_shape=[3, 3], strides=[2, 2], dilations=[1, 1]),
+		[conv_in, conv_wt, conv_bias], [conv_out])
+
+	relu_out = np.zeros((1, 3, 2, 2), dtype=np.float32)
+	relu = ReLU(helper.make_node("Relu", ["y"], ["z"], name="relu"), [conv_out], [relu_out])
+
+	gemm_in = rng.random((2, 5), dtype=np.float32)
+	gemm_wt = rng.random((4, 5), dtype=np.float32)
+	gemm_bias = rng.random(4, dtype=np.float32)
+	gemm_out = np.zeros((2, 4), dtype=np.float32)
+	gemm = GeMM(helper.make_node("Gemm", ["a", "b", "c"], ["d"], name="gemm", transB=1),
+		[gemm_in, gemm_wt, gemm_bias], [gemm_out])
+
+	return [conv, relu, gemm]
+
+
+def test_analytical_outputs():
+	simulated = build_nodes(0)
+	accelerator = Nio(1, 1)
+	for node in simulated:
+		accelerator.forward(node)
+
+	estimated = build_nodes(0)
+	accelerator = Nio(1, 1, analytical=True)
+	for node in estimated:
+		accelerator.forward(node)
+
+	for sim_node, est_node in zip(simulated, estimated):
+		assert np.allclose(sim_node._outputs[0], est_node._outputs[0])
+
+
+def test_analytical_cycles():
+	# With a single tile, the estimate is exact.
+	accelerator = Nio(1, 1)
+	for node in build_nodes(0):
+		estimate = accelerator.estimate_cycles(node)
+		accelerator.forward(node)
+		assert estimate == accelerator.cycles_per_layer()
+
+	# Otherwise, the estimate should be close.
+	accelerator = Nio(2, 2)
+	for node in build_nodes(0):
+		estimate = accelerator.estimate_cycles(node)
+		accelerator.forward(node)
+		assert abs(estimate - accelerator.cycles_per_layer()) <= 0.1*accelerator.cycles_per_layer()
+
+
+@pytest.mark.parametrize("group, pads", [(2, [0, 0, 0, 0]), (4, [0, 0, 0, 0]), (2, [1, 1, 1, 1]), (4, [1, 1, 1, 1])])
+def test_analytical_grouped_conv(group, pads, build_conv):
+	# Each command of a grouped conv only reads its group's channels, and skips the taps in the padding.
+	conv = build_conv((1, 4, 6, 6), 4, bias=True, pads=pads, group=group)
+
+	accelerator = Nio(1, 1)
+	estimate = accelerator.estimate_cycles(conv)
+	accelerator.forward(conv)
+	if pads == [0, 0, 0, 0]:
+		assert estimate == accelerator.cycles_per_layer()
+	else:
+		assert abs(estimate - accelerator.cycles_per_layer()) <= 0.02*accelerator.cycles_per_layer()
+
+
+def test_analytical_clock():
+	accelerator = Nio(1, 1, analytical=True)
+	total = 0
+	for node in build_nodes(1):
+		total += accelerator.estimate_cycles(node)
+		accelerator.forward(node)
+		assert accelerator.cycles_per_layer() == accelerator.estimate_cycles(node)
+	assert accelerator._system_clock_ref.current_clock() == total
+
+
+def test_analytical_miss_overlap():
+	# The fitted overlap estimates the simulated layers at least as well as any other overlap.
+	simulated = list()
+	accelerator = Nio(2, 2)
+	for node in build_nodes(0):
+		accelerator.forward(node)
+		simulated.append((node, accelerator.cycles_per_layer()))
+
+	miss_overlap = accelerator.fit_miss_overlap(simulated)
+	assert miss_overlap is not None and miss_overlap >= 0
+
+	def error(overlap):
+		estimator = Nio(2, 2, miss_overlap=overlap)
+		return sum(((estimator.estimate_cycles(node) - cycles)/cycles)**2 for node, cycles in simulated if estimator.estimate_cycles(node) is not None)
+
+	for overlap in [0, 0.5, 1, 2]:
+		assert error(miss_overlap) <= error(overlap)
+
+	# A single tile never contends for the memory.
+	assert Nio(1, 1).fit_miss_overlap(simulated) is None
+
+	result = False
+	try:
+		Nio(2, 2, miss_overlap=-1)
+	except ValueError as VE:
+		result = True
+	assert result
+
+
+def window_output_shape(in_shape, kernel_shape, strides, pads, dilations):
+	return [(in_shape[i] + pads[i] + pads[i+2] - (kernel_shape[i]-1)*dilations[i] - 1)//strides[i] + 1 for i in range(2)]
+
+
+def simulate_and_evaluate(build):
+	''' Returns the outputs of the node (built by build()) when simulated, and when evaluated.
+	'''
+	outputs = list()
+	for analytical in [False, True]:
+		node = build()
+		Nio(2, 2, analytical=analytical).forward(node)
+		outputs.append(node._outputs[0])
+	return outputs
+
+
+@pytest.mark.parametrize("kernel_shape, strides, pads, dilations, group", [
+	([3, 3], [1, 1], [1, 1, 1, 1], [1, 1], 1),
+	([2, 3], [2, 1], [0, 1, 2, 0], [2, 1], 2),
+	([1, 1], [3, 2], [0, 0, 0, 0], [1, 1], 4),
+])
+def test_analytical_conv_window(kernel_shape, strides, pads, dilations, group):
+	rng = np.random.default_rng(0)
+	conv_in = rng.random((2, 4, 6, 7), dtype=np.float32)
+	conv_wt = rng.random((4, 4//group, *kernel_shape), dtype=np.float32)
+	conv_bias = rng.random(4, dtype=np.float32)
+	out_shape = (2, 4, *window_output_shape((6, 7), kernel_shape, strides, pads, dilations))
+
+	def build():
+		node = helper.make_node("Conv", ["x", "w", "b"], ["y"], name="conv", kernel_shape=kernel_shape, strides=strides,
+			pads=pads, dilations=dilations, group=group)
+		return Conv(node, [conv_in, conv_wt, conv_bias], [np.zeros(out_shape, dtype=np.float32)])
+
+	simulated, evaluated = simulate_and_evaluate(build)
+	assert np.allclose(simulated, evaluated, atol=1e-5)
+
+
+@pytest.mark.parametrize("specialization", ["Max", "Avg"])
+@pytest.mark.parametrize("kernel_shape, strides, pads, dilations", [
+	([2, 2], [2, 2], [0, 0, 0, 0], [1, 1]),
+	([3, 3], [2, 1], [1, 1, 1, 1], [1, 1]),
+	([2, 3], [1, 2], [0, 1, 1, 0], [2, 1]),
+])
+def test_analytical_pooling_window(specialization, kernel_shape, strides, pads, dilations):
+	rng = np.random.default_rng(0)
+	pool_in = rng.standard_normal((1, 2, 6, 7)).astype(np.float32)
+	out_shape = (1, 2, *window_output_shape((6, 7), kernel_shape, strides, pads, dilations))
+
+	def build():
+		node = helper.make_node(specialization+"Pool", ["x"], ["y"], name="pool", kernel_shape=kernel_shape, strides=strides,
+			pads=pads, dilations=dilations)
+		return Pooling(node, [pool_in], [np.zeros(out_shape, dtype=np.float32)], specialization)
+
+	simulated, evaluated = simulate_and_evaluate(build)
+	assert np.allclose(simulated, evaluated, atol=1e-6)
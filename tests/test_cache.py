@@ -0,0 +1,243 @@
+'''test_cache.py:
+
+Tests the set-associative Cache, and its replacement policies.
+'''
+
+import pytest
+import numpy as np
+from onnx import helper
+
+from accelerators import Nio
+from operators import GeMM
+from core.cache import Cache
+from core.defines import Operator
+from core.messaging import Message
+from core.utils import float_to_int_repr_of_float
+
+
+@pytest.mark.parametrize("num_entries, num_ways, line_size, replacement", [
+	(0, 1, 1, "lru"),
+	(10, 4, 1, "lru"),
+	(8, 0, 1, "lru"),
+	(8, 1, 0, "lru"),
+	(8, 1, 1, "random"),
+	(12, 3, 1, "plru"),
+])
+def test_cache_invalid(num_entries, num_ways, line_size, replacement):
+	result = False
+	try:
+		Cache(num_entries, num_ways, line_size, replacement)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_cache_direct_mapped():
+	cache = Cache(4)
+	cache.install(1, "a")
+	assert cache.lookup(1) == "a"
+	# 5 maps to the same entry as 1.
+	cache.install(5, "b")
+	assert cache.lookup(1) is None
+	assert cache.lookup(5) == "b"
+	assert cache.statistics() == {"hits" : 2, "misses" : 1, "evictions" : 1, "invalidations" : 0}
+
+
+def test_cache_line():
+	cache = Cache(8, 1, 4)
+	cache.install(5, "a")
+	# Only the word which was installed is valid.
+	assert cache.lookup(5) == "a"
+	assert cache.lookup(4) is None
+	assert cache.contains(5) and not cache.contains(6)
+
+	cache.install(6, "b")
+	assert cache.statistics()["evictions"] == 0
+	# 13 is in another line of the same set.
+	cache.install(13, "c")
+	assert not cache.contains(5) and not cache.contains(6)
+	assert cache.statistics()["evictions"] == 1
+
+
+def test_cache_install_line():
+	cache = Cache(16, 2, 4)
+	memory = list(range(100, 132))
+	# A sequential scan which fills the whole line on a miss only misses once per line.
+	for address in range(32):
+		if cache.lookup(address) is None:
+			cache.install_line({word : memory[word] for word in cache.line_addresses(address)})
+		assert cache.contains(address)
+	assert cache.statistics()["misses"] == 8
+	assert cache.statistics()["hits"] == 24
+	assert list(cache.line_addresses(6)) == [4, 5, 6, 7]
+
+
+@pytest.mark.parametrize("replacement, evicted", [("lru", 1), ("fifo", 0), ("plru", 2)])
+def test_cache_replacement(replacement, evicted):
+	# One set of 4 ways.
+	cache = Cache(4, 4, 1, replacement)
+	for address in range(4):
+		cache.install(address, address)
+
+	# Use the first line again, then install a fifth line.
+	assert cache.lookup(0) == 0
+	cache.install(4, 4)
+
+	assert [cache.contains(address) for address in range(5)] == [address != evicted for address in range(5)]
+	assert cache.statistics()["evictions"] == 1
+
+
+def test_cache_plru():
+	cache = Cache(4, 4, 1, "plru")
+	for address in range(4):
+		cache.install(address, address)
+	for address in [3, 1]:
+		cache.lookup(address)
+
+	# The tree points away from the last use (1), and within the other half, away from 3.
+	cache.install(4, 4)
+	assert not cache.contains(2)
+	# Then away from 4 (which took the way of 2), and within the other half, away from 1.
+	cache.install(5, 5)
+	assert not cache.contains(0)
+
+
+def test_cache_clear():
+	cache = Cache(8, 2, 2)
+	cache.install(0, "a")
+	cache.clear()
+	assert cache.lookup(0) is None
+	# The counters are kept.
+	assert cache.statistics()["misses"] == 1
+
+
+@pytest.mark.parametrize("cache_ways, cache_line_size, cache_replacement", [(1, 1, "lru"), (4, 2, "lru"), (4, 4, "plru"), (2, 1, "fifo")])
+def test_cache_nio(cache_ways, cache_line_size, cache_replacement, build_conv):
+	outputs = list()
+	statistics = list()
+	for cache_entries in [10000, 2*cache_ways*cache_line_size]:
+		conv = build_conv()
+		accelerator = Nio(1, 1, cache_entries=cache_entries, cache_ways=cache_ways, cache_line_size=cache_line_size, cache_replacement=cache_replacement)
+		accelerator.forward(conv)
+		outputs.append(conv._outputs[0])
+		statistics.append(accelerator.cache_statistics()[0])
+
+	# A smaller cache evicts more, and misses more, but computes the same outputs.
+	assert np.array_equal(outputs[0], outputs[1])
+	assert statistics[0]["hits"] > 0
+	assert statistics[1]["misses"] > statistics[0]["misses"]
+	assert statistics[1]["evictions"] > statistics[0]["evictions"]
+
+
+def test_cache_invalidate():
+	cache = Cache(16, 2, 4)
+	for address in range(12):
+		cache.install(address, address)
+
+	cache.invalidate(2, 5)
+	assert [cache.contains(address) for address in range(12)] == [address < 2 or address >= 7 for address in range(12)]
+	assert cache.statistics()["invalidations"] == 5
+
+	# A range larger than the cache.
+	cache.invalidate(0, 1000)
+	assert not any(cache.contains(address) for address in range(12))
+	assert cache.statistics()["invalidations"] == 12
+
+
+def test_cache_invalidate_plru():
+	cache = Cache(4, 4, 1, "plru")
+	for address in range(4):
+		cache.install(address, address)
+	cache.invalidate(1)
+
+	# The invalidated way is free again, so nothing is evicted.
+	cache.install(4, 4)
+	assert cache.statistics()["evictions"] == 0
+	assert all(cache.contains(address) for address in [0, 2, 3, 4])
+
+
+@pytest.mark.parametrize("cache_write_policy", ["invalidate", "allocate"])
+def test_cache_write_policy(cache_write_policy, build_conv):
+	accelerator = Nio(1, 1, cache_write_policy=cache_write_policy)
+	misses = list()
+	for run in range(3):
+		conv = build_conv()
+		if run == 2:
+			# New inputs are invalidated as they are uploaded.
+			conv._inputs[0] += 1
+		accelerator.forward(conv)
+		misses.append(accelerator.cache_statistics()[0]["misses"])
+
+		expected = build_conv()
+		expected._inputs[0] += run == 2
+		expected.evaluate()
+		assert np.allclose(conv._outputs[0], expected._outputs[0], rtol=1e-5)
+
+	# The second run reads its inputs and weights from the caches which persisted.
+	assert misses[1] == misses[0]
+	assert misses[2] - misses[1] > 0
+	assert accelerator.cache_statistics()[0]["invalidations"] > 0
+
+
+def test_cache_write_policy_invalid():
+	result = False
+	try:
+		Nio(1, 1, cache_write_policy="write_back")
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+@pytest.mark.parametrize("cache_line_size", [1, 2, 4, 8])
+def test_cache_line_fill_nio(cache_line_size):
+	rng = np.random.default_rng(0)
+	gemm_a = rng.random((1, 16), dtype=np.float32)
+	gemm_b = rng.random((1, 16), dtype=np.float32)
+	gemm_out = np.zeros((1, 1), dtype=np.float32)
+	gemm = GeMM(helper.make_node("Gemm", ["a", "b"], ["y"], name="gemm", transB=1), [gemm_a, gemm_b], [gemm_out])
+	accelerator = Nio(1, 1, cache_line_size=cache_line_size, cache_entries=64)
+	accelerator.forward(gemm)
+
+	assert np.allclose(gemm_out, gemm_a @ gemm_b.T)
+	# The DOT scans both (line-aligned) operands once: a miss fills its line, and the other
+	# reads of the line wait for the fill.
+	assert accelerator.cache_statistics()[0]["misses"] == 32 // cache_line_size
+	# Each fill reads every word of its line from the memory (each charged as a request).
+	assert accelerator.memory_statistics()["banks"][0]["reads"] == 32
+
+
+def run_dot(accelerator, words, col_addrs, row_addrs, res_addr):
+	''' Writes the words to the memory, and runs a DOT of the addresses on the first tile.
+	'''
+	for address, value in words.items():
+		accelerator._memory._poke(address, float_to_int_repr_of_float(value))
+	tile = accelerator._tiles_flat[0]
+	attributes = {"res_addr" : res_addr, "operation" : Operator.DOT, "dtype" : np.float32, "col_addrs" : col_addrs, "row_addrs" : row_addrs, "bias" : None}
+	accelerator._tile_message_router.send(Message(accelerator, tile, Message.TileCmd, 0, attributes=attributes))
+	while accelerator._tile_message_router.fetch(accelerator) is None:
+		accelerator.process()
+	return tile
+
+
+def test_cache_line_fill_outside_memory():
+	# The words of a line outside the memory are not read into it (nor charged as anything but a request).
+	accelerator = Nio(1, 1, memory_width=12, cache_line_size=8)
+	tile = run_dot(accelerator, {8 : 2.0, 9 : 3.0}, [8], [9], 0)
+
+	assert accelerator._memory._peek(0) == float_to_int_repr_of_float(6.0)
+	assert accelerator.memory_statistics()["banks"][0]["reads"] == 8
+	assert tile._cache.lookup(9) == float_to_int_repr_of_float(3.0)
+	assert tile._cache.lookup(10) is None and tile._cache.lookup(12) is None
+
+
+def test_cache_line_fill_uninitialized():
+	# An operand which waits on a fill for a word never written is read like any other miss (which fails).
+	accelerator = Nio(1, 1, memory_width=16, cache_line_size=4)
+	result = False
+	try:
+		run_dot(accelerator, {0 : 1.0, 1 : 2.0, 2 : 3.0}, [0, 3], [1, 2], 8)
+	except ValueError as VE:
+		result = "uninitialized" in str(VE)
+	assert result
@@ -1,3 +1,5 @@
+import pytest
+
 from core.clock import Clock, ClockReference
 
 
@@ -69,3 +71,26 @@ def test_clock_reference_tracks_clock():
 		result = True
 
 	assert result	
+
+
+def test_clock_advance():
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+
+	clock.clock()
+	clock.advance(41)
+
+	assert clock_ref.current_clock() == 42
+
+
+@pytest.mark.parametrize("cycles", [None, -1, 2.0])
+def test_clock_advance_invalid(cycles):
+	result = False
+
+	clock = Clock()
+	try:
+		clock.advance(cycles)
+	except ValueError as VE:
+		result = True
+
+	assert result and clock.current_clock() == 0
@@ -0,0 +1,147 @@
+'''test_command_buffer.py:
+
+Tests the TileCommandBuffer, and the operators which compile to it.
+'''
+
+import pytest
+import numpy as np
+from onnx import helper
+
+from accelerators import Nio
+from operators import GeMM
+from core.defines import Operator
+from core.command_buffer import TileCommandBuffer, AffineAccess
+
+
+def test_command_buffer_defaults():
+	buffer = TileCommandBuffer(3, [0, 1, 2, 3], np.float32)
+	buffer.commands["length"] = 2
+	buffer.commands["row_offset"] = 2
+	buffer.commands["col_base"] = [0, 10, 20]
+
+	assert len(buffer) == 3
+	assert buffer.col_addrs(1).tolist() == [10, 11]
+	assert buffer.row_addrs(1).tolist() == [2, 3]
+
+	messages = list(buffer.messages(None, ["a", "b"]))
+	assert [message.destination for message in messages] == ["a", "b", "a"]
+	assert [message.message_id for message in messages] == [0, 1, 2]
+	assert all(message.operation == Operator.DOT and message.bias is None for message in messages)
+
+
+@pytest.mark.parametrize("pads", [[0, 0, 0, 0], [1, 1, 1, 1]])
+def test_command_buffer_conv(pads, build_conv):
+	accelerator = Nio(2, 2)
+	conv = build_conv((1, 4, 6, 6), 3, bias=True, pads=pads)
+	conv.map(accelerator._memory_mapper)
+	buffer = conv.compile_buffer()
+
+	assert len(buffer) == conv.num_commands()
+	# The pool is shared by the feature maps, so it holds fewer addresses than the commands read.
+	assert len(buffer.addresses) < buffer.commands["length"].sum()
+
+	out_rows, out_cols = conv._out_shape[2:]
+	for index, message in enumerate(buffer.messages(accelerator, accelerator._tiles_flat)):
+		m, position = divmod(index, out_rows*out_cols)
+		row, col = divmod(position, out_cols)
+		expected = list()
+		for c in range(4):
+			for kern0 in range(3):
+				for kern1 in range(3):
+					in_row = row - pads[0] + kern0
+					in_col = col - pads[1] + kern1
+					if 0 <= in_row < 6 and 0 <= in_col < 6:
+						expected.append((conv._in1_offset + (c*6 + in_row)*6 + in_col, conv._in2_offset + ((m*4 + c)*3 + kern0)*3 + kern1))
+
+		assert list(zip(message.col_addrs.tolist(), message.row_addrs.tolist())) == expected
+		assert message.res_addr == conv._out_offset + index
+		assert message.bias == conv._in3_offset + m
+
+
+def test_command_buffer_gemm():
+	rng = np.random.default_rng(0)
+	gemm_a = rng.random((3, 5), dtype=np.float32)
+	gemm_b = rng.random((5, 4), dtype=np.float32)
+	gemm_out = np.zeros((3, 4), dtype=np.float32)
+	gemm = GeMM(helper.make_node("Gemm", ["a", "b"], ["y"], name="gemm"), [gemm_a, gemm_b], [gemm_out])
+
+	accelerator = Nio(1, 1)
+	gemm.map(accelerator._memory_mapper)
+	buffer = gemm.compile_buffer()
+
+	assert len(buffer.addresses) == 2*5
+	for index, message in enumerate(buffer.messages(accelerator, accelerator._tiles_flat)):
+		i, j = divmod(index, 4)
+		assert message.row_addrs.tolist() == [gemm._in1_offset + i*5 + k for k in range(5)]
+		assert message.col_addrs.tolist() == [gemm._in2_offset + k*4 + j for k in range(5)]
+		assert message.bias is None
+
+	accelerator.forward(gemm)
+	assert np.allclose(gemm_out, gemm_a @ gemm_b, rtol=1e-5)
+
+
+def test_affine_access():
+	access = AffineAccess(100, (10, 1, 3), (2, 2, 3))
+	assert access.num_outputs() == 2
+	assert access.addresses(0) == [100, 103, 106, 101, 104, 107]
+	assert access.addresses(1) == [110, 113, 116, 111, 114, 117]
+
+
+@pytest.mark.parametrize("strides, extents", [((1,), (1, 2)), ((), ()), ((1, 1), (2, 0))])
+def test_affine_access_invalid(strides, extents):
+	result = False
+	try:
+		AffineAccess(0, strides, extents)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def expand(tile_command):
+	# The (col_addrs, row_addrs, res_addr, bias) of each output of a tile command.
+	if not hasattr(tile_command, "col_access"):
+		return [(tile_command.col_addrs.tolist(), tile_command.row_addrs.tolist(), tile_command.res_addr, tile_command.bias)]
+
+	expanded = list()
+	for output in range(tile_command.res_access.num_outputs()):
+		bias = tile_command.bias_access.addresses(output)[0] if hasattr(tile_command, "bias_access") else None
+		expanded.append((tile_command.col_access.addresses(output), tile_command.row_access.addresses(output), tile_command.res_access.addresses(output)[0], bias))
+	return expanded
+
+
+@pytest.mark.parametrize("pads", [[0, 0, 0, 0], [1, 1, 1, 1]])
+@pytest.mark.parametrize("outputs_per_command", [1, 3, 16])
+def test_affine_conv(pads, outputs_per_command, build_conv):
+	accelerator = Nio(2, 2)
+	conv = build_conv((1, 4, 6, 6), 3, bias=True, pads=pads)
+	conv.map(accelerator._memory_mapper)
+
+	tile_commands = conv.compile_affine(accelerator, accelerator._tiles_flat, outputs_per_command)
+	expected = [expand(tile_command)[0] for tile_command in conv.compile_buffer().messages(accelerator, accelerator._tiles_flat)]
+	assert [output for tile_command in tile_commands for output in expand(tile_command)] == expected
+	assert [tile_command.message_id for tile_command in tile_commands] == list(range(len(tile_commands)))
+	if outputs_per_command > 1:
+		assert len(tile_commands) < len(expected)
+
+
+@pytest.mark.parametrize("outputs_per_command", [1, 3, 4])
+def test_affine_simulation(outputs_per_command, build_conv):
+	rng = np.random.default_rng(0)
+	gemm_a = rng.random((3, 5), dtype=np.float32)
+	gemm_b = rng.random((5, 4), dtype=np.float32)
+	gemm_c = rng.random((3, 4), dtype=np.float32)
+
+	outputs = list()
+	for affine in [None, outputs_per_command]:
+		conv = build_conv((1, 4, 6, 6), 3, bias=True, pads=[1, 1, 1, 1])
+		gemm_out = np.zeros((3, 4), dtype=np.float32)
+		gemm = GeMM(helper.make_node("Gemm", ["a", "b", "c"], ["y"], name="gemm"), [gemm_a.copy(), gemm_b, gemm_c], [gemm_out])
+		accelerator = Nio(2, 2, outputs_per_command=affine)
+		accelerator.forward(conv)
+		accelerator.forward(gemm)
+		outputs.append((conv._outputs[0], gemm_out))
+
+	assert np.array_equal(outputs[0][0], outputs[1][0])
+	assert np.array_equal(outputs[0][1], outputs[1][1])
+	assert np.allclose(outputs[1][1], gemm_a @ gemm_b + gemm_c, rtol=1e-5)
@@ -0,0 +1,58 @@
+'''test_compile_cache.py:
+
+Tests the CompileCache keeps and reloads compiled layers.
+'''
+
+import pytest
+import numpy as np
+from onnx import helper
+
+from accelerators import Nio
+from operators import ReLU
+from core.command_buffer import TileCommandBuffer
+from core.compile_cache import CompileCache
+
+
+def test_command_buffer_save_load(tmp_path, build_conv):
+	accelerator = Nio(1, 1)
+	conv = build_conv((1, 2, 5, 5), 2, bias=True, pads=[1, 1, 1, 1])
+	conv.map(accelerator._memory_mapper)
+	buffer = conv.compile_buffer()
+	buffer.save(tmp_path)
+
+	for mmap_mode in ["r", None]:
+		loaded = TileCommandBuffer.load(tmp_path, mmap_mode)
+		assert np.array_equal(loaded.commands, buffer.commands)
+		assert np.array_equal(loaded.addresses, buffer.addresses)
+		assert loaded.dtype == buffer.dtype
+
+
+def test_compile_cache_hit(tmp_path, build_conv, compare_modes):
+	cache = CompileCache(str(tmp_path), "model")
+	compare_modes(lambda: build_conv((1, 2, 5, 5), 2, bias=True, pads=[1, 1, 1, 1]), [{"compile_cache" : cache}, {"compile_cache" : cache}])
+
+	assert cache.statistics() == {"hits" : 1, "misses" : 1}
+
+
+def test_compile_cache_key(tmp_path, build_conv):
+	accelerator = Nio(1, 1)
+	conv = build_conv((1, 2, 5, 5), 2, bias=True, pads=[1, 1, 1, 1])
+	conv.map(accelerator._memory_mapper)
+	moved = build_conv((1, 2, 5, 5), 2, bias=True, pads=[1, 1, 1, 1])
+	moved.map(accelerator._memory_mapper)
+
+	# The key depends on the namespace, and on where the tensors are mapped.
+	assert CompileCache(str(tmp_path), "model").key(conv) == CompileCache(str(tmp_path), "model").key(conv)
+	assert CompileCache(str(tmp_path), "model").key(conv) != CompileCache(str(tmp_path), "other").key(conv)
+	assert CompileCache(str(tmp_path), "model").key(conv) != CompileCache(str(tmp_path), "model").key(moved)
+
+
+def test_compile_cache_unsupported(tmp_path):
+	cache = CompileCache(str(tmp_path))
+	relu_in = np.ones((1, 4), dtype=np.float32)
+	relu = ReLU(helper.make_node("Relu", ["x"], ["y"], name="relu"), [relu_in], [np.zeros((1, 4), dtype=np.float32)])
+	accelerator = Nio(1, 1)
+	relu.map(accelerator._memory_mapper)
+
+	assert cache.compile_buffer(relu) is None
+	assert cache.statistics() == {"hits" : 0, "misses" : 0}
@@ -0,0 +1,125 @@
+'''test_dse.py:
+
+Tests the design-space exploration of an accelerator.
+'''
+
+import csv
+import json
+
+import pytest
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+
+from dse import expand_sweep, pareto_front, write_table, explore
+from nnflex import build_accelerator
+
+
+def build_model(path):
+	weights = np.random.default_rng(0).random((5, 4), dtype=np.float32)
+	graph = helper.make_graph(
+		[helper.make_node("Gemm", ["x", "w"], ["y"], name="gemm")],
+		"model",
+		[helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 5])],
+		[helper.make_tensor_value_info("y", TensorProto.FLOAT, [1, 4])],
+		[numpy_helper.from_array(weights, "w")])
+	onnx.save(helper.make_model(graph), path)
+
+
+def test_dse_expand_sweep():
+	points = expand_sweep({"accelerator" : "nio", "num_tile_rows" : 1, "num_tile_cols" : 1}, {"num_tile_cols" : [1, 2], "cache_ways" : [1, 2, 4]})
+	assert len(points) == 6
+	assert points[1] == ({"num_tile_cols" : 1, "cache_ways" : 2}, {"accelerator" : "nio", "num_tile_rows" : 1, "num_tile_cols" : 1, "cache_ways" : 2})
+
+
+@pytest.mark.parametrize("sweep", [{"num_tile_cols" : []}, {"num_tile_cols" : 2}])
+def test_dse_expand_sweep_invalid(sweep):
+	result = False
+	try:
+		expand_sweep(dict(), sweep)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_dse_build_accelerator():
+	# Every key is a keyword argument of Nio; numbers take the type of its default.
+	accelerator = build_accelerator({"accelerator" : "nio", "num_tile_rows" : 1, "num_tile_cols" : 2, "cache_entries" : 100.0, "memory_page_size" : None})
+	assert accelerator.timing_parameters()["num_tiles"] == 2
+	assert accelerator.timing_parameters()["cache_entries"] == 100
+
+
+@pytest.mark.parametrize("key", ["cache_size", "event_driven"])
+def test_dse_build_accelerator_invalid(key):
+	# Keys which are not Nio's, or are set on the command line, are rejected.
+	result = False
+	try:
+		build_accelerator({"accelerator" : "nio", "num_tile_rows" : 1, "num_tile_cols" : 1, key : 1})
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_dse_pareto_front():
+	rows = [
+		{"cycles" : 10, "tiles" : 4, "error" : None},
+		{"cycles" : 20, "tiles" : 1, "error" : None},
+		{"cycles" : 20, "tiles" : 4, "error" : None},
+		{"cycles" : 10, "tiles" : 4, "error" : None},
+		{"cycles" : None, "tiles" : 1, "error" : "failed"},
+	]
+	assert pareto_front(rows, ["cycles", "tiles"]) == [0, 1, 3]
+
+
+@pytest.mark.parametrize("extension", [".csv", ".json"])
+def test_dse_write_table(tmp_path, extension):
+	rows = [{"cycles" : 10, "pareto" : True}, {"cycles" : 20, "pareto" : False}]
+	path = str(tmp_path / ("dse" + extension))
+	write_table(rows, path)
+
+	with open(path) as file:
+		if extension == ".json":
+			assert json.load(file) == rows
+		else:
+			assert [row["cycles"] for row in csv.DictReader(file)] == ["10", "20"]
+
+
+@pytest.mark.parametrize("share_tensors", [True, False])
+def test_dse_explore(tmp_path, share_tensors):
+	model = str(tmp_path / "model.onnx")
+	build_model(model)
+	spec = {
+		"model" : model,
+		"share_tensors" : share_tensors,
+		"base" : {"accelerator" : "nio", "num_tile_rows" : 1, "num_tile_cols" : 1},
+		"num_inputs" : 2,
+		"sweep" : {"num_tile_cols" : [1, 2], "memory_pipeline_size" : [1, 2, 3]},
+	}
+	rows = explore(spec, workers=2)
+
+	assert [(row["num_tile_cols"], row["memory_pipeline_size"]) for row in rows] == [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2, 3)]
+	# A memory pipeline needs 2 stages.
+	assert all((row["error"] is not None) == (row["memory_pipeline_size"] == 1) for row in rows)
+	assert all(row["total_cycles"] == 2*row["cycles"] for row in rows if row["error"] is None)
+	# A deeper memory is slower.
+	assert rows[2]["cycles"] > rows[1]["cycles"]
+	assert not rows[0]["pareto"] and rows[1]["pareto"]
+
+
+def test_dse_explore_errors(tmp_path, monkeypatch):
+	# A value of the wrong type fails its own row, and no process writes a transaction trace.
+	monkeypatch.chdir(tmp_path)
+	model = str(tmp_path / "model.onnx")
+	build_model(model)
+	spec = {
+		"model" : model,
+		"base" : {"accelerator" : "nio", "num_tile_rows" : 1, "num_tile_cols" : 1},
+		"sweep" : {"num_tile_cols" : [1, "two"]},
+	}
+	rows = explore(spec, workers=2)
+
+	assert rows[0]["error"] is None
+	assert rows[1]["error"].startswith("TypeError")
+	assert not (tmp_path / "misc_transactions.trc").exists()
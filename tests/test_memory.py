@@ -4,12 +4,18 @@ Tests the memory object behaves as expected.
 '''
 
 import pytest
+import numpy as np
 
 
 from core.memory import Memory
 
 from core.clock import Clock, ClockReference
 from core.message_router import MessageRouter
+from core.messaging import Message
+
+from accelerators import Nio
+from accelerators.nio.nio_mem_banked import NioBankedMemory
+from accelerators.nio.nio_mem_dram import NioDRAMMemory
 
 
 
@@ -101,4 +107,338 @@ def test_memory_poke_peek_log(addrs):
 	true_log = ""
 	for transaction in memory._transaction_log:
 		true_log += transaction + "\n"
-	assert true_log == log_string
\ No newline at end of file
+	assert true_log == log_string
+
+@pytest.mark.parametrize("addr,length", [(0, 4), (2, 3), (5, 0)])
+def test_memory_poke_peek_range(addr, length):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	memory = Memory(clock_ref, router, 1, True, 4, 8)
+
+	contents = [0xDEADBEAF - i for i in range(length)]
+	memory.poke_range(addr, contents)
+	assert list(memory.peek_range(addr, length)) == contents
+
+	# A range transfer is logged as one transaction per word.
+	for i in range(length):
+		assert memory._peek(addr+i) == contents[i]
+	assert len(memory._transaction_log) == 3*length
+
+
+@pytest.mark.parametrize("addr,length", [(-1, 2), (7, 2), (1.0, 2), (0, 2.0)])
+def test_memory_peek_range_invalid(addr, length):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	memory = Memory(clock_ref, router, 1, False, 4, 8)
+	memory.poke_range(0, [1]*8)
+
+	result = False
+	try:
+		memory.peek_range(addr, length)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_memory_peek_range_uninitialized():
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	memory = Memory(clock_ref, router, 1, False, 4, 8)
+	memory.poke_range(0, [1, 2, 3])
+
+	result = False
+	try:
+		memory.peek_range(0, 4)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+@pytest.mark.parametrize("contents", [[-1], [1 << 32], [1.0]])
+def test_memory_poke_range_invalid(contents):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	memory = Memory(clock_ref, router, 1, False, 4, 8)
+
+	result = False
+	try:
+		memory.poke_range(0, contents)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+@pytest.mark.parametrize("page_size", [0, -1, 1.0])
+def test_memory_page_size_invalid(page_size):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+
+	result = False
+	try:
+		Memory(clock_ref, router, 1, False, 4, 400, page_size)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_memory_paged():
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	# Far larger than could ever be allocated up front.
+	memory = Memory(clock_ref, router, 1, False, 4, int(1e15), 4)
+	assert memory.resident_size() == 0
+
+	result = False
+	try:
+		memory._peek(9)
+	except ValueError as VE:
+		result = True
+	assert result
+
+	memory._poke(9, 0xDEADBEAF)
+	clock.clock()
+	memory.poke_range(int(1e14), [1, 2, 3, 4, 5, 6])
+	assert memory._peek(9) == 0xDEADBEAF
+	assert list(memory.peek_range(int(1e14)+2, 4)) == [3, 4, 5, 6]
+
+	statistics = memory.page_statistics()
+	assert [page["page"] for page in statistics] == [2, int(1e14)//4, int(1e14)//4 + 1]
+	assert statistics[0] == {"page" : 2, "base_address" : 8, "allocated_cycle" : 0, "valid_words" : 1, "reads" : 1, "writes" : 1}
+	assert statistics[1]["allocated_cycle"] == 1
+	assert statistics[1]["reads"] == 2 and statistics[1]["writes"] == 4
+	assert statistics[2]["reads"] == 2 and statistics[2]["writes"] == 2
+	assert memory.resident_size() == 3*4*4
+
+	# A range which covers an unwritten word (in an allocated page) is uninitialized.
+	result = False
+	try:
+		memory.peek_range(8, 2)
+	except ValueError as VE:
+		result = True
+	assert result
+
+
+class Snooper:
+	def __init__(self):
+		self.writes = list()
+
+	def snoop_write(self, address, length, writer):
+		self.writes.append((address, length, writer))
+
+
+@pytest.mark.parametrize("page_size", [None, 4])
+def test_memory_snoop(page_size):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+
+	memory = Memory(clock_ref, router, 1, False, 4, 16, page_size)
+	snooper = Snooper()
+	memory.add_snooper(snooper)
+	memory.add_snooper(snooper)
+
+	memory.poke_range(2, [1, 2, 3, 4, 5, 6])
+	memory._poke(3, 9, "tile")
+	# Only the words which change are snooped.
+	memory.poke_range(2, [1, 9, 3, 4, 7, 6])
+	memory.poke_range(2, [1, 9, 3, 4, 7, 6])
+
+	assert snooper.writes == [(2, 6, None), (3, 1, "tile"), (6, 1, None)]
+
+
+@pytest.mark.parametrize("num_banks, num_ports, interleave_size, interleaving", [(0, 1, 1, "modulo"), (2, 0, 1, "modulo"), (2, 2, 0, "modulo"), (2, 2, 1, "random"), (3, 2, 1, "xor")])
+def test_banked_memory_invalid(num_banks, num_ports, interleave_size, interleaving):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+
+	result = False
+	try:
+		NioBankedMemory(clock_ref, router, width=16, num_banks=num_banks, num_ports=num_ports, interleave_size=interleave_size, interleaving=interleaving)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_banked_memory_interleaving():
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+
+	modulo = NioBankedMemory(clock_ref, router, width=64, num_banks=4, interleave_size=2)
+	assert [modulo.bank(address) for address in range(10)] == [0, 0, 1, 1, 2, 2, 3, 3, 0, 0]
+
+	# A stride of num_banks words maps every access to one bank by modulo, but spreads them by xor.
+	xor = NioBankedMemory(clock_ref, MessageRouter(clock_ref), width=64, num_banks=4, interleaving="xor")
+	assert [xor.bank(address) for address in range(0, 16, 4)] == [0, 1, 2, 3]
+	assert [xor.bank(address) for address in range(4)] == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize("addrs, cycles, conflicts", [([0, 1, 2, 3], 1, 0), ([0, 4, 8, 12], 4, 6), ([0, 1, 4, 5], 2, 2)])
+def test_banked_memory_conflicts(addrs, cycles, conflicts):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	router.add_connection("tile", 16)
+
+	memory = NioBankedMemory(clock_ref, router, width=16, num_banks=4, num_ports=4)
+	memory.poke_range(0, list(range(16)))
+	for seq_num, addr in enumerate(addrs):
+		assert router.send(Message("tile", memory, Message.MemRead, 0, seq_num, attributes={"addr" : addr}))
+
+	# Each bank accepts a request per cycle; the responses return after the pipeline.
+	responses = list()
+	while len(responses) < len(addrs):
+		clock.advance(1)
+		memory.process()
+		message = router.fetch("tile")
+		while message is not None:
+			responses.append((message.seq_num, message.content))
+			message = router.fetch("tile")
+
+	assert sorted(responses) == [(seq_num, addr) for seq_num, addr in enumerate(addrs)]
+	assert clock.current_clock() == cycles + memory.pipeline_depth() - 1
+
+	statistics = memory.bank_statistics()
+	assert sum(bank["reads"] for bank in statistics["banks"]) == len(addrs)
+	assert sum(bank["conflicts"] for bank in statistics["banks"]) == conflicts
+	assert sum(port["conflicts"] for port in statistics["ports"]) == conflicts
+	assert sum(port["requests"] for port in statistics["ports"]) == len(addrs)
+
+
+@pytest.mark.parametrize("pipeline_size", [2, 3, 20])
+@pytest.mark.parametrize("vector_dot", [False, True])
+def test_piped_memory_event_driven(pipeline_size, vector_dot, build_conv, compare_modes):
+	''' Skipping idle devices and cycles (e.g., while the PEs hold, or requests are in the memory's pipeline)
+	does not change the cycles, nor the outputs.
+	'''
+	compare_modes(build_conv, [{"memory_pipeline_size" : pipeline_size, "vector_dot" : vector_dot, "event_driven" : event_driven, "credit_based" : credit_based}
+		for event_driven, credit_based in [(False, False), (True, False), (True, True)]])
+
+
+@pytest.mark.parametrize("event_driven, credit_based", [(False, False), (True, False), (True, True)])
+def test_banked_memory_nio(event_driven, credit_based, build_conv):
+	cycles = dict()
+	outputs = dict()
+	for banks, ports in [(1, 1), (4, 1), (4, 4), (8, 4)]:
+		conv = build_conv()
+		accelerator = Nio(2, 2, memory_banks=banks, memory_ports=ports, event_driven=event_driven, credit_based=credit_based)
+		accelerator.forward(conv)
+		cycles[(banks, ports)] = accelerator.cycles_per_layer()
+		outputs[(banks, ports)] = conv._outputs[0]
+
+		statistics = accelerator.memory_statistics()
+		assert len(statistics["banks"]) == banks
+		assert len(statistics["ports"]) == ports
+		assert all(0 < port["utilization"] <= 1 for port in statistics["ports"])
+		assert accelerator.timing_parameters()["memory_requests_per_cycle"] == min(banks, ports)
+
+	assert all(np.array_equal(output, outputs[(1, 1)]) for output in outputs.values())
+	# A single port takes one request per cycle, however many banks there are.
+	assert cycles[(4, 1)] == cycles[(1, 1)]
+	assert cycles[(4, 4)] < cycles[(1, 1)]
+	assert cycles[(8, 4)] <= cycles[(4, 4)]
+
+
+@pytest.mark.parametrize("parameters", [{"num_channels" : 0}, {"num_banks" : 0}, {"row_size" : 0}, {"queue_size" : 0}, {"t_cas" : 0}, {"t_rp" : 1.0}])
+def test_dram_memory_invalid(parameters):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+
+	result = False
+	try:
+		NioDRAMMemory(clock_ref, router, width=64, **parameters)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_dram_memory_decode():
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+
+	memory = NioDRAMMemory(clock_ref, router, width=1024, num_channels=2, num_ranks=2, num_banks=2, row_size=4)
+	# Words of a row share it; consecutive rows go to the next channel, then bank, then rank.
+	assert [memory.decode(address) for address in [0, 3, 4, 8, 16, 32]] == [(0, 0, 0, 0), (0, 0, 0, 0), (1, 0, 0, 0), (0, 0, 1, 0), (0, 1, 0, 0), (0, 0, 0, 1)]
+
+
+def test_dram_memory_fr_fcfs():
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	router.add_connection("tile", 16)
+
+	memory = NioDRAMMemory(clock_ref, router, width=64, num_banks=2, row_size=4, t_rcd=2, t_cas=3, t_rp=4)
+	memory.poke_range(0, list(range(64)))
+
+	# Address 0 opens row 0 of bank 0; address 8 is in row 1 of bank 0, and address 1 in row 0.
+	addrs = [0, 8, 1]
+	responses = list()
+	while len(responses) < len(addrs):
+		clock.advance(1)
+		memory.process()
+		message = router.fetch("tile")
+		while message is not None:
+			responses.append((message.seq_num, message.content, clock.current_clock()))
+			message = router.fetch("tile")
+		if clock.current_clock() <= len(addrs):
+			seq_num = clock.current_clock() - 1
+			assert router.send(Message("tile", memory, Message.MemRead, 0, seq_num, attributes={"addr" : addrs[seq_num]}))
+
+	# The miss takes t_rcd + t_cas; the row hit (1) overtakes the older row conflict (8), which takes t_rp + t_rcd + t_cas.
+	assert responses == [(0, 0, 2 + 5), (2, 1, 5 + 3), (1, 8, 6 + 9)]
+
+	statistics = memory.bank_statistics()
+	assert statistics["banks"][0] == {"reads" : 3, "writes" : 0, "conflicts" : 1, "row_hits" : 1, "row_misses" : 1}
+	assert statistics["ports"][0]["requests"] == 3
+	assert statistics["row_hit_rate"] == pytest.approx(1/3)
+
+
+def test_dram_memory_invalid_model():
+	result = False
+	try:
+		Nio(1, 1, memory_model="sram")
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+@pytest.mark.parametrize("event_driven, credit_based", [(False, False), (True, False), (True, True)])
+def test_dram_memory_nio(event_driven, credit_based, build_conv):
+	cycles = dict()
+	for timing in [1, 11]:
+		conv = build_conv()
+		expected = build_conv()
+		expected.evaluate()
+		accelerator = Nio(2, 2, memory_model="dram", dram_channels=2, dram_t_rcd=timing, dram_t_cas=timing, dram_t_rp=timing, event_driven=event_driven, credit_based=credit_based)
+		accelerator.forward(conv)
+		cycles[timing] = accelerator.cycles_per_layer()
+
+		assert np.allclose(conv._outputs[0], expected._outputs[0], rtol=1e-5)
+		statistics = accelerator.memory_statistics()
+		assert len(statistics["banks"]) == 2*8
+		assert 0 < statistics["row_hit_rate"] <= 1
+		assert statistics["mean_latency"] >= timing
+		assert accelerator.timing_parameters()["memory_pipeline_depth"] == timing + 1
+
+		# Every System takes as many cycles as the cycle-accurate simulation.
+		reference = Nio(2, 2, memory_model="dram", dram_channels=2, dram_t_rcd=timing, dram_t_cas=timing, dram_t_rp=timing)
+		reference.forward(build_conv())
+		assert cycles[timing] == reference.cycles_per_layer()
+
+	assert cycles[1] < cycles[11]
@@ -1,2 +1,203 @@
 ''' test_memory_map.py
-'''
\ No newline at end of file
+'''
+
+import pytest
+import numpy as np
+from onnx import helper
+
+from accelerators import Nio
+from operators import GeMM
+
+from core.clock import Clock, ClockReference
+from core.memory import Memory
+from core.memory_map import MemoryMapper
+from core.message_router import MessageRouter
+from core.utils import *
+
+
+@pytest.mark.parametrize("shape", [(1,), (7,), (2, 3), (2, 3, 4)])
+@pytest.mark.parametrize("page_size", [None, 5])
+def test_memory_map_transfer(shape, page_size):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	memory = Memory(clock_ref, router, 1, False, 4, 1024, page_size)
+	mapper = MemoryMapper(memory, 1024, 4)
+
+	array = np.random.random_sample(shape).astype(np.float32)
+	offset = mapper.map(array)
+	mapper.sys2mem(array, offset)
+
+	# Each element is stored as the binary representation of a 32-bit float.
+	flat = array.flatten()
+	for i in range(len(flat)):
+		assert memory._peek(offset+i) == float_to_int_repr_of_float(flat[i])
+
+	result = np.zeros(shape, dtype=np.float32)
+	mapper.mem2sys(result, offset)
+	assert np.array_equal(result, array)
+	mapper.unmap(array)
+
+
+def build_mapper():
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	memory = Memory(clock_ref, router, 1, False, 4, 1024)
+	return MemoryMapper(memory, 1024, 4), memory
+
+
+def test_memory_map_resident():
+	mapper, memory = build_mapper()
+	weights = np.random.random_sample((2, 3)).astype(np.float32)
+	mapper.pin(weights)
+
+	# Each layer maps its own (flattened) copy of the weights.
+	first = weights.flatten()
+	offset = mapper.map(first, weights)
+	mapper.sys2mem(first, offset)
+	mapper.unmap(first)
+
+	second = weights.flatten()
+	assert mapper.map(second, weights) == offset
+	memory.poke_range(offset, np.zeros(6, dtype=np.uint32))
+	mapper.sys2mem(second, offset)
+	# The upload was skipped, so memory still holds what was written there.
+	assert all(memory._peek(offset+i) == 0 for i in range(6))
+
+	# An array made differently from the tensor (i.e., in another layout) is resident separately.
+	transposed = weights.T.flatten()
+	assert mapper.map(transposed, weights, "transposed") != offset
+	mapper.sys2mem(transposed, mapper.lookup(transposed))
+
+	assert mapper.residency_statistics() == {"resident_arrays" : 2, "resident_words" : 12, "uploaded_words" : 12, "avoided_words" : 6}
+
+
+def test_memory_map_repin():
+	mapper, memory = build_mapper()
+	weights = np.random.random_sample(6).astype(np.float32)
+	mapper.pin(weights)
+
+	first = weights.copy()
+	offset = mapper.map(first, weights)
+	mapper.sys2mem(first, offset)
+	mapper.unmap(first)
+
+	# Residency does not look at the contents, so a change is only seen once the tensor is pinned again.
+	weights[0] += 1.0
+	mapper.pin(weights)
+	second = weights.copy()
+	assert mapper.map(second, weights) == offset
+	mapper.sys2mem(second, offset)
+	mapper.unmap(second)
+	result = np.zeros(6, dtype=np.float32)
+	mapper.mem2sys(result, offset)
+	assert np.array_equal(result, weights)
+
+	# Pinning an unchanged tensor again does not upload it again.
+	mapper.pin(weights)
+	third = weights.copy()
+	mapper.map(third, weights)
+	mapper.sys2mem(third, offset)
+	assert mapper.residency_statistics()["uploaded_words"] == 12
+	assert mapper.residency_statistics()["avoided_words"] == 6
+
+
+def test_memory_map_unpin():
+	mapper, memory = build_mapper()
+	weights = np.random.random_sample(4).astype(np.float32)
+
+	result = False
+	try:
+		mapper.unpin(weights)
+	except ValueError as VE:
+		result = True
+	assert result
+
+	mapper.pin(weights)
+	copy = weights.copy()
+	offset = mapper.map(copy, weights)
+
+	result = False
+	try:
+		mapper.unpin(weights)
+	except ValueError as VE:
+		result = True
+	assert result
+
+	mapper.unmap(copy)
+	mapper.unpin(weights)
+	assert mapper.residency_statistics()["resident_arrays"] == 0
+	# The resident array was freed, so its memory is allocated again.
+	assert mapper.map(weights.copy()) == offset
+
+
+def test_memory_map_resident_inference():
+	rng = np.random.default_rng(0)
+	gemm_b = rng.random((5, 4), dtype=np.float32)
+	gemm_c = rng.random((3, 4), dtype=np.float32)
+	accelerator = Nio(1, 1)
+	accelerator.pin_tensors([gemm_b, gemm_c])
+
+	offsets = list()
+	for run in range(2):
+		gemm_a = rng.random((3, 5), dtype=np.float32)
+		gemm_out = np.zeros((3, 4), dtype=np.float32)
+		gemm = GeMM(helper.make_node("Gemm", ["a", "b", "c"], ["y"], name="gemm"), [gemm_a, gemm_b, gemm_c], [gemm_out])
+		accelerator.forward(gemm)
+		offsets.append((gemm._in2_offset, gemm._in3_offset))
+		assert np.allclose(gemm_out, gemm_a @ gemm_b + gemm_c, rtol=1e-5)
+
+	assert offsets[0] == offsets[1]
+	statistics = accelerator.residency_statistics()
+	assert statistics["resident_arrays"] == 2
+	assert statistics["avoided_words"] == gemm_b.size + gemm_c.size
+	assert statistics["avoided_cycles"] > 0
+
+
+def test_memory_map_produced():
+	mapper, memory = build_mapper()
+	tensor = np.zeros(6, dtype=np.float32)
+	output = tensor.flatten()
+	offset = mapper.map(output)
+	memory.poke_range(offset, np.arange(6, dtype=np.float32).view(np.uint32))
+	mapper.mem2sys(tensor, offset)
+	mapper.unmap(output)
+
+	# The next layer maps the downloaded tensor where it is, and does not upload it.
+	consumed = tensor.flatten()
+	assert mapper.map(consumed, tensor) == offset
+	mapper.sys2mem(consumed, offset)
+	assert mapper.residency_statistics()["avoided_words"] == 6
+	# (An array made differently from the tensor is not.)
+	assert mapper.map(tensor[::-1].copy(), tensor, "reversed") != offset
+	mapper.unmap(consumed)
+
+	# Once released, the memory is allocated again.
+	mapper.release()
+	assert mapper.map(np.zeros(6, dtype=np.float32)) == offset
+
+
+@pytest.mark.parametrize("cache_write_policy", [None, "invalidate", "allocate"])
+def test_memory_map_produced_layers(cache_write_policy):
+	rng = np.random.default_rng(0)
+	gemm_a = rng.random((3, 5), dtype=np.float32)
+	gemm_b = rng.random((5, 4), dtype=np.float32)
+	gemm_c = rng.random((4, 2), dtype=np.float32)
+	first_out = np.zeros((3, 4), dtype=np.float32)
+	second_out = np.zeros((3, 2), dtype=np.float32)
+	first = GeMM(helper.make_node("Gemm", ["a", "b"], ["y"], name="first"), [gemm_a, gemm_b], [first_out])
+	second = GeMM(helper.make_node("Gemm", ["y", "c"], ["z"], name="second"), [first_out, gemm_c], [second_out])
+
+	accelerator = Nio(1, 1, cache_write_policy=cache_write_policy)
+	accelerator.forward(first)
+	misses = accelerator.cache_statistics()[0]["misses"]
+	accelerator.forward(second)
+	misses = accelerator.cache_statistics()[0]["misses"] - misses
+
+	# The second layer reads the output of the first where it was written, instead of uploading it again.
+	assert second._in1_offset == first._out_offset
+	assert accelerator.residency_statistics()["avoided_words"] == first_out.size
+	assert np.allclose(second_out, (gemm_a @ gemm_b) @ gemm_c, rtol=1e-5)
+	# With write-allocate, it is also in the cache (which installed the first layer's writes).
+	assert misses == gemm_c.size + (0 if cache_write_policy == "allocate" else first_out.size)
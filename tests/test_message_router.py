@@ -7,7 +7,7 @@ import pytest
 
 from core.device import Device
 from core.messaging import Message
-from core.message_router import MessageRouter
+from core.message_router import MessageQueue, MessageRouter
 from core.clock import Clock, ClockReference
 
 def test_message_router_instantiation_valid():
@@ -61,3 +61,79 @@ def test_message_router_send_and_fetch(queue_size):
 		assert msg_router.fetch(receiver) is not None
 	assert msg_router.fetch(receiver) is None
 
+
+
+@pytest.mark.parametrize("queue_size", [1, 2, 3, 4])
+def test_message_router_pending(queue_size):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	msg_router = MessageRouter(clock_ref)
+
+	sender = Device(clock_ref, msg_router)
+	receiver = Device(clock_ref, msg_router, queue_size)
+
+	assert msg_router.pending(receiver) == 0
+
+	msg = Message(sender, receiver,  Message.Ping)
+	for i in range(0, queue_size):
+		assert msg_router.send(msg)
+		assert msg_router.pending(receiver) == i+1
+
+	msg_router.fetch(receiver)
+	assert msg_router.pending(receiver) == queue_size-1
+	assert msg_router.pending(sender) == 0
+
+
+def test_message_queue_ring_order():
+	queue = MessageQueue(3)
+	received = list()
+	for i in range(10):
+		assert queue.queue(i)
+		if i % 2:
+			received.append(queue.dequeue())
+			received.append(queue.dequeue())
+	assert received == list(range(10))
+	assert queue.dequeue() is None
+	assert len(queue) == 0
+
+
+def test_message_queue_statistics():
+	queue = MessageQueue(2)
+	assert queue.queue(0)
+	assert queue.queue(1)
+	assert not queue.queue(2)
+	assert queue.available() == 0
+	queue.dequeue()
+	assert queue.available() == 1
+	assert queue.queue(3)
+
+	assert queue.statistics() == {"capacity" : 2, "queued" : 3, "refused" : 1, "full" : 2, "peak_occupancy" : 2}
+
+
+@pytest.mark.parametrize("queue_size", [1, 2, 3])
+def test_message_router_credits(queue_size):
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	msg_router = MessageRouter(clock_ref, credit_based=True)
+
+	sender = Device(clock_ref, msg_router)
+	receiver = Device(clock_ref, msg_router, queue_size)
+
+	msg = Message(sender, receiver, Message.Ping)
+	for i in range(0, queue_size):
+		assert msg_router.credits(receiver) == queue_size - i
+		assert msg_router.can_send(receiver)
+		assert msg_router.send(msg)
+	assert not msg_router.can_send(receiver)
+
+	# Sending without a credit is an error.
+	result = False
+	try:
+		msg_router.send(msg)
+	except ValueError as VE:
+		result = True
+	assert result
+
+	msg_router.fetch(receiver)
+	assert msg_router.credits(receiver) == 1
+	assert msg_router.statistics()[receiver]["full"] == 1
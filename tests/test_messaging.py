@@ -0,0 +1,125 @@
+'''test_messaging.py:
+
+Tests for the Message types and the MessagePool
+'''
+
+import pytest
+import numpy as np
+
+from accelerators import Nio
+from core.defines import Operator
+from core.messaging import Message, MessagePool, MemReadMessage, PECmdMessage, TileCmdMessage
+
+
+@pytest.fixture
+def validate():
+	Message.validate = True
+	yield
+	Message.validate = False
+
+
+@pytest.mark.parametrize("mtype", [None, 1.0, "0", 9, -1])
+def test_message_invalid_mtype(mtype):
+	result = False
+	try:
+		Message(None, None, mtype)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_message_specialization():
+	message = Message(None, None, Message.MemRead, 1, 2, attributes={"addr" : 4})
+	assert isinstance(message, MemReadMessage)
+	assert isinstance(message, Message)
+	assert message.addr == 4
+	assert message.message_id == 1 and message.seq_num == 2
+	assert not hasattr(message, "content")
+
+
+def test_message_unknown_field():
+	result = False
+	try:
+		Message(None, None, Message.MemRead, attributes={"addr" : 4, "content" : 1})
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_message_defaults():
+	pe_cmd = Message(None, None, Message.PECmd, attributes={"operation" : Operator.ADD, "dtype" : None, "op1" : 1, "op2" : 2, "op3" : 3})
+	assert pe_cmd.num_operands == 3
+
+	tile_cmd = Message(None, None, Message.TileCmd, attributes={"operation" : Operator.DOT, "dtype" : None, "res_addr" : 0, "row_addrs" : [], "col_addrs" : []})
+	assert tile_cmd.bias is None
+
+
+def test_message_missing_field():
+	# Without validation, the fields are not checked.
+	Message(None, None, Message.MemReadDone, attributes={"addr" : 4})
+
+
+@pytest.mark.parametrize("mtype, attributes", [
+	(Message.MemWrite, {"addr" : 4}),
+	(Message.MemRead, {}),
+	(Message.MemReadDone, {"content" : 1}),
+	(Message.PECmd, {"operation" : Operator.ADD}),
+	(Message.PEDone, None),
+	(Message.TileCmd, {"operation" : Operator.DOT, "dtype" : None, "res_addr" : 0, "row_addrs" : []}),
+	(Message.TileCmd, {"operation" : Operator.ADD, "dtype" : None, "res_addr" : 0, "op1_addr" : 0}),
+])
+def test_message_missing_field_validate(validate, mtype, attributes):
+	result = False
+	try:
+		Message(None, None, mtype, attributes=attributes)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_message_pool_recycle():
+	pool = MessagePool(recycle=True)
+	first = pool.message(None, None, Message.PECmd, 1, attributes={"operation" : Operator.MAC, "dtype" : None, "op1" : 1, "op2" : 2, "op3" : 3})
+	pool.release(first)
+
+	second = pool.message(None, None, Message.PECmd, 2, attributes={"operation" : Operator.MAC, "dtype" : None, "op1" : 4, "op2" : 5})
+	assert second is first
+	assert isinstance(second, PECmdMessage)
+	assert second.message_id == 2 and second.op1 == 4
+	# Fields of the earlier Message do not carry over.
+	assert not hasattr(second, "op3")
+	assert second.num_operands == 2
+
+	# Free-lists are kept per mtype.
+	assert pool.message(None, None, Message.MemRead, attributes={"addr" : 0}) is not first
+	assert pool.statistics() == {"created" : 2, "reused" : 1}
+
+
+def test_message_pool_no_recycle():
+	pool = MessagePool()
+	first = pool.message(None, None, Message.Ping)
+	pool.release(first)
+	assert pool.message(None, None, Message.Ping) is not first
+
+
+def test_message_pool_double_release(validate):
+	pool = MessagePool(recycle=True)
+	message = pool.message(None, None, Message.Ping)
+	pool.release(message)
+
+	result = False
+	try:
+		pool.release(message)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_message_recycle_simulation(validate, build_conv, compare_modes):
+	# Recycling Messages changes neither the outputs nor the cycles.
+	accelerators = compare_modes(lambda: build_conv((1, 2, 5, 5), 2, bias=True), [{"recycle_messages" : False}, {"recycle_messages" : True}])
+	assert accelerators[1]._device_message_router.message_pool().statistics()["reused"] > 0
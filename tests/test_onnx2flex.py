@@ -0,0 +1,53 @@
+'''test_onnx2flex.py:
+
+Tests the tensors ONNX2Flex publishes for other processes to attach to.
+'''
+
+import pytest
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+
+from accelerators import Nio
+from translator.onnx2flex import ONNX2Flex
+from core.session import InferenceSession
+
+
+def build_model(path):
+	rng = np.random.default_rng(0)
+	weights = rng.random((5, 4), dtype=np.float32)
+	bias = rng.random(4, dtype=np.float32)
+	graph = helper.make_graph(
+		[helper.make_node("Gemm", ["x", "w", "b"], ["y"], name="gemm"), helper.make_node("Relu", ["y"], ["z"], name="relu")],
+		"model",
+		[helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 5])],
+		[helper.make_tensor_value_info("z", TensorProto.FLOAT, [1, 4])],
+		[numpy_helper.from_array(weights, "w"), numpy_helper.from_array(bias, "b")])
+	onnx.save(helper.make_model(graph), path)
+	return weights, bias
+
+
+def test_onnx2flex_attach(tmp_path):
+	weights, bias = build_model(str(tmp_path / "model.onnx"))
+	onnx2flex = ONNX2Flex(str(tmp_path / "model.onnx"))
+	onnx2flex.publish_tensors(str(tmp_path / "bundle"))
+
+	attached = ONNX2Flex.attach(str(tmp_path / "bundle"))
+	attached.translate()
+	initializers = attached.get_initializers()
+	assert np.array_equal(initializers[0], weights) and np.array_equal(initializers[1], bias)
+	# The initializers are read-only views of the bundle.
+	assert all(isinstance(tensor, np.memmap) and not tensor.flags.writeable for tensor in initializers)
+	# The published model does not hold the initializers' data.
+	assert all(len(initializer.raw_data) == 0 for initializer in onnx.load(str(tmp_path / "bundle" / "model.onnx")).graph.initializer)
+
+	loaded = ONNX2Flex(str(tmp_path / "model.onnx"))
+	loaded.translate()
+	outputs = list()
+	for translated in [attached, loaded]:
+		session = InferenceSession(translated, Nio(1, 1))
+		result = session.run(np.ones((1, 5), dtype=np.float32))[0]
+		outputs.append((result["output"], result["cycles"]))
+
+	assert np.array_equal(outputs[0][0], outputs[1][0]) and outputs[0][1] == outputs[1][1]
+	assert np.allclose(outputs[0][0], np.maximum(np.ones((1, 5)) @ weights + bias, 0), rtol=1e-5)
@@ -0,0 +1,161 @@
+'''test_pe.py:
+
+Tests the PE specializations behave as expected.
+'''
+
+import pytest
+import numpy as np
+
+from accelerators.nio.nio_piped_pe import NioPE
+
+from core.clock import Clock, ClockReference
+from core.defines import Operator
+from core.device import Device
+from core.message_router import MessageRouter
+from core.messaging import Message
+from core.utils import *
+
+
+def run_nio_pe(attribute_list):
+	''' Sends one PECmd per cycle to a NioPE and waits for every response.
+
+	Returns:
+		The last result, and the cycle in which it was received.
+	'''
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	sender = Device(clock_ref, router, 2)
+	pe = NioPE(clock_ref, router)
+
+	commands = [Message(sender, pe, Message.PECmd, i, attributes=attributes) for i, attributes in enumerate(attribute_list)]
+	num_responses = 0
+	result = None
+	while num_responses < len(attribute_list):
+		clock.clock()
+		pe.process()
+		message = router.fetch(sender)
+		if message is not None:
+			num_responses += 1
+			result = message.result
+		if commands and router.send(commands[0]):
+			commands.pop(0)
+
+	return result, clock.current_clock()
+
+
+@pytest.mark.parametrize("length", [1, 2, 9, 25])
+def test_nio_pe_vector_dot_matches_scalar(length):
+	rng = np.random.default_rng(length)
+	op1 = rng.random(length, dtype=np.float32)
+	op2 = rng.random(length, dtype=np.float32)
+
+	scalar = list()
+	for i in range(length):
+		scalar.append({
+			"operation" : Operator.CMAC if i == 0 else Operator.MAC,
+			"dtype" : np.float32,
+			"op1" : float_to_int_repr_of_float(op1[i]),
+			"op2" : float_to_int_repr_of_float(op2[i])
+		})
+
+	vector = [{
+		"operation" : Operator.DOT,
+		"dtype" : np.float32,
+		"op1" : op1,
+		"op2" : op2,
+		"num_beats" : length
+	}]
+
+	scalar_result, scalar_cycles = run_nio_pe(scalar)
+	vector_result, vector_cycles = run_nio_pe(vector)
+
+	assert scalar_cycles == vector_cycles
+	assert float_to_int_repr_of_float(scalar_result) == float_to_int_repr_of_float(vector_result)
+
+
+@pytest.mark.parametrize("credit_based", [False, True])
+def test_nio_pe_backpressure(credit_based):
+	''' The PE holds its response while the sender's queue is full, and stalls until it drains.
+	'''
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref, credit_based=credit_based)
+	sender = Device(clock_ref, router, 1)
+	pe = NioPE(clock_ref, router)
+
+	attributes = {
+		"operation" : Operator.ADD,
+		"dtype" : np.float32,
+		"op1" : float_to_int_repr_of_float(1),
+		"op2" : float_to_int_repr_of_float(2)
+	}
+	commands = [Message(sender, pe, Message.PECmd, i, attributes=attributes) for i in range(2)]
+	for i in range(10):
+		clock.clock()
+		pe.process()
+		if commands and router.send(commands[0]):
+			commands.pop(0)
+
+	# The first response fills the sender's queue, so the second is held.
+	assert pe.number_of_stalled_cycles() > 0
+	assert pe.is_idle() == credit_based
+
+	responses = [router.fetch(sender)]
+	while len(responses) < 2:
+		clock.clock()
+		pe.process()
+		responses.append(router.fetch(sender))
+		responses = [response for response in responses if response is not None]
+
+	assert [response.message_id for response in responses] == [0, 1]
+	# Stalled from the cycle the second response was held (5), until it was sent (11).
+	assert pe.number_of_stalled_cycles() == 6
+
+
+def run_nio_pe_skipping(attributes, skip):
+	''' Sends a PECmd to a NioPE, and (if skip) jumps the clock to the PE's next event.
+
+	Returns:
+		The cycle in which the response was received, and the cycles skipped.
+	'''
+	clock = Clock()
+	clock_ref = ClockReference(clock)
+	router = MessageRouter(clock_ref)
+	sender = Device(clock_ref, router, 2)
+	pe = NioPE(clock_ref, router)
+	assert router.send(Message(sender, pe, Message.PECmd, 0, attributes=attributes))
+
+	skipped = 0
+	message = None
+	while message is None:
+		event = pe.next_event_cycle()
+		if skip and event is not None and event > clock.current_clock() + 1:
+			cycles = event - clock.current_clock() - 1
+			clock.advance(cycles)
+			pe.fast_forward(cycles)
+			skipped += cycles
+		clock.clock()
+		pe.process()
+		message = router.fetch(sender)
+
+	return clock.current_clock(), skipped
+
+
+def test_nio_pe_hold_next_event():
+	''' A PE holding for a vector DOT reports when the hold ends, so the cycles until then can be skipped.
+	'''
+	length = 12
+	rng = np.random.default_rng(0)
+	attributes = {
+		"operation" : Operator.DOT,
+		"dtype" : np.float32,
+		"op1" : rng.random(length, dtype=np.float32),
+		"op2" : rng.random(length, dtype=np.float32),
+		"num_beats" : length
+	}
+
+	cycles, skipped = run_nio_pe_skipping(attributes, True)
+	# The hold is skipped, and the response arrives in the same cycle as without skipping.
+	assert skipped == length - 1
+	assert (cycles, 0) == run_nio_pe_skipping(attributes, False)
@@ -0,0 +1,95 @@
+'''test_session.py:
+
+Tests the InferenceSession runs a model for many inputs.
+'''
+
+import pytest
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+
+from accelerators import Nio
+from translator.onnx2flex import ONNX2Flex
+from core.compile_cache import CompileCache
+from core.session import InferenceSession, load_inputs
+
+
+WEIGHTS = np.random.default_rng(0).random((5, 4), dtype=np.float32) - 0.5
+
+
+def build_model(path):
+	graph = helper.make_graph(
+		[helper.make_node("Gemm", ["x", "w"], ["y"], name="gemm"), helper.make_node("Relu", ["y"], ["z"], name="relu")],
+		"model",
+		[helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 5])],
+		[helper.make_tensor_value_info("z", TensorProto.FLOAT, [1, 4])],
+		[numpy_helper.from_array(WEIGHTS, "w")])
+	onnx.save(helper.make_model(graph), path)
+
+	onnx2flex = ONNX2Flex(path)
+	onnx2flex.translate()
+	return onnx2flex
+
+
+def reference(tensor):
+	return np.maximum(tensor @ WEIGHTS, 0)
+
+
+def test_session_run(tmp_path):
+	onnx2flex = build_model(str(tmp_path / "model.onnx"))
+	cache = CompileCache(None)
+	session = InferenceSession(onnx2flex, Nio(1, 1, compile_cache=cache), reference)
+
+	inputs = np.random.default_rng(1).random((3, 1, 5), dtype=np.float32)
+	results = session.run(inputs)
+	assert all(result["matches"] for result in results)
+	assert all(np.allclose(result["output"], reference(tensor)) for result, tensor in zip(results, inputs))
+	assert all([name for name, _ in result["layer_cycles"]] == ["gemm", "relu"] for result in results)
+
+	# Every input after the first reuses the compiled layer.
+	assert cache.statistics() == {"hits" : 2, "misses" : 1}
+
+	statistics = session.statistics()
+	assert statistics["inputs"] == 3 and statistics["mismatches"] == 0
+	assert statistics["total_cycles"] == sum(result["cycles"] for result in results)
+	assert statistics["steady_state_cycles"] == (results[1]["cycles"] + results[2]["cycles"])/2
+
+	assert len(session.run(inputs, num_inputs=1)) == 1
+	assert session.statistics()["inputs"] == 4
+
+
+@pytest.mark.parametrize("shape, count", [((1, 5), 1), ((3, 1, 5), 3), ((3, 5), 3)])
+def test_session_inputs(tmp_path, shape, count):
+	onnx2flex = build_model(str(tmp_path / "model.onnx"))
+	session = InferenceSession(onnx2flex, Nio(1, 1))
+	inputs = list(session.inputs(np.zeros(shape, dtype=np.float32)))
+	assert len(inputs) == count
+	assert all(tensor.shape == (1, 5) for tensor in inputs)
+
+
+def test_session_inputs_invalid(tmp_path):
+	onnx2flex = build_model(str(tmp_path / "model.onnx"))
+	session = InferenceSession(onnx2flex, Nio(1, 1))
+
+	result = False
+	try:
+		session.inputs(np.zeros((3, 4), dtype=np.float32))
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+@pytest.mark.parametrize("extension", [".npy", ".npz", ".bin"])
+def test_load_inputs(tmp_path, extension):
+	inputs = np.random.default_rng(1).random((3, 1, 5), dtype=np.float32)
+	path = str(tmp_path / ("inputs" + extension))
+	if extension == ".npy":
+		np.save(path, inputs)
+	elif extension == ".npz":
+		np.savez(path, x=inputs, labels=np.arange(3))
+	else:
+		inputs.tofile(path)
+
+	loaded = load_inputs(path, "x", (1, 5), np.float32)
+	assert np.array_equal(loaded, inputs)
@@ -0,0 +1,18 @@
+'''test_system.py:
+
+Tests the System abstraction.
+'''
+
+import pytest
+
+from core.system import System
+
+
+@pytest.mark.parametrize("cycles", [1, 2, 1000])
+def test_system_tick(cycles):
+	system = System()
+
+	system.tick()
+	system.tick(cycles)
+
+	assert system._system_clock_ref.current_clock() == cycles + 1
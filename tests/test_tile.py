@@ -0,0 +1,114 @@
+'''test_tile.py:
+
+Tests the Tile specializations behave as expected.
+'''
+
+import pytest
+import numpy as np
+from onnx import helper
+
+from accelerators import Nio
+from operators import ReLU
+
+
+def test_tile_command_ids(build_conv):
+	accelerator = Nio(1, 1)
+	conv = build_conv((1, 2, 5, 5), 2)
+	conv.map(accelerator._memory_mapper)
+	tile_commands = conv.compile(accelerator, accelerator._tiles_flat)
+
+	assert [command.message_id for command in tile_commands] == list(range(len(tile_commands)))
+
+
+@pytest.mark.parametrize("vector_dot", [False, True])
+def test_tile_transactions(vector_dot, build_conv):
+	accelerator = Nio(1, 1, vector_dot=vector_dot)
+	conv = build_conv((1, 2, 5, 5), 2)
+	accelerator.forward(conv)
+
+	relu_out = np.zeros((1, 2, 3, 3), dtype=np.float32)
+	relu = ReLU(helper.make_node("Relu", ["y"], ["z"], name="relu"), [conv._outputs[0]], [relu_out])
+	accelerator.forward(relu)
+	assert np.array_equal(relu_out, np.maximum(conv._outputs[0], 0))
+
+	tile = accelerator._tiles[0][0]
+	# Every read, PE command and write was given its own transaction ID, and every response arrived.
+	assert tile._next_transaction_id > 2*conv._out_flat.size
+	assert tile._reads_outstanding == 0
+	assert tile._dispatches_outstanding == 0
+	assert tile._writes_outstanding == 0
+
+
+def test_tile_command_count(build_conv):
+	accelerator = Nio(2, 2)
+	conv = build_conv((1, 2, 5, 5), 2)
+	conv.map(accelerator._memory_mapper)
+	tile_commands = conv.compile(accelerator, accelerator._tiles_flat)
+
+	assert len(tile_commands) == conv.num_commands()
+	assert [command.message_id for command in conv.compile_stream(accelerator, accelerator._tiles_flat)] == list(range(len(tile_commands)))
+
+
+@pytest.mark.parametrize("command_window", [0, -1])
+def test_tile_command_window_invalid(command_window):
+	result = False
+	try:
+		Nio(1, 1, command_window=command_window)
+	except ValueError as VE:
+		result = True
+
+	assert result
+
+
+def test_tile_command_window(build_conv, compare_modes):
+	# The window bounds the tile commands held at once, but changes neither the outputs nor the cycles.
+	compare_modes(lambda: build_conv((1, 2, 5, 5), 2), [{"command_window" : command_window} for command_window in [None, 1, 4, 1024]])
+
+
+def test_tile_grid_independent():
+	accelerator = Nio(2, 2, num_pe_rows=2, num_pe_cols=2)
+	tiles = accelerator._tiles_flat
+	assert len(set(id(tile) for tile in tiles)) == 4
+	assert len(set(id(pe) for tile in tiles for pe in tile._pes)) == 16
+	assert all(tile.num_pes() == 4 for tile in tiles)
+
+	timing = accelerator.timing_parameters()
+	assert timing["num_tiles"] == 4
+	assert timing["num_pes"] == 4
+
+
+@pytest.mark.parametrize("vector_dot", [False, True])
+@pytest.mark.parametrize("num_pe_rows, num_pe_cols", [(1, 2), (1, 3), (2, 2), (4, 8)])
+def test_tile_pe_grid(vector_dot, num_pe_rows, num_pe_cols, build_conv):
+	outputs = list()
+	for pe_rows, pe_cols in [(1, 1), (num_pe_rows, num_pe_cols)]:
+		# Long DOTs (of 144 MACs), whose operands are reused by many commands.
+		conv = build_conv((1, 16, 4, 4), 16, bias=True)
+		accelerator = Nio(1, 1, vector_dot=vector_dot, num_pe_rows=pe_rows, num_pe_cols=pe_cols)
+		accelerator.forward(conv)
+		outputs.append(conv._outputs[0])
+
+	# The DOTs are split across the PEs, and their partial sums added up by the tile.
+	assert np.allclose(outputs[1], outputs[0], rtol=1e-5)
+	tile = accelerator._tiles[0][0]
+	assert tile._dispatches_outstanding == 0
+	assert all(len(queue) == 0 for queue in tile._dispatch_queues)
+
+
+def test_tile_grid_scaling(build_conv):
+	# The tiles share the commands of a layer (of short DOTs, on few operands), and the PEs of a tile share each (long enough) DOT.
+	tile_cycles = list()
+	for rows, cols in [(1, 1), (1, 2), (2, 2)]:
+		conv = build_conv((1, 1, 12, 12), 2)
+		accelerator = Nio(rows, cols)
+		accelerator.forward(conv)
+		tile_cycles.append(accelerator.cycles_per_layer())
+
+	pe_cycles = list()
+	for num_pe_cols in [1, 2, 4]:
+		accelerator = Nio(1, 1, num_pe_cols=num_pe_cols)
+		accelerator.forward(build_conv((1, 16, 4, 4), 16, bias=True))
+		pe_cycles.append(accelerator.cycles_per_layer())
+
+	assert tile_cycles[0] > tile_cycles[1] > tile_cycles[2]
+	assert pe_cycles[0] > pe_cycles[1] > pe_cycles[2]
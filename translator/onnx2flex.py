@@ -2,6 +2,8 @@
 
 '''
 
+import os
+
 import onnx
 from onnx import numpy_helper, helper, shape_inference, TensorProto
 
@@ -23,16 +25,18 @@ class ONNX2Flex:
         onnx_model_path: a string representing the path to the ONNX mode.
         verbose: a boolean flag indicating if we should output additonal debug messages.
         check_model: a boolean flag to ask ONNX if the ONNX model is correct and valid.
+        infer_shapes: a boolean flag to infer the shapes of the model's tensors (unless the model already has them).
 
     Returns:
         an ONNX2Flex object.
     '''
-    def __init__(self, onnx_model_path, verbose = False, check_model = False):
+    def __init__(self, onnx_model_path, verbose = False, check_model = False, infer_shapes = True):
         if check_model:
             onnx.checker.check_model(onnx_model_path)
 
         self._onnx_model = onnx.load(onnx_model_path)
-        self._onnx_model = shape_inference.infer_shapes(self._onnx_model)
+        if infer_shapes:
+            self._onnx_model = shape_inference.infer_shapes(self._onnx_model)
         self._ir_version = self._onnx_model.ir_version
 
         self._compute_graph = None
@@ -48,6 +52,58 @@ class ONNX2Flex:
         self._node_iter = 0
         self._node_list = list()
 
+        # The initializers attached from a bundle (see attach), in the order of the model's initializers.
+        self._shared_initializers = None
+
+    def publish_tensors(self, directory):
+        ''' publish_tensors: Writes the model (with its inferred shapes) and its initializers to directory,
+        as a bundle which other processes attach to (see attach), instead of each loading the model,
+        inferring its shapes and converting its initializers.
+
+        Notes:
+            Each initializer is written as a .npy file, which attach memory-maps read-only: every process
+            shares the pages of the file, rather than holding a copy. The model is written without
+            the data of its initializers. (The tensors of the model's inputs, outputs and layers are written
+            to by every process, so they are not shared.)
+
+        Args:
+            directory: The directory to write the bundle to (created if missing).
+        '''
+        os.makedirs(directory, exist_ok=True)
+
+        model = onnx.ModelProto()
+        model.CopyFrom(self._onnx_model)
+        for index, initializer in enumerate(model.graph.initializer):
+            np.save(os.path.join(directory, str(index)+".npy"), numpy_helper.to_array(initializer))
+            # Keep only what describes the initializer.
+            stripped = TensorProto()
+            stripped.name = initializer.name
+            stripped.data_type = initializer.data_type
+            stripped.dims.extend(initializer.dims)
+            initializer.CopyFrom(stripped)
+
+        onnx.save(model, os.path.join(directory, "model.onnx"))
+
+    @classmethod
+    def attach(cls, directory, verbose = False):
+        ''' attach: Creates an ONNX2Flex from a bundle written by publish_tensors, whose initializers are
+        read-only views of the bundle's (memory-mapped) files.
+
+        Args:
+            directory: The directory the bundle was written to.
+            verbose: a boolean flag indicating if we should output additonal debug messages.
+        '''
+        onnx2flex = cls(os.path.join(directory, "model.onnx"), verbose, infer_shapes = False)
+
+        initializers = list()
+        for index, initializer in enumerate(onnx2flex._onnx_model.graph.initializer):
+            path = os.path.join(directory, str(index)+".npy")
+            # An empty array cannot be memory-mapped.
+            mmap_mode = "r" if np.prod(initializer.dims, dtype=np.int64) > 0 else None
+            initializers.append(np.load(path, mmap_mode=mmap_mode))
+        onnx2flex._shared_initializers = initializers
+        return onnx2flex
+
     def get_input_attributes(self):
         ''' returns the attributes associated with the input of the neural network.
         '''
@@ -64,10 +120,20 @@ class ONNX2Flex:
         '''        
         np.copyto(self._tensors[name], tensor)
 
+    def get_initializers(self):
+        ''' returns the tensors of the model's initializers (i.e., its weights and other constants).
+        '''
+        return [self._tensors[initializer.name] for initializer in self._onnx_model.graph.initializer]
+
     def get_output(self):
         for outs in self._onnx_model.graph.output:
             return self._tensors[outs.name]        
 
+    def reset(self):
+        ''' reset: Restarts next_layer from the first layer (e.g., to run the model on another input).
+        '''
+        self._node_iter = 0
+
     def next_layer(self):
         if self._node_iter >= len(self._node_list):
             return None
@@ -84,8 +150,11 @@ class ONNX2Flex:
         '''
         print("Translating ONNX Model to FlexNodes:")
         model = self._onnx_model
-        for initializer in model.graph.initializer:
-            self._tensors[initializer.name] = numpy_helper.to_array(initializer)
+        for index, initializer in enumerate(model.graph.initializer):
+            if self._shared_initializers is not None:
+                self._tensors[initializer.name] = self._shared_initializers[index]
+            else:
+                self._tensors[initializer.name] = numpy_helper.to_array(initializer)
 
         for ins in model.graph.input:
             self._tensors[ins.name] = self._generate_io_tensor(ins)